@@ -1,5 +1,5 @@
 """Provides Amazon specific class for automated review scraping"""
-import time
+from typing import Optional
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
@@ -7,13 +7,23 @@ from selenium.webdriver.support import expected_conditions as EC
 from entities import Review
 from book_review_scraper import AutomatedBookReviewScraper
 from amazon_book_review_scraper import AmazonBookReviewScraper
-from utils import PAGE_SLEEP_TIME, TIME_OUT
+from page_readiness import wait_for_page_ready
+from utils import TIME_OUT
 
 
 class AmazonAutomatedBookReviewScraper(
     AutomatedBookReviewScraper, AmazonBookReviewScraper):
     """Amazon specific class for automated review scraping"""
 
+    @staticmethod
+    def _get_first_review_page_url(book_url: str) -> Optional[str]:
+        """The reviews of a book at .../dp/<asin>/ are at
+        .../product-reviews/<asin>/
+        """
+        if '/dp/' not in book_url:
+            return None
+        return book_url.replace('/dp/', '/product-reviews/', 1)
+
     @staticmethod
     def _get_to_first_review_page(driver: webdriver) -> None:
         """Clicks on see all reviews on the current book page"""
@@ -23,7 +33,8 @@ class AmazonAutomatedBookReviewScraper(
             element = WebDriverWait(driver, TIME_OUT).until(
                 EC.presence_of_element_located((By.XPATH, xpath)))
             element.click()
-            time.sleep(PAGE_SLEEP_TIME)
+            wait_for_page_ready(
+                driver, 'first_review_page', stale_element=element)
         except:
             print('Could not get to the first review page')
 
@@ -37,8 +48,14 @@ class AmazonAutomatedBookReviewScraper(
             element = element[1]
             next_label = element.get_attribute('class')
             if next_label == 'a-last':
+                # the reviews are replaced in place, so wait for the
+                # current ones to go away
+                xpath = '//div[@id="cm_cr-review_list"]/div[@data-hook="review"]'
+                reviews = driver.find_elements_by_xpath(xpath)
                 element.click()
-                time.sleep(PAGE_SLEEP_TIME)
+                wait_for_page_ready(
+                    driver, 'next_review_page',
+                    stale_element=reviews[0] if reviews else element)
                 return True
             else:
                 return False
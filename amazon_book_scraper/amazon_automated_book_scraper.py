@@ -1,5 +1,5 @@
 """Provides the class for an Amazon specific automated book scraper """
-import time
+from urllib.parse import parse_qs, urlencode, urlparse, urlunparse
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
@@ -8,7 +8,11 @@ from amazon_book_attribute_scraper import AmazonBookAttributeScraper
 from amazon_automated_book_review_scraper import AmazonAutomatedBookReviewScraper
 from raw_data_storage import RawDataStorage
 from rds_data_storage import RDSDataStorage
-from utils import PAGE_SLEEP_TIME, TIME_OUT
+from scrape_journal import ScrapeJournal
+from listing_frontier import ListingFrontier
+from tracing import BookProfiler, Tracer
+from page_readiness import wait_for_page_ready
+from utils import TIME_OUT
 
 class AmazonAutomatedBookScraper(AutomatedBookScraper):
     """The Amazon specific class for automating the book scraping process.
@@ -21,7 +25,12 @@ class AmazonAutomatedBookScraper(AutomatedBookScraper):
             rds_data_storage: RDSDataStorage = None,
             browser: str = 'chrome',
             mode: str = 'normal',
-            export_metric = False) -> None:
+            export_metric = False,
+            num_workers: int = 1,
+            journal: ScrapeJournal = None,
+            frontier: ListingFrontier = None,
+            tracer: Tracer = None,
+            profiler: BookProfiler = None) -> None:
         super().__init__(url, 
                 book_attribute_scraper,
                 automated_book_review_scraper,
@@ -29,7 +38,12 @@ class AmazonAutomatedBookScraper(AutomatedBookScraper):
                 rds_data_storage,
                 browser=browser,
                 mode=mode,
-                export_metric=export_metric)
+                export_metric=export_metric,
+                num_workers=num_workers,
+                journal=journal,
+                frontier=frontier,
+                tracer=tracer,
+                profiler=profiler)
         self._sort_by_reviews()
 
     def _get_book_urls_from_page(self):
@@ -70,9 +84,28 @@ class AmazonAutomatedBookScraper(AutomatedBookScraper):
             return False
         else:
             last_element.click()
-            time.sleep(PAGE_SLEEP_TIME)
+            wait_for_page_ready(
+                self._driver, 'listing_page', stale_element=pagination_strip)
             return True
 
+    def _get_listing_key(self):
+        """The listing is sorted by the number of reviews"""
+        return f'{self._url}#sort=reviews'
+
+    def _go_to_page(self, page):
+        """Goes directly to the given page with the page url parameter"""
+        parts = urlparse(self._driver.current_url)
+        query = parse_qs(parts.query)
+        query['page'] = [str(page)]
+        url = urlunparse(parts._replace(query=urlencode(query, doseq=True)))
+        try:
+            self._driver.get(url)
+        except:
+            print(f'Could not go to listing page {page}')
+            return False
+        wait_for_page_ready(self._driver, 'listing_page')
+        return True
+
     def _sort_by_reviews(self) -> None:
         """Sort the books by the number of reviews
         TODO: recieve the sort criterion as argument
@@ -98,7 +131,8 @@ class AmazonAutomatedBookScraper(AutomatedBookScraper):
             sort_criteria = temp_tag.find_elements_by_xpath('./ul/li')
             xpath = './a'
             sort_criteria[-1].find_element_by_xpath(xpath).click()
-            time.sleep(PAGE_SLEEP_TIME)
+            wait_for_page_ready(
+                self._driver, 'sorted_listing_page', stale_element=temp_tag)
         except:
             print('Failed to click on the sort option')
 
@@ -1,31 +1,39 @@
 """Provides the Amazon specific class for scraping book attributes."""
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from book_attribute_scraper import BookAttributeScraper
-from utils import TIME_OUT
+from page_cache import PageCache
+from page_fetcher import PageFetcher
+from snapshot_archive import SnapshotArchive
+from utils import wait_until
 
 class AmazonBookAttributeScraper(BookAttributeScraper):
     """The Amazon specific book attribute scraper."""
-    def __init__(self, banned_titles: list[str] = None) -> None:
-        super().__init__(banned_titles)
+    def __init__(
+            self, banned_titles: list[str] = None,
+            page_fetcher: PageFetcher = None,
+            snapshot: bool = False,
+            page_cache: PageCache = None,
+            archive: SnapshotArchive = None) -> None:
+        super().__init__(
+            banned_titles, page_fetcher=page_fetcher, snapshot=snapshot,
+            page_cache=page_cache, archive=archive)
 
     def _extract_isbn_attribute(self, driver):
         if not self.book_elements:
             raise Exception('This scraper in not initialized')
         
         isbn = None
-        for element in self.book_elements:
-            items = element.find_elements_by_xpath('./span/span')
-            if 'ISBN-13' in items[0].text:
-                isbn = items[0].text[:-2] + '-' + items[1].text
+        for label, value in self.book_details:
+            if 'ISBN-13' in label:
+                isbn = label[:-2] + '-' + value
         return isbn
 
     def _extract_title_attribute(self, driver):
         xpath = '//span[@id="productTitle"]'
         # element = driver.find_element_by_xpath(xpath)
-        element = WebDriverWait(driver, TIME_OUT).until(
-            EC.presence_of_element_located((By.XPATH, xpath)))
+        element = wait_until(
+            driver, EC.presence_of_element_located((By.XPATH, xpath)))
         return element.text
 
     def _extract_language_attribute(self, driver):
@@ -33,10 +41,9 @@ class AmazonBookAttributeScraper(BookAttributeScraper):
             raise Exception('This scraper in not initialized')
 
         language = None
-        for element in self.book_elements:
-            items = element.find_elements_by_xpath('./span/span')
-            if "Language" in items[0].text:
-                language = items[1].text
+        for label, value in self.book_details:
+            if "Language" in label:
+                language = value
         return language
 
     def _extract_author_attribute(self, driver):
@@ -64,10 +71,9 @@ class AmazonBookAttributeScraper(BookAttributeScraper):
             raise Exception('This scraper in not initialized')
         
         date = None
-        for element in self.book_elements:
-            items = element.find_elements_by_xpath('./span/span')
-            if "Publisher" in items[0].text:
-                date_string = items[1].text
+        for label, value in self.book_details:
+            if "Publisher" in label:
+                date_string = value
                 # expects the date feature encolsed in 
                 # paranthesis towards right
                 if date_string[-1] != ")":
@@ -89,11 +95,9 @@ class AmazonBookAttributeScraper(BookAttributeScraper):
         if not self.book_elements:
             raise Exception('This scraper in not initialized')
         pages = None
-        for element in self.book_elements:
-            items = element.find_elements_by_xpath('./span/span')
-            if "pages" in items[1].text:
-                pages_string = items[1].text
-                pages = int(pages_string.split(" ")[0])
+        for label, value in self.book_details:
+            if "pages" in value:
+                pages = int(value.split(" ")[0])
         return pages
         
     def _extract_price_attribute(self, driver):
@@ -189,9 +193,16 @@ class AmazonBookAttributeScraper(BookAttributeScraper):
         try:
             xpath = '//div[@id="detailBullets_feature_div"]/ul/li'
             self.book_elements = driver.find_elements_by_xpath(xpath)
-            return True
         except:
             return False
+        # read the (label, value) text of each detail bullet once, so that
+        # the extractors do not query the webdriver again
+        self.book_details = []
+        for element in self.book_elements:
+            items = element.find_elements_by_xpath('./span/span')
+            if len(items) >= 2:
+                self.book_details.append((items[0].text, items[1].text))
+        return True
 
     def _get_product_elements(self, driver):
         """Gets some product feature elements from the current webpage:
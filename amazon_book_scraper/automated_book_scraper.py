@@ -1,16 +1,25 @@
 """Provides the class for an automated book scraper """
 from abc import ABC, abstractmethod
-import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+import copy
+import queue
+import threading
+from typing import Optional
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options as ChromeOptions
 from selenium.webdriver.firefox.options import Options as FirefoxOptions
-from prometheus_client import Gauge
 from entities import Book
 from book_attribute_scraper import BookAttributeScraper
 from book_review_scraper import AutomatedBookReviewScraper
 from raw_data_storage import RawDataStorage
 from rds_data_storage import RDSDataStorage
-from utils import PAGE_SLEEP_TIME, TIME_OUT
+from page_readiness import navigation_wait_times, wait_for_page_ready
+from scrape_journal import ScrapeJournal
+from listing_frontier import ListingFrontier
+from metrics import enable_metrics, get_metrics
+from tracing import BookProfiler, Tracer
+from utils import TIME_OUT, URL_QUEUE_SIZE
 
 class AutomatedBookScraper(ABC):
     """Automates the book scraping process. Ensures that the total number
@@ -26,7 +35,13 @@ class AutomatedBookScraper(ABC):
             rds_data_storage: RDSDataStorage = None,
             browser: str = 'chrome',
             mode: str = 'normal',
-            export_metric = False) -> None:
+            export_metric = False,
+            num_workers: int = 1,
+            pipelined: bool = False,
+            journal: ScrapeJournal = None,
+            frontier: ListingFrontier = None,
+            tracer: Tracer = None,
+            profiler: BookProfiler = None) -> None:
         """
         Args:
             url (str): starting url for the book sraper
@@ -37,7 +52,22 @@ class AutomatedBookScraper(ABC):
             rds_data_storage (RDSDataStorage, optional): RDS interface object
             browser (str, optional): select the browser.
             mode (str, optional): normal or headless mode
-            export_metric (bool): enables exporting prometheus metrics
+            export_metric (bool): enables exporting prometheus metrics of
+            all the pipeline stages (see metrics.py)
+            num_workers (int, optional): number of books scraped in
+            parallel. Each worker runs its own webdriver.
+            pipelined (bool, optional): scrape the books while the listing
+            pages are still being walked. This is always the case with
+            more than one worker. With a single worker it costs an extra
+            webdriver.
+            journal (ScrapeJournal, optional): journal of the scraping
+            progress. It answers the resume queries instead of the storages
+            and a restart continues with the urls discovered before.
+            frontier (ListingFrontier, optional): record of the walked
+            listing pages. The recently seen pages are not walked again.
+            tracer (Tracer, optional): records a span per book with child
+            spans of its stages
+            profiler (BookProfiler, optional): profiles the first books
         """
         if not isinstance(book_attribute_scraper, BookAttributeScraper):
             raise TypeError('Invalid type')
@@ -47,47 +77,54 @@ class AutomatedBookScraper(ABC):
             raise TypeError('Invalid type')
         if rds_data_storage and not isinstance(rds_data_storage, RDSDataStorage):
             raise TypeError('Invalid type')
+        if journal and not isinstance(journal, ScrapeJournal):
+            raise TypeError('Invalid type')
+        if frontier and not isinstance(frontier, ListingFrontier):
+            raise TypeError('Invalid type')
+        if tracer and not isinstance(tracer, Tracer):
+            raise TypeError('Invalid type')
+        if profiler and not isinstance(profiler, BookProfiler):
+            raise TypeError('Invalid type')
+        if num_workers < 1:
+            raise ValueError('Requires at least one worker.')
 
         self._book_attribute_scraper = book_attribute_scraper
         self._automated_book_review_scraper = automated_book_review_scraper
         self._raw_data_storage = raw_data_storage
         self._rds_data_storage = rds_data_storage
+        self._journal = journal
+        self._frontier = frontier
+        self._tracer = tracer
+        self._profiler = profiler
+        self._url = url
+        self._browser = browser
+        self._mode = mode
+        self._num_workers = num_workers
+        self._pipelined = pipelined or num_workers > 1
+        # guards the bookkeeping of the workers (scraped books, remaining
+        # count)
+        self._lock = threading.Lock()
 
-        # inits counter metric for prometheus
+        # the metrics are no-op unless they are exported
         if export_metric:
-            self.g = Gauge('books_to_scrape',
-                'The number of books to scrape in the current session.')
+            enable_metrics()
+        self._metrics = get_metrics()
 
         # init Selenium 
         try:
-            if browser == 'chrome':
-                chrome_options = ChromeOptions()
-                if mode == 'headless':
-                    chrome_options.add_argument("--headless")
-                chrome_options.add_argument('--no-sandbox')
-                chrome_options.add_argument('--disable-dev-shm-usage')
-                self._driver = webdriver.Chrome(options=chrome_options)
-                # self._driver.implicitly_wait(10)
-            elif browser == 'firefox':
-                firfox_options = FirefoxOptions()
-                if mode == 'headless':
-                    firfox_options.add_argument("--headless")
-                firfox_options.add_argument('--no-sandbox')
-                firfox_options.add_argument('--disable-dev-shm-usage')
-                self._driver = webdriver.Firefox(options=firfox_options)
-                # self._driver.implicitly_wait(10)
-            else:
-                raise NotImplementedError(
-                    'Only Chrome and Firefox are supported.')
+            self._driver = self._create_driver()
         except Exception as e:
             print('Selenium driver error: ', e)
 
+        # the wait times are reported per scrape_books, starting with the
+        # start page
+        navigation_wait_times.reset()
         # get to the url
         try:
             self._driver.get(url)
         except:
             print('Invalid url')
-        time.sleep(PAGE_SLEEP_TIME)
+        wait_for_page_ready(self._driver, 'start_page')
 
     def scrape_books(self, num_books: int, num_reviews: int = 10) -> list[Book]:
         """The main method for scraping books. It can be rerun with the same
@@ -101,7 +138,9 @@ class AutomatedBookScraper(ABC):
         Returns:
             list[Book]: _description_
         """
-        scraped_books = []
+        if self._journal:
+            self._replay_journal()
+
         # get all the scraped book urls that satisfies the current
         # requirements on num_review
         saved_ulrs = self._get_saved_urls(num_reviews=num_reviews)
@@ -116,13 +155,46 @@ class AutomatedBookScraper(ABC):
             num_books_to_scrape = 0
 
         # set the prometheus guage
-        if self.g:
-            self.g.set(num_books_to_scrape)
+        self._metrics.books_to_scrape.set(num_books_to_scrape)
 
         # get all saved book isbn numbers even if it does not match the
         # current num_review requirement
         saved_isbns = self._get_saved_isbns()
 
+        self._num_remaining = num_books_to_scrape
+        try:
+            with self._span('scrape_books', num_books=num_books_to_scrape):
+                if self._pipelined:
+                    # the workers scrape the books while the listing pages
+                    # are walked
+                    scraped_books = self._scrape_books_in_pipeline(
+                        num_books_to_scrape, saved_ulrs, num_reviews,
+                        saved_isbns)
+                else:
+                    scraped_books = self._scrape_books_in_sequence(
+                        num_books_to_scrape, saved_ulrs, num_reviews,
+                        saved_isbns)
+        finally:
+            # wait for the writes still pending in the storages
+            self._raw_data_storage.flush()
+            if self._rds_data_storage:
+                self._rds_data_storage.flush()
+            # everything journaled so far is saved
+            if self._journal:
+                self._journal.checkpoint()
+            # dump the profile if fewer books were scraped
+            if self._profiler:
+                self._profiler.close()
+            self._report_wait_times()
+
+        return scraped_books
+
+    def _scrape_books_in_sequence(
+            self, num_books_to_scrape, saved_ulrs, num_reviews,
+            saved_isbns) -> list[Book]:
+        """Collects the urls from the listing pages, then scrapes the books
+        one by one with the main webdriver."""
+        scraped_books = []
         # get all the urls that needs to be scraped that includes the one that
         # have already been scraped but do not satisfy the current num_review
         # requirement.
@@ -130,83 +202,363 @@ class AutomatedBookScraper(ABC):
                 num_books_to_scrape, saved_ulrs)
 
         # scrape all new book/reviews
-        for i, book_url in enumerate(urls_to_scrape):
-            # get the book attribute for the url
-            # driver need not point to the page
-            # side-effect: webdriver points to the book page
-            book_attribute = \
-                self._book_attribute_scraper.scrape_book_attributes_from_page(
-                        url=book_url, driver=self._driver)
-            # skip this book if it is invalid
-            if book_attribute is None:
-                # decrement the guage
-                self.g.dec()
+        self._num_remaining = len(urls_to_scrape)
+        self._metrics.books_to_scrape.set(len(urls_to_scrape))
+        for book_url in urls_to_scrape:
+            scraped_book = self._scrape_book(
+                book_url, num_reviews, saved_isbns, self._driver,
+                self._book_attribute_scraper,
+                self._automated_book_review_scraper)
+            if scraped_book:
+                scraped_books.append(scraped_book)
+
+        return scraped_books
+
+    def _scrape_books_in_pipeline(
+            self, num_books_to_scrape, saved_ulrs, num_reviews,
+            saved_isbns) -> list[Book]:
+        """Scrapes the books with a pool of workers while the listing pages
+        are walked. The urls are passed to the workers through a bounded
+        queue, so the listing stays only a few pages ahead of the workers.
+        Each worker has its own webdriver.
+        """
+        url_queue = queue.Queue(maxsize=URL_QUEUE_SIZE)
+        scraped_books = []
+        with ThreadPoolExecutor(max_workers=self._num_workers) as executor:
+            futures = [executor.submit(
+                        self._run_worker, url_queue, num_reviews,
+                        saved_isbns, scraped_books)
+                       for _ in range(self._num_workers)]
+            try:
+                num_urls = 0
+                for book_url in self._iter_urls_to_scrape(
+                        num_books_to_scrape, saved_ulrs):
+                    if not self._put_url(url_queue, book_url, futures):
+                        break
+                    num_urls += 1
+                else:
+                    # the listing may have ended before num_books_to_scrape
+                    # urls
+                    self._remove_unlisted_books(num_books_to_scrape - num_urls)
+            finally:
+                # tell the workers that there are no more urls
+                for _ in futures:
+                    self._put_url(url_queue, None, futures)
+        # raise any worker error
+        for future in futures:
+            future.result()
+        return scraped_books
+
+    @staticmethod
+    def _put_url(url_queue, book_url, futures) -> bool:
+        """Puts the url on the queue, waiting while the queue is full.
+        Returns False if all the workers have stopped."""
+        while not all(future.done() for future in futures):
+            try:
+                url_queue.put(book_url, timeout=1)
+                return True
+            except queue.Full:
                 continue
-            # get any saved reviews for this book
-            saved_reviews = self._get_saved_reviews(book_attribute.isbn)
-            # get the book review for this book
-            # driver needs to point to the page
-            book_reviews = self._automated_book_review_scraper.scrape_book_reviews(
-                    book_attribute.isbn, num=num_reviews, driver=self._driver,
-                    skip_users=saved_reviews)
-            # prepare the book object
-            scraped_book = Book(attributes=book_attribute, reviews=book_reviews)
-            # save the book in the chosen raw data storage (local or S3 bucket)
+        return False
+
+    def _run_worker(self, url_queue, num_reviews, saved_isbns, scraped_books):
+        """Scrapes books from the queue until it gets None"""
+        driver = self._create_driver()
+        # the scrapers keep the state of the current page, so each worker
+        # gets its own copy
+        book_attribute_scraper = copy.copy(self._book_attribute_scraper)
+        automated_book_review_scraper = copy.copy(
+            self._automated_book_review_scraper)
+        try:
+            while True:
+                book_url = url_queue.get()
+                if book_url is None:
+                    break
+                scraped_book = self._scrape_book(
+                    book_url, num_reviews, saved_isbns, driver,
+                    book_attribute_scraper, automated_book_review_scraper)
+                if scraped_book:
+                    with self._lock:
+                        scraped_books.append(scraped_book)
+        finally:
+            driver.quit()
+
+    def _scrape_book(
+            self, book_url: str, num_reviews: int, saved_isbns: list[str],
+            driver: webdriver,
+            book_attribute_scraper: BookAttributeScraper,
+            automated_book_review_scraper: AutomatedBookReviewScraper
+            ) -> Optional[Book]:
+        """Scrapes a single book and its reviews and saves it. The book is
+        traced in a span and profiled if the tracer and profiler are set."""
+        with self._span('book', url=book_url) as span:
+            args = (book_url, num_reviews, saved_isbns, driver,
+                    book_attribute_scraper, automated_book_review_scraper,
+                    span)
+            if self._profiler:
+                return self._profiler.run(self._scrape_and_save_book, *args)
+            return self._scrape_and_save_book(*args)
+
+    def _scrape_and_save_book(
+            self, book_url, num_reviews, saved_isbns, driver,
+            book_attribute_scraper, automated_book_review_scraper,
+            span) -> Optional[Book]:
+        """Scrapes a single book and its reviews and saves it"""
+        # get the book attribute for the url
+        # driver need not point to the page
+        # side-effect: webdriver points to the book page unless it was
+        # fetched without the webdriver
+        with self._span('scrape_book_attributes_from_page'):
+            book_attribute = \
+                book_attribute_scraper.scrape_book_attributes_from_page(
+                        url=book_url, driver=driver)
+        # skip this book if it is invalid
+        if book_attribute is None:
+            span['skipped'] = True
+            self._metrics.books_skipped.inc()
+            if self._journal:
+                self._journal.book_skipped(
+                    book_url, book_attribute_scraper.skip_reason)
+            self._book_done()
+            return None
+        span['isbn'] = book_attribute.isbn
+        # get any saved reviews for this book
+        saved_reviews = self._get_saved_reviews(book_attribute.isbn)
+        # get the book review for this book
+        # driver needs to point to the page, otherwise it is navigated
+        # to the reviews with the book url
+        if book_attribute_scraper.page_loaded_in_driver:
+            review_url = None
+        else:
+            review_url = book_url
+        with self._span('scrape_book_reviews') as reviews_span:
+            book_reviews = automated_book_review_scraper.scrape_book_reviews(
+                    book_attribute.isbn, num=num_reviews, driver=driver,
+                    url=review_url, skip_users=saved_reviews)
+            reviews_span['num_reviews'] = len(book_reviews)
+        # prepare the book object
+        scraped_book = Book(attributes=book_attribute, reviews=book_reviews)
+        # the storages and the journal are thread-safe, so the workers
+        # write in parallel
+        # save the book in the chosen raw data storage (local or S3 bucket)
+        with self._span('save_book'):
             self._raw_data_storage.save_book(scraped_book, saved_isbns)
-            # save the book in the RDS system if required
-            if self._rds_data_storage:
+        # save the book in the RDS system if required
+        if self._rds_data_storage:
+            with self._span('rds_save_book'):
                 self._rds_data_storage.save_book(scraped_book, saved_isbns)
-            # save the image in the raw data storage
-            image_url = scraped_book.attributes.image_url
-            book_isbn = scraped_book.attributes.isbn
-            self._raw_data_storage.save_book_image(image_url, book_isbn)
-            scraped_books.append(scraped_book)
+        book_isbn = scraped_book.attributes.isbn
+        image_url = scraped_book.attributes.image_url
+        if self._journal:
+            self._journal.book_saved(
+                book_url, book_isbn, [review.user for review in book_reviews],
+                image_url)
+        # queue the image download in the raw data storage, the download
+        # time is recorded by the image_download_seconds metric
+        with self._span('queue_book_image'):
+            self._save_book_image(book_url, book_isbn, image_url)
+        self._book_done()
+        return scraped_book
+
+    def _save_book_image(self, book_url, isbn, image_url):
+        """Saves the image in the background. The journal records it once
+        it is saved."""
+        on_saved = None
+        if self._journal:
+            def on_saved():
+                self._journal.image_saved(book_url, isbn)
+        self._raw_data_storage.save_book_image(
+            image_url, isbn, on_saved=on_saved)
+
+    def _span(self, name, **args):
+        """Records the block as a span if there is a tracer"""
+        if self._tracer:
+            return self._tracer.span(name, **args)
+        return nullcontext(args)
+
+    def _remove_unlisted_books(self, num_books):
+        """Removes the books that were not listed from the remaining count"""
+        if num_books <= 0:
+            return
+        with self._lock:
+            self._metrics.books_to_scrape.dec(num_books)
+            self._num_remaining -= num_books
+
+    def _book_done(self):
+        """Updates the number of remaining books after a url is processed"""
+        with self._lock:
             # decrement the guage
-            self.g.dec()
-            print(f"{len(urls_to_scrape)- i - 1} remaining books")
+            self._metrics.books_to_scrape.dec()
+            self._num_remaining -= 1
+            print(f"{self._num_remaining} remaining books")
 
-        return scraped_books
+    @staticmethod
+    def _report_wait_times():
+        """Prints how long each type of navigation waited for the page since
+        the last report, so a rerun of scrape_books reports its own waits"""
+        summary = navigation_wait_times.summary()
+        navigation_wait_times.reset()
+        for navigation, wait_times in sorted(summary.items()):
+            print(f"{navigation}: {wait_times['count']} waits, "
+                  f"mean {wait_times['mean']:.2f}s, "
+                  f"max {wait_times['max']:.2f}s")
+
+    def _create_driver(self) -> webdriver:
+        """Creates a webdriver for the selected browser and mode"""
+        if self._browser == 'chrome':
+            chrome_options = ChromeOptions()
+            if self._mode == 'headless':
+                chrome_options.add_argument("--headless")
+            chrome_options.add_argument('--no-sandbox')
+            chrome_options.add_argument('--disable-dev-shm-usage')
+            driver = webdriver.Chrome(options=chrome_options)
+            # driver.implicitly_wait(10)
+        elif self._browser == 'firefox':
+            firfox_options = FirefoxOptions()
+            if self._mode == 'headless':
+                firfox_options.add_argument("--headless")
+            firfox_options.add_argument('--no-sandbox')
+            firfox_options.add_argument('--disable-dev-shm-usage')
+            driver = webdriver.Firefox(options=firfox_options)
+            # driver.implicitly_wait(10)
+        else:
+            raise NotImplementedError(
+                'Only Chrome and Firefox are supported.')
+        return driver
 
     def _get_urls_to_scrape(self, num_books, saved_ulrs):
+        return list(self._iter_urls_to_scrape(num_books, saved_ulrs))
+
+    def _iter_urls_to_scrape(self, num_books, saved_ulrs):
+        """Yields up to num_books unsaved book urls. The next listing page
+        is only visited once the urls of the current one are consumed."""
+        saved_ulrs = set(saved_ulrs)
+        # the books that can not be scraped are not tried again
+        if self._journal:
+            saved_ulrs.update(self._journal.get_skipped_urls())
+        num_urls = 0
+        if num_books <= 0:
+            return
+        for url_list in self._iter_listed_urls():
+            url_list = self._remove_saved_urls(url_list, saved_ulrs)
+            for book_url in url_list:
+                # a url can be both pending and listed
+                saved_ulrs.add(book_url)
+                num_urls += 1
+                yield book_url
+                # return only a maximum of num_books urls
+                if num_urls >= num_books:
+                    return
+
+    def _iter_listed_urls(self):
+        """Yields the book urls page by page: first the ones discovered
+        before a restart (journal), then the ones of the recently seen
+        listing pages (frontier) and then the ones on the listing pages
+        walked from the first page not seen recently"""
+        if self._journal:
+            yield self._journal.get_pending_urls()
+        page = 1
+        if self._frontier:
+            listing = self._get_listing_key()
+            while True:
+                recorded_page = self._frontier.get_page(listing, page)
+                if recorded_page is None:
+                    break
+                url_list, is_last = recorded_page
+                yield url_list
+                if is_last:
+                    return
+                page += 1
+            # jump to the page, or walk again from the first page if the
+            # listing does not support it
+            if page > 1 and not self._go_to_page(page):
+                page = 1
         # get book urls form the first page
         url_list = self._get_book_urls_from_page()
-        url_list = self._remove_saved_urls(url_list, saved_ulrs)
-        # navigate pages sequentially and get book urls
-        while len(url_list) < num_books and self._go_to_next_page_if_exists():
-            urls_curr_page = self._get_book_urls_from_page()
-            urls_curr_page = self._remove_saved_urls(
-                urls_curr_page, saved_ulrs)
-            url_list.extend(urls_curr_page)
-            
-        # return only a maximum of num_books urls
-        if len(url_list) > num_books:
-            return url_list[:num_books]
-        else:
-            return url_list
+        while True:
+            if self._journal:
+                self._journal.add_discovered(url_list)
+            if self._frontier:
+                self._frontier.record_page(
+                    listing, page, url_list, is_last=False)
+            yield url_list
+            # navigate pages sequentially and get book urls
+            if not self._go_to_next_page_if_exists():
+                if self._frontier:
+                    self._frontier.mark_last_page(listing, page)
+                return
+            page += 1
+            url_list = self._get_book_urls_from_page()
+
+    def _get_listing_key(self) -> str:
+        """Gets the key of the listing (e.g. category and sort order) the
+        frontier records the pages for"""
+        return self._url
+
+    def _go_to_page(self, page: int) -> bool:
+        """Goes directly to the given listing page. Returns False if it is
+        not supported."""
+        return False
 
     @staticmethod
     def _remove_saved_urls(urls, saved_ulrs):
         return [item for item in urls if item not in saved_ulrs]
 
+    def _replay_journal(self):
+        """Seeds the journal from the storage on the first run. Otherwise
+        checks the books journaled after the last checkpoint (e.g. before a
+        crash) against the storage, as their writes may have been lost, and
+        saves the images that were not saved before the restart."""
+        if self._journal.is_empty():
+            if self._rds_data_storage:
+                books = self._rds_data_storage.get_saved_books()
+            else:
+                books = self._raw_data_storage.get_saved_books()
+            self._journal.seed(books)
+            return
+        unconfirmed_books = self._journal.get_unconfirmed_books()
+        if unconfirmed_books:
+            saved_isbns = set(self._get_saved_isbns(use_journal=False))
+            for book_url, isbn in unconfirmed_books:
+                if isbn in saved_isbns:
+                    users = self._get_saved_reviews(isbn, use_journal=False)
+                else:
+                    users = None
+                self._journal.confirm_book(book_url, isbn, users)
+            self._journal.checkpoint()
+        # the books scraped again get their image then
+        for book_url, isbn, image_url in \
+                self._journal.get_books_without_image():
+            try:
+                self._save_book_image(book_url, isbn, image_url)
+            except Exception as e:
+                print(f'Could not save the image of {isbn}: {e}')
+
     def _get_saved_urls(self, num_reviews):
         """Retireve the list of scraped urls from storage that does not 
         already satisfy the num_reviews requirement"""
+        if self._journal:
+            return self._journal.get_saved_book_urls(num_reviews)
         if self._rds_data_storage:
             saved_urls = self._rds_data_storage.get_saved_book_urls(num_reviews)
         else:
             saved_urls = self._raw_data_storage.get_saved_book_urls(num_reviews)
         return saved_urls
 
-    def _get_saved_reviews(self, isbn):
+    def _get_saved_reviews(self, isbn, use_journal=True):
         """Retrieves the list of saved reviews for the given book (isbn)"""
+        if self._journal and use_journal:
+            return self._journal.get_saved_review_users(isbn)
         if self._rds_data_storage:
             users = self._rds_data_storage.get_saved_review_users(isbn)
         else:
             users = self._raw_data_storage.get_saved_review_users(isbn)
         return users
 
-    def _get_saved_isbns(self):
+    def _get_saved_isbns(self, use_journal=True):
         """Retrieves the list of saved book isbn number"""
+        if self._journal and use_journal:
+            return self._journal.get_saved_book_isbns()
         if self._rds_data_storage:
             isbns = self._rds_data_storage.get_saved_book_isbns()
         else:
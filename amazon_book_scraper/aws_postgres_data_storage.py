@@ -1,35 +1,99 @@
 """Provides the implementation of the AWS Postgres RDS data storage class"""
 from os.path import join
 from dataclasses import asdict
+import csv
+import io
 import json
-import pandas as pd
-from sqlalchemy import create_engine, inspect, text
+import threading
+import time
+from sqlalchemy import BigInteger, Column, Float, Index, MetaData, Table, Text
+from sqlalchemy import bindparam, create_engine, func, select
+from sqlalchemy.engine import make_url
 from entities import Book, BookAttribute, Review
+from metrics import get_metrics
 from rds_data_storage import RDSDataStorage
 
+# the csv representation of NULL for COPY
+NULL = '\\N'
+# max number of isbns in a DELETE statement
+DELETE_BATCH_SIZE = 500
+
 
 class AWSPostgresRDSDataStorage(RDSDataStorage):
     """This class provides methods for storing and retrieving scraped book
     data on an ASW Postgres RDS. The object can be passed into the 
-    main scraper object"""
+    main scraper object.
+
+    The tables and their indexes are created if they do not exist, so the
+    resume queries run as indexed SQL queries in the database.
+
+    The rows are buffered across books and written in bulk (COPY on
+    Postgres) when the buffer is full or old enough. Saved attributes of a
+    book replace the ones already in the table (e.g. when the attributes are
+    saved again by replay.py --overwrite-attributes). The buffer is not
+    locked during a write, so saving books does not wait for the database.
+    Rows that could not be written stay in the buffer. flush() writes the
+    buffer and close() must be called when done.
 
-    def __init__(self, rds_config: dict) -> None:
+    The connections come from a sized pool and are checked (pre-ping)
+    before use. The queries are built once, so their compiled form is
+    reused from the statement cache.
+    """
+
+    def __init__(
+            self, rds_config: dict, buffer_size: int = 1000,
+            flush_interval: float = 60, pool_size: int = 5,
+            max_overflow: int = 5, pool_recycle: int = 1800) -> None:
         """
         Args:
-            rds_config (dict): RDS configs
+            rds_config (dict): RDS configs. Either the database URL ('URL',
+            e.g. for a local Postgres or SQLite stand-in) or its parts
+            ('DATABASE_TYPE', 'DBAPI', 'ENDPOINT', 'USER', 'PASSWORD',
+            'PORT', 'DATABASE').
+            buffer_size (int, optional): number of buffered rows that
+            triggers a write
+            flush_interval (float, optional): max seconds the rows are kept
+            in the buffer
+            pool_size (int, optional): number of pooled connections
+            max_overflow (int, optional): number of extra connections opened
+            when all the pooled ones are in use
+            pool_recycle (int, optional): max age of a connection in seconds
         """
-        DATABASE_TYPE = rds_config['DATABASE_TYPE']
-        DBAPI = rds_config['DBAPI']
-        ENDPOINT = rds_config['ENDPOINT']
-        USER = rds_config['USER']
-        PASSWORD = rds_config['PASSWORD']
-        PORT = rds_config['PORT']
-        DATABASE = rds_config['DATABASE']
-        self._rds_engine = create_engine(
-            f"{DATABASE_TYPE}+{DBAPI}://{USER}:{PASSWORD}@{ENDPOINT}:{PORT}/{DATABASE}")
-        self._rds_engine.connect()
+        if 'URL' in rds_config:
+            url = rds_config['URL']
+        else:
+            DATABASE_TYPE = rds_config['DATABASE_TYPE']
+            DBAPI = rds_config['DBAPI']
+            ENDPOINT = rds_config['ENDPOINT']
+            USER = rds_config['USER']
+            PASSWORD = rds_config['PASSWORD']
+            PORT = rds_config['PORT']
+            DATABASE = rds_config['DATABASE']
+            url = f"{DATABASE_TYPE}+{DBAPI}://{USER}:{PASSWORD}@{ENDPOINT}:{PORT}/{DATABASE}"
+        # the compiled statements are cached by the engine (500 by default)
+        engine_options = {'pool_pre_ping': True}
+        # SQLite stand-ins do not use a sized connection pool
+        if make_url(url).get_backend_name() != 'sqlite':
+            engine_options.update({'pool_size': pool_size,
+                                   'max_overflow': max_overflow,
+                                   'pool_recycle': pool_recycle})
+        self._rds_engine = create_engine(url, **engine_options)
         self._rds_attribute_table = 'book_attributes'
         self._rds_review_table = 'book_reviews'
+        self._create_tables()
+        self._prepare_queries()
+        self._buffer_size = buffer_size
+        self._flush_interval = flush_interval
+        # guards the buffers, it is not held while writing to the database
+        self._lock = threading.Lock()
+        # serializes the writes
+        self._flush_lock = threading.Lock()
+        self._attribute_rows = []
+        self._review_rows = []
+        # the rows being written, still visible to the resume queries
+        self._writing_attribute_rows = []
+        self._writing_review_rows = []
+        self._last_flush = time.monotonic()
 
     def save_book(self, book: Book, saved_isbns: str) -> None:
         """Saves a book object in an S3 bucket
@@ -42,6 +106,60 @@ class AWSPostgresRDSDataStorage(RDSDataStorage):
         if book.attributes.isbn not in saved_isbns:
             self._save_book_attributes(book.attributes)
         self._save_reviews(book.reviews)
+        if (len(self._attribute_rows) + len(self._review_rows) >=
+                self._buffer_size or
+                time.monotonic() - self._last_flush >= self._flush_interval):
+            try:
+                # a write already in progress takes the rows next time
+                self._flush(wait=False)
+            except Exception as e:
+                print(f"Could not save the buffered rows in RDS, retrying "
+                      f"with the next write: {e}")
+
+    def flush(self) -> None:
+        """Writes all the buffered rows in a single transaction. If the write
+        fails the rows are kept in the buffer and the error is raised."""
+        self._flush(wait=True)
+
+    def _flush(self, wait):
+        if not self._flush_lock.acquire(blocking=wait):
+            return
+        try:
+            with self._lock:
+                attribute_rows = self._attribute_rows
+                review_rows = self._review_rows
+                self._attribute_rows = []
+                self._review_rows = []
+                self._writing_attribute_rows = attribute_rows
+                self._writing_review_rows = review_rows
+                self._last_flush = time.monotonic()
+            if not attribute_rows and not review_rows:
+                return
+            try:
+                with get_metrics().rds_write_seconds.time(), \
+                        self._rds_engine.begin() as connection:
+                    self._replace_attribute_rows(connection, attribute_rows)
+                    self._insert_rows(
+                        connection, self._review_table, review_rows)
+            except Exception:
+                # put the rows back in front of the ones buffered meanwhile
+                with self._lock:
+                    self._attribute_rows[:0] = attribute_rows
+                    self._review_rows[:0] = review_rows
+                raise
+            finally:
+                with self._lock:
+                    self._writing_attribute_rows = []
+                    self._writing_review_rows = []
+        finally:
+            self._flush_lock.release()
+
+    def close(self) -> None:
+        """Writes the buffered rows and closes the connections"""
+        try:
+            self.flush()
+        finally:
+            self._rds_engine.dispose()
 
     def get_saved_book_urls(self, num_reviews: int) -> list[str]:
         """Get all the saved book urls. It does not return books with
@@ -53,35 +171,20 @@ class AWSPostgresRDSDataStorage(RDSDataStorage):
         Returns:
             list[str]: list of saved book urls
         """
-        # check is the review table exists
-        insp = inspect(self._rds_engine)
-        if not insp.has_table(self._rds_review_table):
-            return []
-        # if it exists get the urls with review >= num_review
-        # TODO: a proper sql query
-        review_table = pd.read_sql_table(
-            self._rds_review_table, self._rds_engine)
-        isbn_count = review_table['isbn'] .value_counts()
-        isbns = isbn_count.index[isbn_count >= num_reviews]
-
-        # TODO: a proper sql query
-        attribute_table = pd.read_sql_table(
-            self._rds_attribute_table, self._rds_engine).set_index('isbn')
-        saved_urls = attribute_table['book_url'][isbns].tolist()
-        return saved_urls
+        # the counts have to include the buffered reviews
+        self.flush()
+        with self._rds_engine.connect() as connection:
+            result = connection.execute(
+                self._book_urls_query, {'num_reviews': num_reviews})
+            return list(result.scalars())
 
     def get_saved_book_isbns(self):
         """Gets all the saved book isbn numbers"""
-         # check is the attributes table exists
-        insp = inspect(self._rds_engine)
-        if not insp.has_table(self._rds_attribute_table):
-            return []
-        # if it exists gets the users for the given isbn    
-        else:
-            sql_query = f'''SELECT isbn FROM {self._rds_attribute_table};'''
-            result = list(self._rds_engine.execute(sql_query).fetchall())
-            result = [item[0] for item in result]
-        return result
+        with self._rds_engine.connect() as connection:
+            isbns = list(connection.execute(self._isbns_query).scalars())
+        with self._lock:
+            return isbns + [row['isbn'] for row in
+                            self._writing_attribute_rows + self._attribute_rows]
 
     def get_saved_review_users(self, isbn: str) -> list[str]:
         """Get all the user names of the saved reviews of a particular book.
@@ -92,43 +195,127 @@ class AWSPostgresRDSDataStorage(RDSDataStorage):
         Returns:
             list[str]: list of user names of reviews
         """
-        # check is the reviews table exists
-        insp = inspect(self._rds_engine)
-        if not insp.has_table(self._rds_review_table):
-            return []
-        # if it exists gets the users for the given isbn    
-        else:
-            sql_query = f'''SELECT "user" FROM {self._rds_review_table} WHERE isbn = '{isbn}';'''
-            result = self._rds_engine.execute(sql_query).fetchall()
-            result = [item[0] for item in result]
-        return result
+        with self._rds_engine.connect() as connection:
+            result = connection.execute(
+                self._review_users_query, {'isbn': isbn})
+            users = list(result.scalars())
+        with self._lock:
+            return users + [row['user'] for row in
+                            self._writing_review_rows + self._review_rows
+                            if row['isbn'] == isbn]
+
+    def get_saved_books(self) -> list[tuple[str, str, list[str]]]:
+        """Gets the isbn, book url and review users of each saved book"""
+        self.flush()
+        attributes = self._attribute_table
+        reviews = self._review_table
+        with self._rds_engine.connect() as connection:
+            books = connection.execute(
+                select(attributes.c.isbn, attributes.c.book_url).distinct())
+            books = list(books)
+            review_users = connection.execute(
+                select(reviews.c.isbn, reviews.c.user))
+            users = {}
+            for isbn, user in review_users:
+                users.setdefault(isbn, []).append(user)
+        return [(isbn, book_url, users.get(isbn, []))
+                for isbn, book_url in books]
 
     def _save_reviews(self, reviews):
-        # save the reviews in RDS
-        # TODO: works without asdict! 
-        book_reviews_df = pd.DataFrame(reviews)
-        try:
-            book_reviews_df.to_sql(
-                self._rds_review_table,
-                self._rds_engine,
-                if_exists='append',
-                index=False)
-        except:
-            print(
-                f"Could not save reviews in RDS")
+        # buffer the reviews for RDS
+        for review in reviews:
+            if not isinstance(review, Review):
+                raise TypeError('Invalid type for review')
+        with self._lock:
+            self._review_rows.extend([asdict(review) for review in reviews])
 
     def _save_book_attributes(self, book_attributes):
         if not isinstance(book_attributes, BookAttribute):
             raise TypeError('Invalid type for book attribute')
 
-        # save the book attribute in RDS
-        book_attrubute_df = pd.DataFrame([asdict(book_attributes)])
+        # buffer the book attribute for RDS
+        with self._lock:
+            self._attribute_rows.append(asdict(book_attributes))
+
+    def _replace_attribute_rows(self, connection, rows):
+        """Deletes the saved attributes of the books and inserts the rows,
+        the last row of each book"""
+        rows = list({row['isbn']: row for row in rows}.values())
+        isbns = [row['isbn'] for row in rows]
+        for start in range(0, len(isbns), DELETE_BATCH_SIZE):
+            connection.execute(self._delete_attributes_query, {
+                'isbns': isbns[start:start + DELETE_BATCH_SIZE]})
+        self._insert_rows(connection, self._attribute_table, rows)
+
+    def _insert_rows(self, connection, table, rows):
+        """Inserts the rows in bulk: with COPY on Postgres and a single
+        executemany otherwise"""
+        if not rows:
+            return
+        if connection.dialect.name != 'postgresql':
+            connection.execute(table.insert(), rows)
+            return
+        # write the rows as csv, with None as NULL
+        columns = [column.name for column in table.columns]
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([NULL if row[column] is None else row[column]
+                             for column in columns])
+        buffer.seek(0)
+        quote = connection.dialect.identifier_preparer.quote
+        sql_query = (f"COPY {quote(table.name)} "
+                     f"({', '.join([quote(column) for column in columns])}) "
+                     f"FROM STDIN WITH (FORMAT csv, NULL '{NULL}')")
+        cursor = connection.connection.cursor()
         try:
-            book_attrubute_df.to_sql(
-                self._rds_attribute_table,
-                self._rds_engine, if_exists='append',
-                index=False)
-        except:
-            print(
-                f"Could not save the record for {book_attributes.title} in RDS")
+            cursor.copy_expert(sql_query, buffer)
+        finally:
+            cursor.close()
+
+    def _create_tables(self):
+        """Creates the tables and their indexes if they do not exist. Tables
+        created earlier (by pandas) get the missing indexes."""
+        metadata = MetaData()
+        self._attribute_table = Table(
+            self._rds_attribute_table, metadata,
+            Column('title', Text),
+            Column('isbn', Text),
+            Column('uuid', Text),
+            Column('author', Text),
+            Column('description', Text),
+            Column('date', Text),
+            Column('pages', BigInteger),
+            Column('price', Float),
+            Column('best_seller_rank', BigInteger),
+            Column('review_rating', Float),
+            Column('review_count', BigInteger),
+            Column('image_url', Text),
+            Column('book_url', Text),
+            Index(f'ix_{self._rds_attribute_table}_isbn', 'isbn'))
+        self._review_table = Table(
+            self._rds_review_table, metadata,
+            Column('isbn', Text),
+            Column('text', Text),
+            Column('rating', BigInteger),
+            Column('user', Text),
+            Index(f'ix_{self._rds_review_table}_isbn_user', 'isbn', 'user'))
+        metadata.create_all(self._rds_engine)
+        for table in metadata.tables.values():
+            for index in table.indexes:
+                index.create(self._rds_engine, checkfirst=True)
 
+    def _prepare_queries(self):
+        """Builds the resume queries once with bound parameters"""
+        reviews = self._review_table
+        attributes = self._attribute_table
+        # the urls of the books with review >= num_review
+        isbns = select(reviews.c.isbn).group_by(reviews.c.isbn).having(
+            func.count() >= bindparam('num_reviews')).subquery()
+        self._book_urls_query = select(attributes.c.book_url).distinct().join(
+            isbns, attributes.c.isbn == isbns.c.isbn)
+        self._isbns_query = select(attributes.c.isbn)
+        self._review_users_query = select(reviews.c.user).where(
+            reviews.c.isbn == bindparam('isbn'))
+        self._delete_attributes_query = attributes.delete().where(
+            attributes.c.isbn.in_(bindparam('isbns', expanding=True)))
@@ -0,0 +1,310 @@
+"""Benchmarks the Amazon extractors on a fixed corpus of book and review
+pages, to see the per-field cost of the extraction that runs for every book.
+
+Each extractor (_extract_<attribute>_attribute of AmazonBookAttributeScraper
+and _get_review_<field>_from_element of AmazonBookReviewScraper) is timed
+on two paths:
+- live: the page is loaded from a file url in the headless browser and every
+  lookup is a webdriver command (a round trip to the browser)
+- static: the page is parsed once as an HTMLDocument and the lookups run
+  in-process
+
+The corpus is a folder of book_pages/*.html and review_pages/*.html. It is
+generated from the fake bookstore, or exported from a page cache of pages
+captured while scraping.
+
+Usage:
+    python benchmark_extractors.py corpus <path> [--page-cache <path>]
+    python benchmark_extractors.py run <path> [--paths live static]
+"""
+import argparse
+from contextlib import contextmanager
+import os
+from os.path import join
+import time
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options as ChromeOptions
+from selenium.webdriver.firefox.options import Options as FirefoxOptions
+from amazon_book_attribute_scraper import AmazonBookAttributeScraper
+from amazon_book_review_scraper import AmazonBookReviewScraper
+from fake_bookstore import FakeBookstore
+from html_document import HTMLDocument, HTMLElement
+from page_cache import PageCache
+
+# the attributes in the order the scraper extracts them
+ATTRIBUTES = ('title', 'isbn', 'language', 'author', 'description', 'date',
+              'pages', 'price', 'best_seller_rank', 'review_rating',
+              'review_count', 'image_url')
+REVIEW_FIELDS = ('user', 'text', 'rating')
+REVIEW_XPATH = '//div[@id="cm_cr-review_list"]/div[@data-hook="review"]'
+PATHS = ('live', 'static')
+# number of books of a generated corpus
+NUM_BOOKS = 20
+# number of times each extractor is timed per page, the fastest is kept
+REPEAT = 5
+# the calls of the static page that are counted as lookups
+DOCUMENT_CALLS = ('find_elements', 'get_attribute')
+
+
+def build_corpus(
+        path: str, page_cache: PageCache = None, num_books: int = NUM_BOOKS,
+        seed: int = 0) -> int:
+    """Writes the corpus pages
+
+    Args:
+        path (str): path to the corpus folder
+        page_cache (PageCache, optional): the pages are exported from it.
+        Defaults to pages generated by the fake bookstore.
+        num_books (int, optional): number of books of a generated corpus
+        seed (int, optional): random seed of a generated corpus
+
+    Returns:
+        int: number of pages written
+    """
+    for page_type in ('book_pages', 'review_pages'):
+        os.makedirs(join(path, page_type), exist_ok=True)
+    if page_cache is None:
+        bookstore = FakeBookstore(num_books=num_books, seed=seed)
+        try:
+            pages = [('book_pages', bookstore.render_book_page(i))
+                     for i in range(num_books)]
+            pages += [('review_pages', bookstore.render_review_page(i, 1))
+                      for i in range(num_books)]
+        finally:
+            bookstore.close()
+    else:
+        attribute_scraper = AmazonBookAttributeScraper()
+        pages = []
+        for url, page_source in page_cache.iter_pages():
+            document = HTMLDocument(page_source, url=url)
+            if attribute_scraper._is_complete_page(document):
+                pages.append(('book_pages', page_source))
+            elif document.find_elements_by_xpath(REVIEW_XPATH):
+                pages.append(('review_pages', page_source))
+    counts = {'book_pages': 0, 'review_pages': 0}
+    for page_type, page_source in pages:
+        file_path = join(path, page_type, f'{counts[page_type]:05d}.html')
+        with open(file_path, mode='w', encoding='utf-8') as f:
+            f.write(page_source)
+        counts[page_type] += 1
+    return len(pages)
+
+
+def load_corpus(path: str) -> dict[str, list[str]]:
+    """Gets the paths of the corpus pages
+
+    Returns:
+        dict[str, list[str]]: the page files of 'book_pages' and
+        'review_pages'
+    """
+    corpus = {}
+    for page_type in ('book_pages', 'review_pages'):
+        folder = join(path, page_type)
+        files = sorted(os.listdir(folder)) if os.path.isdir(folder) else []
+        corpus[page_type] = [join(folder, file) for file in files
+                             if file.endswith('.html')]
+    return corpus
+
+
+class CallCounter:
+    """Counts the round trips to the browser (webdriver commands) or the
+    lookups in a static page"""
+    def __init__(self) -> None:
+        self.count = 0
+
+    @contextmanager
+    def count_driver(self, driver):
+        """Counts the calls of the driver during the block"""
+        if getattr(driver, 'is_static', False):
+            with self._count_document():
+                yield self
+            return
+        # the elements send their commands through the driver as well
+        execute = driver.execute
+
+        def counted_execute(*args, **kwargs):
+            self.count += 1
+            return execute(*args, **kwargs)
+
+        driver.execute = counted_execute
+        try:
+            yield self
+        finally:
+            del driver.execute
+
+    @contextmanager
+    def _count_document(self):
+        originals = {name: getattr(HTMLElement, name)
+                     for name in DOCUMENT_CALLS}
+
+        def counted(function):
+            def counted_function(*args, **kwargs):
+                self.count += 1
+                return function(*args, **kwargs)
+            return counted_function
+
+        for name, function in originals.items():
+            setattr(HTMLElement, name, counted(function))
+        try:
+            yield self
+        finally:
+            for name, function in originals.items():
+                setattr(HTMLElement, name, function)
+
+
+def benchmark_book_page(
+        scraper: AmazonBookAttributeScraper, driver,
+        repeat: int = REPEAT) -> dict[str, tuple[float, int]]:
+    """Times the extractors on the book page the driver points to
+
+    Returns:
+        dict[str, tuple[float, int]]: the seconds and the number of calls of
+        each field. 'initialize' reads the detail elements the isbn,
+        language, date, pages and rank extractors use.
+    """
+    results = {}
+    results['initialize'] = _time_call(
+        lambda: scraper._initialize(driver), driver, repeat)
+    for attribute in ATTRIBUTES:
+        extractor = getattr(scraper, f'_extract_{attribute}_attribute')
+        results[attribute] = _time_call(
+            lambda: extractor(driver), driver, repeat)
+    return results
+
+
+def benchmark_review_page(
+        scraper: AmazonBookReviewScraper, driver,
+        repeat: int = REPEAT) -> dict[str, tuple[float, int]]:
+    """Times the review helpers on the review page the driver points to
+
+    Returns:
+        dict[str, tuple[float, int]]: the seconds and the number of calls of
+        each field, per review. 'review_elements' finds the reviews of the
+        page.
+    """
+    results = {}
+    results['review_elements'] = _time_call(
+        lambda: driver.find_elements_by_xpath(REVIEW_XPATH), driver, repeat)
+    elements = driver.find_elements_by_xpath(REVIEW_XPATH)
+    for field in REVIEW_FIELDS:
+        helper = getattr(scraper, f'_get_review_{field}_from_element')
+        seconds, calls = 0.0, 0
+        for element in elements:
+            element_seconds, element_calls = _time_call(
+                lambda: helper(element), driver, repeat)
+            seconds += element_seconds
+            calls += element_calls
+        num_elements = max(len(elements), 1)
+        results[field] = (seconds / num_elements, calls // num_elements)
+    return results
+
+
+def run_benchmark(
+        corpus: dict[str, list[str]], paths: list[str] = PATHS,
+        browser: str = 'chrome', repeat: int = REPEAT) -> list[dict]:
+    """Runs the extractors over the corpus on each path
+
+    Returns:
+        list[dict]: the mean seconds and calls per page (per review for the
+        review fields) of each path, page type and field
+    """
+    attribute_scraper = AmazonBookAttributeScraper()
+    review_scraper = AmazonBookReviewScraper()
+    benchmarks = {'book_pages': lambda driver: benchmark_book_page(
+                      attribute_scraper, driver, repeat),
+                  'review_pages': lambda driver: benchmark_review_page(
+                      review_scraper, driver, repeat)}
+    results = []
+    for path in paths:
+        driver = _create_driver(browser) if path == 'live' else None
+        try:
+            for page_type, files in corpus.items():
+                totals = {}
+                for file_path in files:
+                    page_driver = _load_page(file_path, driver)
+                    for field, (seconds, calls) in benchmarks[page_type](
+                            page_driver).items():
+                        total = totals.setdefault(field, [0.0, 0])
+                        total[0] += seconds
+                        total[1] += calls
+                for field, (seconds, calls) in totals.items():
+                    results.append({'path': path, 'page_type': page_type,
+                                    'field': field,
+                                    'seconds': seconds / len(files),
+                                    'calls': calls / len(files)})
+        finally:
+            if driver:
+                driver.quit()
+    return results
+
+
+def print_results(results: list[dict]) -> None:
+    print(f"{'path':7} {'page':13} {'field':17} {'ms':>9} {'calls':>6}")
+    for result in results:
+        print(f"{result['path']:7} {result['page_type']:13} "
+              f"{result['field']:17} {result['seconds'] * 1000:9.3f} "
+              f"{result['calls']:6.1f}")
+
+
+def _time_call(function, driver, repeat):
+    """The fastest time of the function and its number of calls"""
+    best_time = float('inf')
+    for _ in range(repeat):
+        counter = CallCounter()
+        with counter.count_driver(driver):
+            start = time.perf_counter()
+            function()
+            best_time = min(best_time, time.perf_counter() - start)
+    return best_time, counter.count
+
+
+def _load_page(file_path, driver):
+    """Loads the page in the driver, or parses it if there is none"""
+    url = 'file://' + os.path.abspath(file_path)
+    if driver is None:
+        with open(file_path, mode='r', encoding='utf-8') as f:
+            return HTMLDocument(f.read(), url=url)
+    driver.get(url)
+    return driver
+
+
+def _create_driver(browser):
+    if browser == 'chrome':
+        options = ChromeOptions()
+        options.add_argument('--headless')
+        options.add_argument('--no-sandbox')
+        options.add_argument('--disable-dev-shm-usage')
+        return webdriver.Chrome(options=options)
+    elif browser == 'firefox':
+        options = FirefoxOptions()
+        options.add_argument('--headless')
+        return webdriver.Firefox(options=options)
+    raise NotImplementedError('Only Chrome and Firefox are supported.')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmarks the extractors on a corpus of pages')
+    parser.add_argument('command', choices=['corpus', 'run'])
+    parser.add_argument('corpus', help='path of the corpus folder')
+    parser.add_argument('--page-cache', default=None,
+                        help='export the pages of this page cache (corpus)')
+    parser.add_argument('--books', type=int, default=NUM_BOOKS,
+                        help='number of generated books (corpus)')
+    parser.add_argument('--paths', nargs='+', choices=PATHS,
+                        default=list(PATHS))
+    parser.add_argument('--browser', default='chrome')
+    parser.add_argument('--repeat', type=int, default=REPEAT)
+    args = parser.parse_args(argv)
+    if args.command == 'corpus':
+        page_cache = PageCache(args.page_cache) if args.page_cache else None
+        num_pages = build_corpus(args.corpus, page_cache, args.books)
+        print(f'Wrote {num_pages} pages to {args.corpus}')
+        return
+    results = run_benchmark(
+        load_corpus(args.corpus), args.paths, args.browser, args.repeat)
+    print_results(results)
+
+
+if __name__ == '__main__':
+    main()
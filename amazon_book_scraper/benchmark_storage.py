@@ -0,0 +1,348 @@
+"""Benchmarks the storage backends on a synthetic catalog, so the cost of
+saving books, of the resume queries and of opening the storage on the saved
+catalog (loading or rebuilding its manifest or catalog) can be compared
+between commits as the catalog grows.
+
+The results are appended to a JSON lines file with the commit they were
+measured on. With --compare a result slower than the last one of the same
+backend, catalog size and operation by more than REGRESSION_FACTOR fails the
+run.
+
+Usage:
+    python benchmark_storage.py local s3 rds --sizes 1000 10000 100000
+    python benchmark_storage.py rds --rds-url postgresql+psycopg2://... \
+        --compare
+"""
+import argparse
+from contextlib import contextmanager
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Iterator
+from sqlalchemy import create_engine, text
+from aws_postgres_data_storage import AWSPostgresRDSDataStorage
+from entities import Book, BookAttribute, Review
+from local_raw_data_storage import LocalRawDataStorage
+from s3_raw_data_storage import S3RawDataStorage
+
+BACKENDS = ('local', 's3', 'rds')
+# default catalog sizes (books)
+SIZES = (1000, 10000, 100000)
+# default number of reviews per book
+NUM_REVIEWS = 10
+# number of books the per-book queries are timed for
+NUM_LOOKUPS = 100
+# number of times the queries are timed, the fastest time is kept
+REPEAT = 5
+# a result slower than the previous one by more than this factor regressed
+REGRESSION_FACTOR = 1.5
+RESULTS_FILE = 'benchmark_results.jsonl'
+S3_BUCKET = 'benchmark-bucket'
+# the tables of the RDS storage, dropped before each catalog size
+RDS_TABLES = ('book_attributes', 'book_reviews')
+
+
+def generate_books(
+        num_books: int, num_reviews: int = NUM_REVIEWS,
+        seed: int = 0) -> Iterator[Book]:
+    """Generates a synthetic catalog. The same seed generates the same
+    catalog.
+
+    Args:
+        num_books (int): number of books
+        num_reviews (int, optional): max number of reviews per book. The
+        number of reviews varies, so the num_reviews filter of the resume
+        queries is exercised.
+        seed (int, optional): random seed
+
+    Yields:
+        Book: a book with its reviews
+    """
+    rng = random.Random(seed)
+    for i in range(num_books):
+        isbn = f'ISBN-13-{9780000000000 + i}'
+        attributes = BookAttribute(
+            title=f'Title {i}', isbn=isbn, uuid=f'uuid-{i}',
+            author=f'Author {rng.randrange(num_books // 10 + 1)}',
+            description=' '.join(['description'] * rng.randint(10, 100)),
+            date='January 1, 2020', pages=rng.randint(50, 1000),
+            price=round(rng.uniform(1, 50), 2),
+            best_seller_rank=rng.randint(1, 1000000),
+            review_rating=round(rng.uniform(1, 5), 1),
+            review_count=rng.randint(0, 100000),
+            image_url=f'https://images.example.com/{isbn}.jpg',
+            book_url=f'https://books.example.com/dp/{isbn}')
+        reviews = [Review(isbn=isbn,
+                          text=' '.join(['text'] * rng.randint(5, 200)),
+                          rating=rng.randint(1, 5), user=f'user-{i}-{j}')
+                   for j in range(rng.randint(num_reviews // 2, num_reviews))]
+        yield Book(attributes=attributes, reviews=reviews)
+
+
+def benchmark_storage(
+        storage, books: Iterator[Book], num_reviews: int = NUM_REVIEWS,
+        num_lookups: int = NUM_LOOKUPS) -> dict:
+    """Saves the books and times the resume queries
+
+    Args:
+        storage (RawDataStorage or RDSDataStorage): an empty storage
+        books (Iterator[Book]): the books to save
+        num_reviews (int, optional): the num_reviews of the url query
+        num_lookups (int, optional): number of books the review users are
+        queried for
+
+    Returns:
+        dict: seconds per operation. save_book and get_saved_review_users
+        are per call, the others for the whole catalog.
+    """
+    isbns = []
+    start = time.perf_counter()
+    for book in books:
+        storage.save_book(book, [])
+        isbns.append(book.attributes.isbn)
+    # the asynchronous storages are only done when flushed
+    storage.flush()
+    save_time = time.perf_counter() - start
+
+    urls_time = _time_best(lambda: storage.get_saved_book_urls(num_reviews))
+    isbns_time = _time_best(storage.get_saved_book_isbns)
+    lookups = random.Random(0).sample(isbns, min(num_lookups, len(isbns)))
+
+    def get_review_users():
+        for isbn in lookups:
+            storage.get_saved_review_users(isbn)
+
+    users_time = _time_best(get_review_users)
+
+    return {'save_book': save_time / max(len(isbns), 1),
+            'get_saved_book_urls': urls_time,
+            'get_saved_book_isbns': isbns_time,
+            'get_saved_review_users': users_time / max(len(lookups), 1)}
+
+
+def benchmark_open(
+        backend: str, path: str, rds_url: str = None,
+        repeat: int = REPEAT) -> dict:
+    """Times opening the storage on the saved catalog, which loads its
+    manifest (S3) or catalog (local), and rebuilding them when they are
+    missing
+
+    Args:
+        backend (str): 'local', 's3' or 'rds'
+        path (str): the folder of the saved catalog
+        rds_url (str, optional): database URL of the RDS storage
+        repeat (int, optional): number of times the opening is timed
+
+    Returns:
+        dict: seconds to open the storage and, except for RDS, to open it
+        with the manifest or catalog rebuilt
+    """
+    times = {'open_storage': _time_open(backend, path, rds_url, repeat)}
+    if backend == 'local':
+        def remove_catalog():
+            for suffix in ('', '-wal', '-shm'):
+                catalog_path = os.path.join(
+                    path, f'raw_data_catalog.db{suffix}')
+                if os.path.isfile(catalog_path):
+                    os.remove(catalog_path)
+
+        times['rebuild_catalog'] = _time_open(
+            backend, path, rds_url, repeat, before=remove_catalog)
+    elif backend == 's3':
+        import boto3
+
+        def remove_manifest():
+            boto3.client('s3').delete_object(
+                Bucket=S3_BUCKET, Key='raw_data_manifest.json.gz')
+
+        times['rebuild_catalog'] = _time_open(
+            backend, path, rds_url, repeat, before=remove_manifest)
+    return times
+
+
+def empty_rds(rds_url: str) -> None:
+    """Drops the tables of the RDS storage, so every catalog size is saved
+    into an empty database"""
+    engine = create_engine(rds_url)
+    try:
+        with engine.begin() as connection:
+            for table in RDS_TABLES:
+                connection.execute(text(f'DROP TABLE IF EXISTS {table}'))
+    finally:
+        engine.dispose()
+
+
+def open_storage(backend: str, path: str, rds_url: str = None):
+    """Opens a storage of the backend in the folder
+
+    Args:
+        backend (str): 'local', 's3' or 'rds'
+        path (str): path to a temporary folder
+        rds_url (str, optional): database URL of the RDS storage. Defaults
+        to an SQLite database in the folder.
+    """
+    if backend == 'local':
+        return LocalRawDataStorage(path=path)
+    if backend == 's3':
+        return S3RawDataStorage(
+            path=None, bucket=S3_BUCKET,
+            validators_path=os.path.join(path, 'raw_data_images.db'))
+    if backend == 'rds':
+        url = rds_url or f"sqlite:///{os.path.join(path, 'rds.db')}"
+        return AWSPostgresRDSDataStorage({'URL': url})
+    raise ValueError(f'Unknown backend: {backend}')
+
+
+@contextmanager
+def mock_s3(backend: str):
+    """Runs the block against moto, with an empty bucket, for the S3
+    backend"""
+    if backend != 's3':
+        yield
+        return
+    try:
+        from moto import mock_aws
+    except ImportError:
+        raise RuntimeError('The S3 benchmark requires moto.')
+    with mock_aws():
+        os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+        import boto3
+        boto3.client('s3').create_bucket(Bucket=S3_BUCKET)
+        yield
+
+
+def run_benchmarks(
+        backends: list[str], sizes: list[int],
+        num_reviews: int = NUM_REVIEWS, rds_url: str = None) -> list[dict]:
+    """Runs the benchmark of each backend at each catalog size
+
+    Returns:
+        list[dict]: a result per backend, size and operation
+    """
+    commit = _get_commit()
+    results = []
+    for backend in backends:
+        for size in sizes:
+            with tempfile.TemporaryDirectory() as path, mock_s3(backend):
+                if backend == 'rds' and rds_url:
+                    # the database outlives the folder
+                    empty_rds(rds_url)
+                storage = open_storage(backend, path, rds_url)
+                try:
+                    times = benchmark_storage(
+                        storage, generate_books(size, num_reviews),
+                        num_reviews)
+                finally:
+                    storage.close()
+                times.update(benchmark_open(backend, path, rds_url))
+            for operation, seconds in times.items():
+                results.append({'backend': backend, 'size': size,
+                                'operation': operation, 'seconds': seconds,
+                                'commit': commit, 'time': time.time()})
+                print(f'{backend:6} {size:>7} {operation:24} '
+                      f'{seconds * 1000:10.3f} ms')
+    return results
+
+
+def find_regressions(
+        results: list[dict], previous_results: list[dict],
+        factor: float = REGRESSION_FACTOR) -> list[str]:
+    """Compares the results with the last previous result of the same
+    backend, size and operation
+
+    Returns:
+        list[str]: a description of each regression
+    """
+    last_results = {}
+    for result in previous_results:
+        key = (result['backend'], result['size'], result['operation'])
+        last_results[key] = result
+    regressions = []
+    for result in results:
+        key = (result['backend'], result['size'], result['operation'])
+        last_result = last_results.get(key)
+        if last_result and result['seconds'] > last_result['seconds'] * factor:
+            regressions.append(
+                f"{result['operation']} of {result['backend']} at "
+                f"{result['size']} books: {result['seconds']:.6f}s "
+                f"(was {last_result['seconds']:.6f}s at "
+                f"{last_result['commit']})")
+    return regressions
+
+
+def load_results(path: str) -> list[dict]:
+    if not os.path.isfile(path):
+        return []
+    with open(path, mode='r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def save_results(results: list[dict], path: str) -> None:
+    with open(path, mode='a') as f:
+        for result in results:
+            f.write(json.dumps(result) + '\n')
+
+
+def _time_open(backend, path, rds_url, repeat, before=None):
+    """The fastest of repeated openings of the storage, each after
+    before() if given"""
+    best_time = float('inf')
+    for _ in range(repeat):
+        if before:
+            before()
+        start = time.perf_counter()
+        storage = open_storage(backend, path, rds_url)
+        best_time = min(best_time, time.perf_counter() - start)
+        storage.close()
+    return best_time
+
+
+def _time_best(function, repeat=REPEAT):
+    """The fastest of repeated runs, which is the least noisy"""
+    best_time = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best_time = min(best_time, time.perf_counter() - start)
+    return best_time
+
+
+def _get_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+            text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmarks the storage backends on a synthetic catalog')
+    parser.add_argument('backends', nargs='+', choices=BACKENDS)
+    parser.add_argument('--sizes', nargs='+', type=int, default=list(SIZES))
+    parser.add_argument('--reviews', type=int, default=NUM_REVIEWS)
+    parser.add_argument('--rds-url', default=None,
+                        help='database URL of the RDS storage (SQLite default)')
+    parser.add_argument('--results', default=RESULTS_FILE)
+    parser.add_argument('--compare', action='store_true',
+                        help='fail if a result regressed')
+    args = parser.parse_args(argv)
+    previous_results = load_results(args.results)
+    results = run_benchmarks(
+        args.backends, args.sizes, args.reviews, args.rds_url)
+    save_results(results, args.results)
+    if args.compare:
+        regressions = find_regressions(results, previous_results)
+        for regression in regressions:
+            print(f'Regression: {regression}')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,38 @@
 """Provides the class for scraping book attributes."""
 from abc import ABC, abstractmethod
 from typing import Optional
-import time
 import uuid
 from selenium import webdriver
 from entities import BookAttribute
-from utils import PAGE_SLEEP_TIME
+from html_document import HTMLDocument
+from metrics import get_metrics
+from page_cache import PageCache
+from page_fetcher import PageFetcher
+from page_readiness import wait_for_page_ready
+from snapshot_archive import SnapshotArchive
 
 class BookAttributeScraper(ABC):
     """The abstract class for the book attributes scraper."""
-    def __init__(self, banned_titles: list[str] = None) -> None:
+    def __init__(
+            self, banned_titles: list[str] = None,
+            page_fetcher: PageFetcher = None,
+            snapshot: bool = False,
+            page_cache: PageCache = None,
+            archive: SnapshotArchive = None) -> None:
         """
         Args:
             banned_titles (str, optional): list of banned phrases in title
+            page_fetcher (PageFetcher, optional): fetches the book page
+            without the webdriver. The webdriver is only used for the pages
+            that the fetcher can not provide completely.
+            snapshot (bool, optional): when the page is loaded in the
+            webdriver, take a snapshot of the page source once and extract
+            the attributes from it in-process instead of querying the
+            webdriver for every element.
+            page_cache (PageCache, optional): cache of the book pages. A
+            cached page is scraped without loading it.
+            archive (SnapshotArchive, optional): the loaded book pages are
+            archived in it, e.g. to replay the extraction later
         """
         if banned_titles is None:
             self._banned_titles = []
@@ -20,11 +40,25 @@ class BookAttributeScraper(ABC):
             self._banned_titles = banned_titles
         else:
             raise ValueError('Expected a list.')
+        if page_fetcher and not isinstance(page_fetcher, PageFetcher):
+            raise TypeError('Invalid type')
+        self._page_fetcher = page_fetcher
+        self._snapshot = snapshot
+        self._page_cache = page_cache
+        self._archive = archive
+        # if the webdriver was pointed to the last scraped book page
+        self.page_loaded_in_driver = False
+        # why the last book page was skipped: 'no_page', 'no_title',
+        # 'banned', 'no_isbn' or 'not_english'
+        self.skip_reason = None
 
     def scrape_book_attributes_from_page(
             self, url: str, 
             driver: webdriver = None) -> Optional[BookAttribute]:
-        """Scrapes all attributes from the book page
+        """Scrapes all attributes from the book page. The page is taken from
+        the page cache or fetched with the page fetcher if there is one,
+        otherwise (or if the page is incomplete) it is loaded in the
+        webdriver.
 
         Args:
             url (str): book url
@@ -33,42 +67,99 @@ class BookAttributeScraper(ABC):
         Returns:
             Optional[BookAttribute]: scraped BookAttribute object
         """
+        self.page_loaded_in_driver = False
+        self.skip_reason = None
+        if self._page_cache:
+            page_source = self._page_cache.get(url, 'book_page')
+            if page_source is not None:
+                document = HTMLDocument(page_source, url=url)
+                identity = self._identify_page(document)
+                if identity is not None:
+                    return self._scrape_book_attributes(
+                        url, document, identity)
+        if self._page_fetcher:
+            with get_metrics().page_load_seconds.labels(
+                    page_type='book_page', source='http').time():
+                document = self._page_fetcher.fetch(url)
+            identity = (self._identify_page(document)
+                        if document is not None else None)
+            if identity is not None:
+                self._cache_page(url, document.page_source)
+                return self._scrape_book_attributes(url, document, identity)
+            print(f'Falling back to the webdriver for {url}')
+
         if not driver:
             driver = webdriver.Firefox()
-        driver.get(url)
-        time.sleep(PAGE_SLEEP_TIME)
+        with get_metrics().page_load_seconds.labels(
+                page_type='book_page', source='webdriver').time():
+            driver.get(url)
+        wait_for_page_ready(driver, 'book_page')
+        self.page_loaded_in_driver = True
+        if self._snapshot:
+            document = HTMLDocument(driver.page_source, url=url)
+            identity = self._identify_page(document)
+            if identity is not None:
+                self._cache_page(url, document.page_source)
+                return self._scrape_book_attributes(url, document, identity)
+        elif self._page_cache or self._archive:
+            self._cache_page(url, driver.page_source)
+        return self._scrape_book_attributes(url, driver)
 
-        if not self._initialize(driver):
-            return None
+    def _cache_page(self, url: str, page_source: str) -> None:
+        """Keeps a loaded page in the page cache and the archive"""
+        try:
+            if self._page_cache:
+                self._page_cache.put(url, page_source)
+            if self._archive:
+                self._archive.put(url, page_source)
+        except OSError as e:
+            print(f'Could not cache the page of {url}: {e}')
 
-        title = self._extract_title_attribute(driver)
-        if title is None:
-            return None
+    def _scrape_book_attributes(
+            self, url: str, driver,
+            identity: tuple[str, str] = None) -> Optional[BookAttribute]:
+        """Scrapes all attributes from the page the driver points to. The
+        driver can also be a static page (html_document.HTMLDocument).
+        identity is the title and the isbn if they were already extracted
+        by _identify_page.
+        """
+        metrics = get_metrics()
+        if identity is None:
+            if not self._initialize(driver):
+                return self._skip('no_page')
+            title = self._extract('title', driver)
+            if title is None:
+                return self._skip('no_title')
+        else:
+            title, isbn = identity
         # if any of the banned phrases appear in the tile
         # drop the book
         for banned_title in self._banned_titles:
             if banned_title in title:
                 print(f'{title} is banned!')
+                metrics.books_banned.inc()
+                self.skip_reason = 'banned'
                 return None
 
-        isbn = self._extract_isbn_attribute(driver)
-        if isbn is None: 
-            return None
+        if identity is None:
+            isbn = self._extract('isbn', driver)
+            if isbn is None:
+                return self._skip('no_isbn')
 
-        language = self._extract_language_attribute(driver)
+        language = self._extract('language', driver)
         if not language or language != 'English':
-            return None
+            return self._skip('not_english')
             
         uuid_str = str(uuid.uuid4())
-        author = self._extract_author_attribute(driver)
-        description = self._extract_description_attribute(driver)
-        date = self._extract_date_attribute(driver)
-        pages = self._extract_pages_attribute(driver)
-        price = self._extract_price_attribute(driver)
-        best_seller_rank = self._extract_best_seller_rank_attribute(driver)
-        review_rating = self._extract_review_rating_attribute(driver)
-        review_count = self._extract_review_count_attribute(driver)
-        image_url = self._extract_image_url_attribute(driver)
+        author = self._extract('author', driver)
+        description = self._extract('description', driver)
+        date = self._extract('date', driver)
+        pages = self._extract('pages', driver)
+        price = self._extract('price', driver)
+        best_seller_rank = self._extract('best_seller_rank', driver)
+        review_rating = self._extract('review_rating', driver)
+        review_count = self._extract('review_count', driver)
+        image_url = self._extract('image_url', driver)
 
         book_attributes = BookAttribute(
                                         title=title,
@@ -86,7 +177,49 @@ class BookAttributeScraper(ABC):
                                         book_url=url
                                         )
         return book_attributes
-    
+
+    def _skip(self, reason: str) -> None:
+        """Records why the book page is skipped"""
+        get_metrics().books_invalid.labels(reason=reason).inc()
+        self.skip_reason = reason
+        return None
+
+    def _extract(self, attribute: str, driver):
+        """Runs the extractor of the attribute (_extract_<attribute>_attribute)
+        and records its time"""
+        extractor = getattr(self, f'_extract_{attribute}_attribute')
+        with get_metrics().extractor_seconds.labels(
+                attribute=attribute).time():
+            return extractor(driver)
+
+    def _identify_page(self, driver) -> Optional[tuple[str, str]]:
+        """Extracts the content required for identifying the book. Pages
+        served without it (e.g. rendered by javascript or a robot check)
+        have to be loaded in the webdriver.
+
+        Returns:
+            Optional[tuple[str, str]]: the title and the isbn or None if the
+            page is incomplete. Pass them to _scrape_book_attributes, so the
+            page is initialized and they are extracted only once.
+        """
+        try:
+            if not self._initialize(driver):
+                return None
+            title = self._extract('title', driver)
+            if not title:
+                return None
+            isbn = self._extract('isbn', driver)
+        except Exception:
+            return None
+        if isbn is None:
+            return None
+        return title, isbn
+
+    def _is_complete_page(self, driver) -> bool:
+        """Checks if the page has the content required for identifying the
+        book"""
+        return self._identify_page(driver) is not None
+
     @abstractmethod
     def _initialize(self, driver) -> bool:
         pass
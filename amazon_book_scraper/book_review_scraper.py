@@ -1,10 +1,12 @@
 """Provides classes for review scraping."""
 from abc import ABC, abstractmethod
 from os import NGROUPS_MAX
-import time
+from typing import Optional
 from selenium import webdriver
 from entities import Review
-from utils import PAGE_SLEEP_TIME
+from metrics import get_metrics
+from page_readiness import wait_for_page_ready
+from snapshot_archive import SnapshotArchive
 
 class BookReviewScraper(ABC):
     """Abstract class for scraping reviews on a single page."""
@@ -19,6 +21,14 @@ class AutomatedBookReviewScraper(BookReviewScraper):
     """Abstract class for automating scraping a required number
     of reviews from a book.
     """
+    def __init__(self, archive: SnapshotArchive = None) -> None:
+        """
+        Args:
+            archive (SnapshotArchive, optional): the scraped review pages are
+            archived in it, e.g. to replay the extraction later
+        """
+        self._archive = archive
+
     def scrape_book_reviews(
             self, isbn: str, num: int = 10, driver: webdriver = None,
             url: str = None, skip_users: list[str] = None) -> list[Review]:
@@ -28,7 +38,8 @@ class AutomatedBookReviewScraper(BookReviewScraper):
             num (int, optional): number of reviews to scrape.
             isbn (str): book isbn number
             driver (webdriver, optional): webdriver ponting to the book page
-            url (str, optional): the book url
+            url (str, optional): the book url. If given with the driver, the
+            driver is navigated to the reviews of this book.
             skip_users (list[str], optional): list of user reviews to skip
 
         Returns:
@@ -39,10 +50,22 @@ class AutomatedBookReviewScraper(BookReviewScraper):
 
         if not driver and url:
             driver = webdriver.Firefox()
-            driver.get(url)
-            time.sleep(PAGE_SLEEP_TIME)
 
-        self._get_to_first_review_page(driver)
+        metrics = get_metrics()
+        review_page_url = self._get_first_review_page_url(url) if url else None
+        if review_page_url:
+            # go straight to the reviews without loading the book page
+            with metrics.page_load_seconds.labels(
+                    page_type='review_page', source='webdriver').time():
+                driver.get(review_page_url)
+            wait_for_page_ready(driver, 'first_review_page')
+        else:
+            if url:
+                with metrics.page_load_seconds.labels(
+                        page_type='book_page', source='webdriver').time():
+                    driver.get(url)
+                wait_for_page_ready(driver, 'book_page')
+            self._get_to_first_review_page(driver)
         reviews = []
         # get the number of reiews to scrape based on what is
         # already available
@@ -52,17 +75,42 @@ class AutomatedBookReviewScraper(BookReviewScraper):
             num_reviews = num - len(skip_users)
         
         # scrape at least num reviews
+        page_number = 0
         while len(reviews) < num_reviews:
-            reviews.extend(
-                self.scrape_reviews_from_curr_page(
-                    isbn, driver=driver, skip_users=skip_users))
-            # got to next review page, break if no next page
-            if not self._go_to_next_review_page_if_available(driver):
+            page_number += 1
+            with metrics.review_page_seconds.time():
+                if self._archive:
+                    self._archive_page(driver, page_number)
+                reviews.extend(
+                    self.scrape_reviews_from_curr_page(
+                        isbn, driver=driver, skip_users=skip_users))
+                # got to next review page, break if no next page
+                has_next_page = \
+                    self._go_to_next_review_page_if_available(driver)
+            if not has_next_page:
                 break
         review_count = len(reviews)
         # remove excess reviews and return
         return reviews[:num_reviews if num_reviews < review_count else review_count]
 
+    def _archive_page(self, driver: webdriver, page_number: int) -> None:
+        """Archives the current review page. The next pages may replace the
+        reviews in place without changing the url, so they are told apart
+        by their page number."""
+        try:
+            self._archive.put(
+                driver.current_url, driver.page_source, page_number)
+        except Exception as e:
+            print(f'Could not archive the review page: {e}')
+
+    @staticmethod
+    def _get_first_review_page_url(book_url: str) -> Optional[str]:
+        """The url of the first review page of the book, if it can be derived
+        from the book url. Otherwise the reviews are reached from the book
+        page.
+        """
+        return None
+
     @staticmethod
     @abstractmethod
     def _get_to_first_review_page(driver: webdriver) -> None:
@@ -0,0 +1,389 @@
+"""Provides a local stand-in for the Amazon book store, to test and load-test
+the scrapers offline and deterministically. It serves a generated catalog
+with the markup the Amazon scrapers expect: listing pages, book pages,
+paginated review pages and cover images. The latency and the error rate of
+the responses are configurable.
+
+Usage:
+    python fake_bookstore.py serve --port 8000 --catalog-size 1000
+    python fake_bookstore.py bench --books 100 --reviews 10 --workers 4
+"""
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import random
+import tempfile
+import threading
+import time
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+# default size of the catalog
+NUM_BOOKS = 1000
+BOOKS_PER_PAGE = 16
+REVIEWS_PER_BOOK = 30
+REVIEWS_PER_PAGE = 10
+
+LISTING_PAGE = """<html><head><title>Books</title></head><body>
+<span class="a-dropdown-container"><span class="a-button-text a-declarative">Sort by: Featured</span></span>
+<div class="a-popover-inner"><ul>
+  <li><a href="/s?i=stripbooks">Featured</a></li>
+  <li><a href="/s?i=stripbooks&amp;s=review-rank">Avg. Customer Review</a></li>
+</ul></div>
+<div class="s-main-slot s-result-list s-search-results sg-row">{results}</div>
+<span class="s-pagination-strip">{pagination}</span>
+</body></html>"""
+LISTING_RESULT = """<div data-asin="{asin}"><h2><a class="a-link-normal s-no-outline" href="/{slug}/dp/{asin}/ref=sr_1_{position}">{title}</a></h2></div>"""
+NEXT_PAGE = """<a class="s-pagination-item s-pagination-next" href="/s?{query}">Next</a>"""
+LAST_PAGE = """<span class="s-pagination-item s-pagination-next s-pagination-disabled"><span id="aria-disabled">Next</span></span>"""
+
+BOOK_PAGE = """<html><head><title>{title}</title></head><body>
+<span id="productTitle">{title}</span>
+<div id="authorFollow_feature_div">
+  <div class="a-row a-spacing-top-small">
+    <div class="a-column a-span4 authorNameColumn"><a href="/author/{author_id}">{author}</a></div>
+  </div>
+</div>
+<div data-a-expander-name="book_description_expander"><div><span>{description}</span></div></div>
+<div id="tmmSwatches"><ul>
+  <li><span>Kindle</span><br><span>${kindle_price}</span></li>
+  <li><span>Paperback</span><br><span>${price}</span></li>
+</ul></div>
+<div id="main-image-container"><img id="imgBlkFront" src="/images/{asin}.jpg"></div>
+<div id="detailBullets_feature_div"><ul>
+  <li><span><span>Publisher :</span><span>Fake Press ({date})</span></span></li>
+  <li><span><span>Language :</span><span>English</span></span></li>
+  <li><span><span>Paperback :</span><span>{pages} pages</span></span></li>
+  <li><span><span>ISBN-13 :</span><span>{isbn}</span></span></li>
+</ul></div>
+<div id="detailBulletsWrapper_feature_div"><ul>
+  <li><span>Best Sellers Rank: #{rank} in Books (See Top 100 in Books)</span></li>
+</ul><ul>
+  <li><span><span class="reviewCountTextLinkedHistogram noUnderline" title="{rating} out of 5 stars">{rating}</span>
+  <span id="acrCustomerReviewText">{review_count} ratings</span></span></li>
+</ul></div>
+<a data-hook="see-all-reviews-link-foot" href="/{slug}/product-reviews/{asin}">See all reviews</a>
+</body></html>"""
+
+REVIEW_PAGE = """<html><head><title>Reviews</title></head><body>
+<div id="cm_cr-review_list">{reviews}</div>
+<div id="cm_cr-pagination_bar"><ul>
+  <li class="a-disabled a-first">Previous page</li>
+  {next_page}
+</ul></div>
+</body></html>"""
+REVIEW = """<div data-hook="review"><div><div>
+  <div><a class="a-link-normal" title="{rating}.0 out of 5 stars">stars</a></div>
+  <div class="a-profile-content"><span class="a-profile-name">{user}</span></div>
+  <span data-hook="review-body"><span>{text}</span></span>
+</div></div></div>"""
+NEXT_REVIEW_PAGE = """<li class="a-last"><a href="/{slug}/product-reviews/{asin}?pageNumber={page}">Next page</a></li>"""
+LAST_REVIEW_PAGE = """<li class="a-disabled a-last">Next page</li>"""
+
+MONTHS = ['January', 'February', 'March', 'April', 'May', 'June', 'July',
+          'August', 'September', 'October', 'November', 'December']
+
+
+class FakeBookstore:
+    """HTTP server of a generated book catalog. The same seed generates the
+    same catalog and the same errors. It serves each request in its own
+    thread.
+    """
+    def __init__(
+            self, num_books: int = NUM_BOOKS,
+            books_per_page: int = BOOKS_PER_PAGE,
+            reviews_per_book: int = REVIEWS_PER_BOOK,
+            reviews_per_page: int = REVIEWS_PER_PAGE,
+            latency: float = 0.0, error_rate: float = 0.0, seed: int = 0,
+            host: str = '127.0.0.1', port: int = 0) -> None:
+        """
+        Args:
+            num_books (int, optional): number of books in the catalog
+            books_per_page (int, optional): books per listing page
+            reviews_per_book (int, optional): reviews of each book
+            reviews_per_page (int, optional): reviews per review page
+            latency (float, optional): mean response time in seconds. The
+            responses are delayed by 0.5 to 1.5 times the latency.
+            error_rate (float, optional): fraction of the page requests that
+            fail with HTTP 503
+            seed (int, optional): random seed of the catalog and the errors
+            host (str, optional): host to listen on
+            port (int, optional): port to listen on, 0 picks a free port
+        """
+        self.num_books = num_books
+        self.books_per_page = books_per_page
+        self.reviews_per_book = reviews_per_book
+        self.reviews_per_page = reviews_per_page
+        self.latency = latency
+        self.error_rate = error_rate
+        self._seed = seed
+        # guards the random errors and the counters
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+        self.num_requests = 0
+        self.num_errors = 0
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def listing_url(self) -> str:
+        """The url of the first listing page, the scraper's starting url"""
+        return f'{self.url}/s?i=stripbooks'
+
+    def start(self) -> 'FakeBookstore':
+        """Serves in a background thread"""
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        self._server.serve_forever()
+
+    def close(self) -> None:
+        if self._thread:
+            self._server.shutdown()
+        self._server.server_close()
+
+    def get_book(self, index: int) -> dict:
+        """Generates the fields of a book of the catalog"""
+        rng = random.Random(f'{self._seed}-{index}')
+        asin = f'{1000000000 + index}'
+        return {
+            'asin': asin,
+            'slug': f'Fake-Book-{index}',
+            'title': f'Fake Book {index}: A Novel',
+            'author': f'Author {rng.randrange(100)}',
+            'author_id': rng.randrange(100),
+            'description': ' '.join(['Generated description.'] *
+                                    rng.randint(5, 50)),
+            'kindle_price': f'{rng.uniform(1, 15):.2f}',
+            'price': f'{rng.uniform(5, 30):.2f}',
+            'date': (f'{MONTHS[rng.randrange(12)]} {rng.randint(1, 28)}, '
+                     f'{rng.randint(1990, 2022)}'),
+            'pages': rng.randint(80, 900),
+            'isbn': f'978-{asin}',
+            'rank': f'{index + 1:,}',
+            'rating': f'{rng.uniform(1, 5):.1f}',
+            'review_count': f'{self.reviews_per_book:,}',
+        }
+
+    def render_listing_page(self, page: int, query: dict) -> str:
+        start = (page - 1) * self.books_per_page
+        end = min(start + self.books_per_page, self.num_books)
+        results = ''.join(
+            LISTING_RESULT.format(position=index + 1, **self.get_book(index))
+            for index in range(start, end))
+        if end < self.num_books:
+            next_query = dict(query, page=str(page + 1))
+            pagination = (f'<span class="s-pagination-item">{page}</span>' +
+                          NEXT_PAGE.format(
+                              query=urlencode(next_query).replace('&',
+                                                                  '&amp;')))
+        else:
+            pagination = (f'<span class="s-pagination-item">{page}</span>' +
+                          LAST_PAGE)
+        return LISTING_PAGE.format(results=results, pagination=pagination)
+
+    def render_book_page(self, index: int) -> str:
+        return BOOK_PAGE.format(**self.get_book(index))
+
+    def render_review_page(self, index: int, page: int) -> str:
+        book = self.get_book(index)
+        start = (page - 1) * self.reviews_per_page
+        end = min(start + self.reviews_per_page, self.reviews_per_book)
+        rng = random.Random(f'{self._seed}-{index}-reviews')
+        ratings = [rng.randint(1, 5) for _ in range(self.reviews_per_book)]
+        reviews = ''.join(
+            REVIEW.format(rating=ratings[i], user=f'reader-{index}-{i}',
+                          text=f'Review {i} of {book["title"]}.')
+            for i in range(start, end))
+        if end < self.reviews_per_book:
+            next_page = NEXT_REVIEW_PAGE.format(page=page + 1, **book)
+        else:
+            next_page = LAST_REVIEW_PAGE
+        return REVIEW_PAGE.format(reviews=reviews, next_page=next_page)
+
+    def _make_handler(self):
+        bookstore = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                bookstore._handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def _handle(self, request) -> None:
+        """Routes the request to the page it asks for"""
+        with self._lock:
+            self.num_requests += 1
+            delay = self.latency * self._rng.uniform(0.5, 1.5)
+            is_error = self._rng.random() < self.error_rate
+            if is_error:
+                self.num_errors += 1
+        if delay:
+            time.sleep(delay)
+        parts = urlsplit(request.path)
+        query = {key: values[0] for key, values
+                 in parse_qs(parts.query).items()}
+        path = parts.path.split('/ref=')[0].strip('/').split('/')
+        if path[0].startswith('images') and len(path) == 2:
+            self._respond(request, 200, self._render_image(path[1]),
+                          'image/jpeg')
+            return
+        if is_error:
+            self._respond(request, 503, b'Service Unavailable', 'text/plain')
+            return
+        page_source = None
+        try:
+            if path == ['s']:
+                page = int(query.get('page', 1))
+                if 1 <= page <= max(self._num_listing_pages(), 1):
+                    page_source = self.render_listing_page(page, query)
+            elif len(path) == 3 and path[1] == 'dp':
+                page_source = self.render_book_page(self._get_index(path[2]))
+            elif len(path) == 3 and path[1] == 'product-reviews':
+                page = int(query.get('pageNumber', 1))
+                page_source = self.render_review_page(
+                    self._get_index(path[2]), page)
+        except (ValueError, IndexError):
+            page_source = None
+        if page_source is None:
+            self._respond(request, 404, b'Not Found', 'text/plain')
+            return
+        self._respond(request, 200, page_source.encode('utf-8'),
+                      'text/html; charset=utf-8')
+
+    def _get_index(self, asin):
+        index = int(asin) - 1000000000
+        if not 0 <= index < self.num_books:
+            raise IndexError(asin)
+        return index
+
+    def _num_listing_pages(self):
+        return -(-self.num_books // self.books_per_page)
+
+    @staticmethod
+    def _render_image(name):
+        # a small fake jpeg, different for each book
+        return b'\xff\xd8\xff\xe0' + name.encode('utf-8') + b'\xff\xd9'
+
+    @staticmethod
+    def _respond(request, status, body, content_type):
+        request.send_response(status)
+        request.send_header('Content-Type', content_type)
+        request.send_header('Content-Length', str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
+
+
+def run_harness(
+        bookstore: FakeBookstore, num_books: int, num_reviews: int = 10,
+        num_workers: int = 1, browser: str = 'chrome',
+        mode: str = 'headless', fetch_pages: bool = True) -> dict:
+    """Runs a full scrape_books of the Amazon scrapers against the bookstore
+    into a temporary local storage and measures the throughput. It needs
+    the webdriver of the browser.
+
+    Args:
+        bookstore (FakeBookstore): the running bookstore
+        num_books (int): number of books to scrape
+        num_reviews (int, optional): number of reviews per book
+        num_workers (int, optional): number of parallel workers
+        browser (str, optional): 'chrome' or 'firefox'
+        mode (str, optional): 'normal' or 'headless'
+        fetch_pages (bool, optional): fetch the book pages over HTTP instead
+        of loading them in the browser
+
+    Returns:
+        dict: number of scraped books, seconds and books per minute
+    """
+    # imported here, so the bookstore can be served without selenium
+    from amazon_automated_book_review_scraper import AmazonAutomatedBookReviewScraper
+    from amazon_automated_book_scraper import AmazonAutomatedBookScraper
+    from amazon_book_attribute_scraper import AmazonBookAttributeScraper
+    from local_raw_data_storage import LocalRawDataStorage
+    from page_fetcher import HTTPPageFetcher
+
+    with tempfile.TemporaryDirectory() as path:
+        storage = LocalRawDataStorage(path=path)
+        try:
+            start = time.perf_counter()
+            scraper = AmazonAutomatedBookScraper(
+                url=bookstore.listing_url,
+                book_attribute_scraper=AmazonBookAttributeScraper(
+                    page_fetcher=HTTPPageFetcher() if fetch_pages else None,
+                    snapshot=True),
+                automated_book_review_scraper=(
+                    AmazonAutomatedBookReviewScraper()),
+                raw_data_storage=storage,
+                browser=browser,
+                mode=mode,
+                num_workers=num_workers)
+            try:
+                books = scraper.scrape_books(
+                    num_books=num_books, num_reviews=num_reviews)
+            finally:
+                scraper._driver.quit()
+            seconds = time.perf_counter() - start
+        finally:
+            storage.close()
+    return {'books': len(books), 'seconds': seconds,
+            'books_per_minute': len(books) / seconds * 60,
+            'requests': bookstore.num_requests,
+            'errors': bookstore.num_errors}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Serves a fake book store or measures the scraping '
+                    'throughput against it')
+    parser.add_argument('command', choices=['serve', 'bench'])
+    parser.add_argument('--port', type=int, default=0)
+    parser.add_argument('--catalog-size', type=int, default=NUM_BOOKS)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='mean response time in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--books', type=int, default=50,
+                        help='number of books to scrape (bench)')
+    parser.add_argument('--reviews', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--browser', default='chrome')
+    parser.add_argument('--no-fetch', action='store_true',
+                        help='load the book pages in the browser (bench)')
+    args = parser.parse_args(argv)
+    bookstore = FakeBookstore(
+        num_books=args.catalog_size, latency=args.latency,
+        error_rate=args.error_rate, seed=args.seed, port=args.port)
+    if args.command == 'serve':
+        print(f'Serving {args.catalog_size} books at {bookstore.listing_url}')
+        try:
+            bookstore.serve_forever()
+        finally:
+            bookstore.close()
+        return
+    bookstore.start()
+    try:
+        result = run_harness(
+            bookstore, args.books, num_reviews=args.reviews,
+            num_workers=args.workers, browser=args.browser,
+            fetch_pages=not args.no_fetch)
+    finally:
+        bookstore.close()
+    print(f"Scraped {result['books']} books in {result['seconds']:.1f}s: "
+          f"{result['books_per_minute']:.1f} books/minute "
+          f"({result['requests']} requests, {result['errors']} errors)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""Provides a static, parsed HTML page that can be used in place of a
+webdriver by the scrapers. Only the small part of the webdriver API that the
+scrapers use is implemented: finding elements by xpath or id, reading the
+element text and attributes.
+"""
+import re
+from typing import Optional
+from urllib.parse import urljoin
+from lxml import html
+from selenium.common.exceptions import NoSuchElementException
+from selenium.webdriver.common.by import By
+
+# elements whose text is never rendered
+_HIDDEN_TAGS = {'script', 'style', 'noscript', 'template', 'head', 'title'}
+# elements that are rendered on their own line
+_BLOCK_TAGS = {
+    'address', 'article', 'aside', 'blockquote', 'dd', 'div', 'dl', 'dt',
+    'fieldset', 'figcaption', 'figure', 'footer', 'form', 'h1', 'h2', 'h3',
+    'h4', 'h5', 'h6', 'header', 'hr', 'li', 'main', 'nav', 'ol', 'p', 'pre',
+    'section', 'table', 'tr', 'ul'}
+# attributes that the webdriver returns as absolute urls
+_URL_ATTRIBUTES = {'href', 'src'}
+_WHITESPACE = re.compile(r'[ \t\r\n\f\xa0]+')
+# marks the line breaks of the rendered text while collapsing white space
+_LINE_BREAK = '\x00'
+
+
+class HTMLElement:
+    """A webdriver-like element of a parsed HTML page"""
+    def __init__(self, element, document: 'HTMLDocument') -> None:
+        self._element = element
+        self._document = document
+
+    @property
+    def text(self) -> str:
+        """The rendered text of the element, similar to the webdriver"""
+        return _get_rendered_text(self._element)
+
+    @property
+    def tag_name(self) -> str:
+        return self._element.tag
+
+    def get_attribute(self, name: str) -> Optional[str]:
+        value = self._element.get(name)
+        if value is not None and name in _URL_ATTRIBUTES:
+            value = urljoin(self._document.current_url, value)
+        return value
+
+    def find_element(self, by: str = By.ID, value: str = None) -> 'HTMLElement':
+        elements = self.find_elements(by, value)
+        if not elements:
+            raise NoSuchElementException(f'Unable to locate element: {value}')
+        return elements[0]
+
+    def find_elements(self, by: str = By.ID, value: str = None) -> list['HTMLElement']:
+        if by == By.XPATH:
+            xpath = value
+        elif by == By.ID:
+            xpath = f'.//*[@id="{value}"]'
+        else:
+            raise NotImplementedError(
+                'Only the xpath and id locators are supported.')
+        return [HTMLElement(element, self._document)
+                for element in self._element.xpath(xpath)
+                if isinstance(element.tag, str)]
+
+    def find_element_by_xpath(self, xpath: str) -> 'HTMLElement':
+        return self.find_element(By.XPATH, xpath)
+
+    def find_elements_by_xpath(self, xpath: str) -> list['HTMLElement']:
+        return self.find_elements(By.XPATH, xpath)
+
+
+class HTMLDocument(HTMLElement):
+    """A webdriver-like HTML page. The page is parsed once and all the
+    lookups run in-process. The page never changes, so waiting for elements
+    is pointless (see utils.wait_until).
+    """
+    is_static = True
+
+    def __init__(self, page_source: str, url: str = '') -> None:
+        """
+        Args:
+            page_source (str): the html of the page
+            url (str, optional): the url of the page. Relative links are
+            resolved against it.
+        """
+        self.page_source = page_source
+        self.current_url = url
+        super().__init__(html.document_fromstring(page_source), self)
+
+
+def _get_rendered_text(element) -> str:
+    """Approximates the visible text of an element the way the webdriver
+    returns it: hidden elements are dropped, block elements are placed on
+    their own lines and the white space is collapsed.
+    """
+    chunks = []
+    _collect_text(element, chunks)
+    lines = _WHITESPACE.sub(' ', ''.join(chunks)).split(_LINE_BREAK)
+    lines = [line.strip() for line in lines]
+    return '\n'.join([line for line in lines if line])
+
+
+def _collect_text(element, chunks) -> None:
+    if not isinstance(element.tag, str):
+        # comments and processing instructions
+        return
+    if element.tag in _HIDDEN_TAGS or _is_hidden(element):
+        return
+    is_block = element.tag in _BLOCK_TAGS
+    if is_block:
+        chunks.append(_LINE_BREAK)
+    if element.text:
+        chunks.append(element.text)
+    for child in element:
+        _collect_text(child, chunks)
+        if child.tag == 'br':
+            chunks.append(_LINE_BREAK)
+        if child.tail:
+            chunks.append(child.tail)
+    if is_block:
+        chunks.append(_LINE_BREAK)
+
+
+def _is_hidden(element) -> bool:
+    if element.get('hidden') is not None:
+        return True
+    style = element.get('style', '').replace(' ', '').lower()
+    return 'display:none' in style or 'visibility:hidden' in style
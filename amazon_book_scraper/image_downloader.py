@@ -0,0 +1,181 @@
+"""Provides a background downloader for the book cover images."""
+from concurrent.futures import ThreadPoolExecutor, wait
+import sqlite3
+import threading
+from typing import Callable, Optional
+import urllib3
+from metrics import count_http_retries, count_http_timeout, get_metrics
+from page_fetcher import DEFAULT_HEADERS
+from utils import TIME_OUT
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS validators (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT
+) WITHOUT ROWID;
+"""
+
+
+class ImageDownloader:
+    """Downloads images in a pool of threads over pooled keep-alive
+    connections, with timeouts and retries. The validators (ETag and
+    Last-Modified) of the saved images are kept, so a re-run only downloads
+    the images that changed (conditional GET).
+    """
+    def __init__(
+            self, num_workers: int = 8, time_out: float = TIME_OUT,
+            retries: int = 3, headers: dict = None,
+            validators_path: str = ':memory:') -> None:
+        """
+        Args:
+            num_workers (int, optional): number of concurrent downloads
+            time_out (float, optional): request time out in seconds
+            retries (int, optional): number of retries on connection errors
+            and server errors
+            headers (dict, optional): request headers
+            validators_path (str, optional): path to the database file of the
+            validators. They are kept in memory by default.
+        """
+        self._headers = dict(DEFAULT_HEADERS if headers is None else headers)
+        self._headers['Accept'] = 'image/*'
+        self._http = urllib3.PoolManager(
+            maxsize=num_workers,
+            block=False,
+            timeout=urllib3.Timeout(total=time_out),
+            retries=urllib3.Retry(
+                total=retries, backoff_factor=0.5,
+                status_forcelist=[429, 500, 502, 503, 504]))
+        self._executor = ThreadPoolExecutor(max_workers=num_workers)
+        # guards the validators, the counters and the pending downloads
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            validators_path, check_same_thread=False, isolation_level=None)
+        self._connection.executescript(SCHEMA)
+        self._pending_downloads = set()
+        self.downloads = 0
+        self.not_modified = 0
+        self.failures = 0
+
+    def submit(
+            self, url: str, on_download: Callable[[bytes], None],
+            revalidate: bool = True,
+            on_saved: Callable[[], None] = None) -> None:
+        """Downloads the image in the background and passes it to
+        on_download, unless it has not changed since it was last saved
+
+        Args:
+            url (str): image url
+            on_download (Callable[[bytes], None]): saves the image. It runs
+            in a download thread.
+            revalidate (bool, optional): only download the image if it has
+            changed. Use False when the saved image is missing.
+            on_saved (Callable[[], None], optional): called in the download
+            thread once the image is saved, or found not changed
+        """
+        future = self._executor.submit(
+            self._download_and_save, url, on_download, revalidate, on_saved)
+        with self._lock:
+            self._pending_downloads.add(future)
+        future.add_done_callback(self._download_done)
+
+    def download(self, url: str, revalidate: bool = False) -> Optional[bytes]:
+        """Downloads the image
+
+        Args:
+            url (str): image url
+            revalidate (bool, optional): only download the image if it has
+            changed since it was last saved
+
+        Returns:
+            Optional[bytes]: the image or None if it could not be downloaded
+            or has not changed
+        """
+        image, _, _ = self._download(url, revalidate)
+        return image
+
+    def flush(self) -> None:
+        """Waits until all the pending downloads are saved"""
+        while True:
+            with self._lock:
+                pending_downloads = list(self._pending_downloads)
+            if not pending_downloads:
+                break
+            wait(pending_downloads)
+
+    def close(self) -> None:
+        self.flush()
+        self._executor.shutdown()
+        with self._lock:
+            self._connection.close()
+
+    def stats(self) -> dict:
+        """Gets the number of downloaded, not modified and failed images"""
+        with self._lock:
+            return {'downloads': self.downloads,
+                    'not_modified': self.not_modified,
+                    'failures': self.failures}
+
+    def _download_and_save(self, url, on_download, revalidate, on_saved):
+        image, validators, not_modified = self._download(url, revalidate)
+        if image is None and not not_modified:
+            return
+        if image is not None:
+            try:
+                on_download(image)
+            except Exception as e:
+                print(f'Could not save the image {url}: {e}')
+                return
+            # the validators are only kept for the saved images
+            with self._lock:
+                self._connection.execute(
+                    'INSERT OR REPLACE INTO validators '
+                    '(url, etag, last_modified) VALUES (?, ?, ?)',
+                    (url, *validators))
+        if on_saved:
+            on_saved()
+
+    def _download(self, url, revalidate):
+        """Returns the image (None if it failed or has not changed), its
+        validators and whether it has not changed"""
+        headers = dict(self._headers)
+        if revalidate:
+            with self._lock:
+                row = self._connection.execute(
+                    'SELECT etag, last_modified FROM validators WHERE url = ?',
+                    (url,)).fetchone()
+            if row:
+                etag, last_modified = row
+                if etag:
+                    headers['If-None-Match'] = etag
+                if last_modified:
+                    headers['If-Modified-Since'] = last_modified
+        try:
+            with get_metrics().image_download_seconds.time():
+                response = self._http.request('GET', url, headers=headers)
+        except Exception as e:
+            print(f'Could not download the image {url}: {e}')
+            count_http_timeout('image_download', e)
+            self._count('failures')
+            return None, None, False
+        count_http_retries('image_download', response)
+        if response.status == 304:
+            self._count('not_modified')
+            return None, None, True
+        if response.status != 200:
+            print(f'Could not download the image {url}: '
+                  f'HTTP {response.status}')
+            self._count('failures')
+            return None, None, False
+        self._count('downloads')
+        validators = (response.headers.get('ETag'),
+                      response.headers.get('Last-Modified'))
+        return response.data, validators, False
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _download_done(self, future):
+        with self._lock:
+            self._pending_downloads.discard(future)
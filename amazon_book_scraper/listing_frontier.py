@@ -0,0 +1,93 @@
+"""Provides a persistent record of the walked listing pages, so a restart
+does not walk the pages it has already seen.
+"""
+import json
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+# default time (seconds) a walked listing page is trusted
+LISTING_TTL = 24 * 60 * 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    listing TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    urls TEXT NOT NULL,
+    is_last INTEGER NOT NULL,
+    seen REAL NOT NULL,
+    PRIMARY KEY (listing, page)
+) WITHOUT ROWID;
+"""
+
+
+class ListingFrontier:
+    """SQLite (WAL) record of the book urls found on each page of a listing
+    (e.g. a category url with a sort order) and when the page was seen. A
+    page seen within the ttl is not walked again; its urls are taken from
+    the record.
+    """
+    def __init__(self, path: str, ttl: float = LISTING_TTL) -> None:
+        """
+        Args:
+            path (str): path to the frontier database file
+            ttl (float, optional): time in seconds after which a page is
+            walked again
+        """
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.executescript(SCHEMA)
+
+    def record_page(
+            self, listing: str, page: int, urls: list[str],
+            is_last: bool) -> None:
+        """Records the book urls found on a listing page
+
+        Args:
+            listing (str): the listing key
+            page (int): the page number, starting from 1
+            urls (list[str]): the book urls on the page
+            is_last (bool): is it the last page of the listing
+        """
+        with self._lock:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO pages '
+                '(listing, page, urls, is_last, seen) VALUES (?, ?, ?, ?, ?)',
+                (listing, page, json.dumps(urls), int(is_last), time.time()))
+
+    def mark_last_page(self, listing: str, page: int) -> None:
+        """Records that the page has no next page"""
+        with self._lock:
+            self._connection.execute(
+                'UPDATE pages SET is_last = 1 WHERE listing = ? AND page = ?',
+                (listing, page))
+
+    def get_page(
+            self, listing: str, page: int) -> Optional[tuple[list[str], bool]]:
+        """Gets the recorded urls of a page if it was seen within the ttl
+
+        Args:
+            listing (str): the listing key
+            page (int): the page number
+
+        Returns:
+            Optional[tuple[list[str], bool]]: the book urls and if it is the
+            last page, or None if the page has to be walked
+        """
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT urls, is_last FROM pages WHERE listing = ? AND page = ? '
+                'AND seen >= ?',
+                (listing, page, time.time() - self._ttl)).fetchone()
+        if row is None:
+            return None
+        urls, is_last = row
+        return json.loads(urls), bool(is_last)
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,216 @@
+"""Provides an SQLite catalog of the books saved in a local raw data folder.
+It answers the resume queries with indexed lookups instead of walking the
+folder.
+"""
+import json
+import os
+import sqlite3
+import threading
+from os.path import join
+from typing import Iterable, Optional
+from utils import get_list_of_files
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS books (
+    isbn TEXT PRIMARY KEY,
+    book_url TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS reviews (
+    isbn TEXT NOT NULL,
+    user TEXT NOT NULL,
+    PRIMARY KEY (isbn, user)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS images (
+    isbn TEXT PRIMARY KEY,
+    hash TEXT
+) WITHOUT ROWID;
+"""
+
+
+class LocalCatalog:
+    """Catalog of the saved books, reviews and images. The database is in WAL
+    mode and every update is a single transaction, so the catalog stays
+    consistent if the scraper is killed. The catalog can be shared between
+    threads.
+    """
+    def __init__(self, path: str) -> None:
+        """
+        Args:
+            path (str): path to the catalog database file
+        """
+        self._path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.executescript(SCHEMA)
+        columns = [row[1] for row in self._connection.execute(
+            'PRAGMA table_info(images)')]
+        if 'hash' not in columns:
+            # catalogs created before the images were deduplicated
+            self._connection.execute('ALTER TABLE images ADD COLUMN hash TEXT')
+
+    def is_empty(self) -> bool:
+        """Is there no book in the catalog"""
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT 1 FROM books LIMIT 1').fetchone()
+        return row is None
+
+    def add_book(self, isbn: str, book_url: str, users: list[str]) -> None:
+        """Records a book (if new) and its saved reviews in one transaction
+
+        Args:
+            isbn (str): the book isbn
+            book_url (str): the book url. Not updated if the book exists.
+            users (list[str]): user names of the saved reviews
+        """
+        with self._lock, self._transaction():
+            self._connection.execute(
+                'INSERT OR IGNORE INTO books (isbn, book_url) VALUES (?, ?)',
+                (isbn, book_url))
+            self._connection.executemany(
+                'INSERT OR IGNORE INTO reviews (isbn, user) VALUES (?, ?)',
+                [(isbn, user) for user in users])
+
+    def add_image(self, isbn: str, image_hash: str = None) -> None:
+        """Records that the image of the book is saved
+
+        Args:
+            isbn (str): the book isbn
+            image_hash (str, optional): content hash of the image. None for
+            an image saved in the book folder (<isbn>.jpg).
+        """
+        with self._lock:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO images (isbn, hash) VALUES (?, ?)',
+                (isbn, image_hash))
+
+    def has_book(self, isbn: str) -> bool:
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT 1 FROM books WHERE isbn = ?', (isbn,)).fetchone()
+        return row is not None
+
+    def has_image(self, isbn: str) -> bool:
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT 1 FROM images WHERE isbn = ?', (isbn,)).fetchone()
+        return row is not None
+
+    def get_image_hash(self, isbn: str) -> Optional[str]:
+        """Gets the content hash of the saved image of the book, or None
+        if it has none or it is saved in the book folder"""
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT hash FROM images WHERE isbn = ?', (isbn,)).fetchone()
+        return row[0] if row else None
+
+    def get_book_urls(self, num_reviews: int) -> list[str]:
+        """Gets the urls of the books with at least num_reviews reviews"""
+        if num_reviews <= 0:
+            query, params = 'SELECT book_url FROM books', ()
+        else:
+            query = """
+                SELECT books.book_url FROM books JOIN (
+                    SELECT isbn FROM reviews GROUP BY isbn
+                    HAVING count(*) >= ?) AS counts
+                ON books.isbn = counts.isbn"""
+            params = (num_reviews,)
+        with self._lock:
+            rows = self._connection.execute(query, params).fetchall()
+        return [book_url for book_url, in rows]
+
+    def get_isbns(self) -> list[str]:
+        with self._lock:
+            rows = self._connection.execute('SELECT isbn FROM books').fetchall()
+        return [isbn for isbn, in rows]
+
+    def get_review_users(self, isbn: str) -> list[str]:
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT user FROM reviews WHERE isbn = ?', (isbn,)).fetchall()
+        return [user for user, in rows]
+
+    def get_books(self) -> list[tuple[str, str, list[str]]]:
+        """Gets the isbn, book url and review users of each book"""
+        with self._lock:
+            books = self._connection.execute(
+                'SELECT isbn, book_url FROM books').fetchall()
+            reviews = self._connection.execute(
+                'SELECT isbn, user FROM reviews').fetchall()
+        users = {}
+        for isbn, user in reviews:
+            users.setdefault(isbn, []).append(user)
+        return [(isbn, book_url, users.get(isbn, []))
+                for isbn, book_url in books]
+
+    def rebuild(
+            self, book_paths: Iterable[tuple[str, str]],
+            review_users: Optional[list[tuple[str, str]]] = None) -> None:
+        """Replaces the catalog with the content of the book folders
+        (<isbn>/data.json, reviews/<user>.json and image.json or
+        <isbn>.jpg)
+
+        Args:
+            book_paths (Iterable[tuple[str, str]]): the isbn and the folder
+            path of each saved book
+            review_users (list[tuple[str, str]], optional): the (isbn, user)
+            of the saved reviews when they are not stored in the folders
+        """
+        books, reviews, images = [], [], []
+        for isbn, book_path in book_paths:
+            try:
+                with open(join(book_path, 'data.json'), mode='r') as f:
+                    books.append((isbn, json.load(f)['book_url']))
+            except:
+                print(f'Could not read the attributes of {isbn}')
+                continue
+            review_path = join(book_path, 'reviews')
+            if review_users is None and os.path.isdir(review_path):
+                reviews += [(isbn, file[:-len('.json')])
+                            for file in get_list_of_files(review_path)
+                            if file.endswith('.json')]
+            try:
+                with open(join(book_path, 'image.json'), mode='r') as f:
+                    images.append((isbn, json.load(f)['hash']))
+            except (OSError, ValueError, KeyError):
+                if os.path.isfile(join(book_path, f'{isbn}.jpg')):
+                    images.append((isbn, None))
+        if review_users is not None:
+            saved_isbns = {isbn for isbn, _ in books}
+            reviews = [(isbn, user) for isbn, user in review_users
+                       if isbn in saved_isbns]
+        with self._lock, self._transaction():
+            for table in ('books', 'reviews', 'images'):
+                self._connection.execute(f'DELETE FROM {table}')
+            self._connection.executemany(
+                'INSERT INTO books (isbn, book_url) VALUES (?, ?)', books)
+            self._connection.executemany(
+                'INSERT OR IGNORE INTO reviews (isbn, user) VALUES (?, ?)',
+                reviews)
+            self._connection.executemany(
+                'INSERT INTO images (isbn, hash) VALUES (?, ?)', images)
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def _transaction(self):
+        return _Transaction(self._connection)
+
+
+class _Transaction:
+    """Runs the statements of the block in one transaction"""
+    def __init__(self, connection) -> None:
+        self._connection = connection
+
+    def __enter__(self):
+        self._connection.execute('BEGIN')
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self._connection.execute('COMMIT')
+        else:
+            self._connection.execute('ROLLBACK')
@@ -1,25 +1,78 @@
 """Provides the implementation of the local raw data storage class"""
 import dataclasses
+import hashlib
+import os
 from os.path import join
 import json
-import urllib.request
+import threading
+from typing import Callable, Iterator, Optional
 from entities import Book, BookAttribute, Review
+from image_downloader import ImageDownloader
+from local_catalog import LocalCatalog
 from raw_data_storage import RawDataStorage
-from utils import create_dir_if_not_exists, get_list_of_files
-from utils import get_list_of_dirs, is_dir_present
+from segment_log import SEGMENT_SIZE, SegmentLog
+from utils import create_dir_if_not_exists, get_list_of_dirs
+from utils import get_list_of_files, get_shard_dirs
 
 class LocalRawDataStorage(RawDataStorage):
     """This class provides methods for storing and retrieving scraped book
     data on the local machine. The object can be passed into the 
-    main scraper object"""
-    def __init__(self, path: str) -> None:
+    main scraper object.
+
+    The saved books are recorded in an SQLite catalog (raw_data_catalog.db)
+    next to the 'raw_data' folder, which answers the resume queries. The
+    catalog is built from the folder when it does not exist yet.
+
+    With the 'segments' layout the reviews are appended to a segment log
+    (raw_data_reviews folder) instead of one JSON file per review.
+
+    With shard_depth > 0 the book folders are spread over hash-sharded
+    folders (raw_data/ab/cd/<isbn>), so no folder grows with the corpus.
+    Books saved in the flat layout are still found in raw_data/<isbn> until
+    migrate_layout() moves them.
+
+    The cover images are downloaded in the background by an image
+    downloader. flush() waits for the pending downloads. Each image is
+    stored once under its content hash (raw_data_images/ab/<sha256>.jpg),
+    since many editions share a cover, and the book folder keeps a
+    reference to it (image.json).
+    """
+    def __init__(
+            self, path: str, layout: str = 'files',
+            segment_size: int = SEGMENT_SIZE, shard_depth: int = 0,
+            image_downloader: ImageDownloader = None) -> None:
         """
         Args:
             path (str): path to where the 'raw_data' folder containing all
             the scraped datashould be stored.
+            layout (str, optional): 'files' (a JSON file per review) or
+            'segments' (reviews appended to a segment log)
+            segment_size (int, optional): max size of a segment file in bytes
+            shard_depth (int, optional): number of shard folder levels.
+            0 is the flat layout (raw_data/<isbn>).
+            image_downloader (ImageDownloader, optional): downloads the
+            images. By default one is created that keeps the image
+            validators in raw_data_images.db.
         """
+        if layout not in ('files', 'segments'):
+            raise ValueError(f'Unknown layout: {layout}')
         self._path_to_raw_data = join(path, 'raw_data')
         create_dir_if_not_exists(self._path_to_raw_data)
+        self._path_to_images = join(path, 'raw_data_images')
+        self._shard_depth = shard_depth
+        self._review_log = None
+        if layout == 'segments':
+            self._review_log = SegmentLog(
+                join(path, 'raw_data_reviews'), segment_size=segment_size)
+        catalog_path = join(path, 'raw_data_catalog.db')
+        is_new_catalog = not os.path.isfile(catalog_path)
+        self._catalog = LocalCatalog(catalog_path)
+        if is_new_catalog and get_list_of_dirs(self._path_to_raw_data):
+            self.rebuild_catalog()
+        if image_downloader is None:
+            image_downloader = ImageDownloader(
+                validators_path=join(path, 'raw_data_images.db'))
+        self._image_downloader = image_downloader
 
     def save_book(self, book: Book, saved_isbns: str) -> None:
         """Saves a book object
@@ -29,11 +82,15 @@ class LocalRawDataStorage(RawDataStorage):
             saved_isbns (str): list if isbns for which the
             attributes are already saved. Only reviews are new.
         """
-        book_path = join(self._path_to_raw_data, book.attributes.isbn)
+        isbn = book.attributes.isbn
+        book_path = self._get_book_path(isbn)
         reviews_path = join(book_path, 'reviews')
-        if book.attributes.isbn not in saved_isbns:
+        if isbn not in saved_isbns:
             self._save_book_attributes(book.attributes, book_path)
-        self._save_reviews(book.reviews, reviews_path)
+        users = self._save_reviews(book.reviews, reviews_path, isbn)
+        # the files are written first, so the catalog never lists
+        # a missing file
+        self._catalog.add_book(isbn, book.attributes.book_url, users)
 
     def get_saved_book_urls(self, num_reviews: int) -> list[str]:
         """Get all the saved book urls. It does not return books with
@@ -45,26 +102,11 @@ class LocalRawDataStorage(RawDataStorage):
         Returns:
             list[str]: list of saved book urls
         """
-        path = self._path_to_raw_data
-        # get all saved book isbn numbers
-        book_isbns = get_list_of_dirs(path)
-        book_urls = []
-        for book_isbn in book_isbns:
-            review_path = join(path, book_isbn, 'reviews')
-            saved_reviews = get_list_of_files(review_path)
-            num_saved = len(saved_reviews)
-            if num_saved >= num_reviews:
-                attribute_path = join(path, book_isbn, 'data.json')
-                with open(attribute_path, mode='r') as f:
-                    attr_dict = json.load(f)
-                book_url = attr_dict['book_url']
-                book_urls.append(book_url)
-        return book_urls
+        return self._catalog.get_book_urls(num_reviews)
 
     def get_saved_book_isbns(self):
         """Gets all saved book isbn numbers"""
-        path = self._path_to_raw_data
-        return get_list_of_dirs(path)
+        return self._catalog.get_isbns()
 
     def get_saved_review_users(self, isbn: str) -> list[str]:
         """Get all the user names of the saved reviews of a particular book.
@@ -75,39 +117,194 @@ class LocalRawDataStorage(RawDataStorage):
         Returns:
             list[str]: list of user names of reviews
         """
-        path = self._path_to_raw_data
-        # get all saved book isbn numbers
-        if not is_dir_present(isbn, path):
-            return []
+        return self._catalog.get_review_users(isbn)
 
-        review_path = join(path, isbn, 'reviews')
-        saved_reviews = get_list_of_files(review_path)
-        saved_reviews = [user.split('json')[0][:-1] for user in saved_reviews]
-        return saved_reviews
+    def get_saved_books(self) -> list[tuple[str, str, list[str]]]:
+        """Gets the isbn, book url and review users of each saved book"""
+        return self._catalog.get_books()
 
-    def save_book_image(self, url: str, isbn: str) -> None:
-        """Saves an image from the given url to the specified book
+    def save_book_image(self, url: str, isbn: str,
+                        on_saved: Callable[[], None] = None) -> None:
+        """Saves an image from the given url to the specified book. The
+        image is downloaded in the background; a saved image is only
+        downloaded again if it has changed, and only written if no book
+        has the same image yet.
 
         Args:
             url (str): image url
             isbn (str): the book isbn
+            on_saved (Callable[[], None], optional): called in the download
+            thread once the image is saved
         """
-        if not is_dir_present(isbn, self._path_to_raw_data):
+        if not self._catalog.has_book(isbn):
             raise Exception('Book data folder does not exist.')
-        image_path = join(self._path_to_raw_data, isbn, f'{isbn}.jpg')
-        try:
-            urllib.request.urlretrieve(url, filename=image_path)
-        except:
-            print(f"Could not save image for {isbn}")
-
-    def _save_reviews(self, reviews, path):
-        create_dir_if_not_exists(path)
+        book_path = self._get_book_path(isbn)
+
+        def save(image):
+            image_hash = hashlib.sha256(image).hexdigest()
+            image_path = self._get_image_file_path(image_hash)
+            if not os.path.isfile(image_path):
+                os.makedirs(os.path.dirname(image_path), exist_ok=True)
+                _write_file(image_path, image)
+            if self._catalog.get_image_hash(isbn) != image_hash:
+                reference = json.dumps({'hash': image_hash, 'url': url})
+                _write_file(join(book_path, 'image.json'),
+                            reference.encode('utf-8'))
+                self._catalog.add_image(isbn, image_hash)
+
+        image_path = self.get_image_path(isbn)
+        is_saved = image_path is not None and os.path.isfile(image_path)
+        self._image_downloader.submit(
+            url, save, revalidate=is_saved, on_saved=on_saved)
+
+    def get_image_path(self, isbn: str) -> Optional[str]:
+        """Gets the path of the saved image of a book
+
+        Args:
+            isbn (str): the book isbn
+
+        Returns:
+            Optional[str]: the image path or None if it has no saved image
+        """
+        if not self._catalog.has_image(isbn):
+            return None
+        image_hash = self._catalog.get_image_hash(isbn)
+        if image_hash is None:
+            # saved before the images were deduplicated
+            return join(self._get_book_path(isbn), f'{isbn}.jpg')
+        return self._get_image_file_path(image_hash)
+
+    def flush(self) -> None:
+        """Waits until all the pending image downloads are saved"""
+        self._image_downloader.flush()
+
+    def get_review(self, isbn: str, user: str) -> Optional[Review]:
+        """Gets a saved review
+
+        Args:
+            isbn (str): the book isbn
+            user (str): the review user name
+
+        Returns:
+            Optional[Review]: the review or None if it is not saved
+        """
+        if self._review_log is not None:
+            record = self._review_log.get(isbn, user)
+            if record is None:
+                return None
+            return Review(**json.loads(bytes(record)))
+        review_path = join(self._get_book_path(isbn), 'reviews',
+                           f'{user}.json')
+        if not os.path.isfile(review_path):
+            return None
+        with open(review_path, mode='r') as f:
+            return Review(**json.load(f))
+
+    def iter_reviews(self) -> Iterator[Review]:
+        """Iterates over all the saved reviews. With the 'segments' layout
+        the reviews are read sequentially from the segment files.
+
+        Yields:
+            Review: a saved review
+        """
+        if self._review_log is not None:
+            for record in self._review_log.scan():
+                yield Review(**json.loads(bytes(record)))
+            return
+        for _, book_path in self._iter_book_paths():
+            review_path = join(book_path, 'reviews')
+            if not os.path.isdir(review_path):
+                continue
+            for file in get_list_of_files(review_path):
+                with open(join(review_path, file), mode='r') as f:
+                    yield Review(**json.load(f))
+
+    def rebuild_catalog(self) -> None:
+        """Rebuilds the catalog from the files in the 'raw_data' folder,
+        e.g. after the folder was copied or edited by hand"""
+        review_users = None
+        if self._review_log is not None:
+            review_users = [(review.isbn, review.user)
+                            for review in self.iter_reviews()]
+        self._catalog.rebuild(self._iter_book_paths(), review_users)
+
+    def migrate_layout(self) -> int:
+        """Moves the book folders that are not in the configured layout
+        (e.g. flat folders after shard_depth was set) to their place. Each
+        folder is moved with a single rename.
+
+        It must not run while a scraper is saving to the folder: a book
+        folder renamed during a save makes the save fail.
+
+        Returns:
+            int: number of moved book folders
+        """
+        num_moved = 0
+        for isbn, book_path in list(self._iter_book_paths()):
+            new_book_path = self._get_sharded_book_path(isbn)
+            if book_path == new_book_path:
+                continue
+            os.makedirs(os.path.dirname(new_book_path), exist_ok=True)
+            try:
+                os.rename(book_path, new_book_path)
+                num_moved += 1
+            except OSError:
+                print(f'Could not move the folder of {isbn}')
+        return num_moved
+
+    def close(self):
+        """Closes the image downloader, the catalog and the review log"""
+        self.flush()
+        self._image_downloader.close()
+        self._catalog.close()
+        if self._review_log is not None:
+            self._review_log.close()
+
+    def _get_image_file_path(self, image_hash):
+        return join(self._path_to_images, image_hash[:2], f'{image_hash}.jpg')
+
+    def _get_sharded_book_path(self, isbn):
+        shard_dirs = get_shard_dirs(isbn, self._shard_depth)
+        return join(self._path_to_raw_data, *shard_dirs, isbn)
+
+    def _get_book_path(self, isbn):
+        """Gets the folder of the book. A book saved in the flat layout is
+        kept there until it is migrated."""
+        book_path = self._get_sharded_book_path(isbn)
+        if self._shard_depth and not os.path.isdir(book_path):
+            flat_book_path = join(self._path_to_raw_data, isbn)
+            if os.path.isdir(flat_book_path):
+                return flat_book_path
+        return book_path
+
+    def _iter_book_paths(self, path=None, level=0):
+        """Iterates over the isbn and the folder of the saved books in any
+        layout. A book folder has a data.json file, other folders are shard
+        folders."""
+        path = path or self._path_to_raw_data
+        for name in get_list_of_dirs(path):
+            dir_path = join(path, name)
+            if os.path.isfile(join(dir_path, 'data.json')):
+                yield name, dir_path
+            elif level < self._shard_depth:
+                yield from self._iter_book_paths(dir_path, level + 1)
+
+    def _save_reviews(self, reviews, path, isbn):
+        if self._review_log is None:
+            create_dir_if_not_exists(path)
         # get all reviews by their users name
-        saved_users = get_list_of_files(path)
+        saved_users = set(self._catalog.get_review_users(isbn))
         # save all nonexisting reviews
+        users = []
         for review in reviews:
             if review.user not in saved_users:
-                self._save_review(review, path)
+                if self._review_log is None:
+                    self._save_review(review, path)
+                else:
+                    self._append_review(review)
+                saved_users.add(review.user)
+                users.append(review.user)
+        return users
 
     @staticmethod
     def _save_review(review, path):
@@ -116,10 +313,26 @@ class LocalRawDataStorage(RawDataStorage):
         with open(f"{path}/{review.user}.json", mode='w') as f:
             json.dump(dataclasses.asdict(review), f)
 
+    def _append_review(self, review):
+        if not isinstance(review, Review):
+            raise TypeError('Invalid type for review')
+        payload = json.dumps(dataclasses.asdict(review)).encode('utf-8')
+        self._review_log.append(review.isbn, review.user, payload)
+
     @staticmethod
     def _save_book_attributes(book_attributes, path):
         if not isinstance(book_attributes, BookAttribute):
             raise TypeError('Invalid type for book attribute')
+        # the shard folders
+        os.makedirs(os.path.dirname(path), exist_ok=True)
         if create_dir_if_not_exists(path):
             with open(f"{path}/data.json", mode='w') as f:
-                json.dump(dataclasses.asdict(book_attributes), f)
\ No newline at end of file
+                json.dump(dataclasses.asdict(book_attributes), f)
+
+
+def _write_file(path, content):
+    """Writes the file and renames it, so a partial file is never seen"""
+    temp_path = f'{path}.{threading.get_ident()}.tmp'
+    with open(temp_path, mode='wb') as f:
+        f.write(content)
+    os.replace(temp_path, path)
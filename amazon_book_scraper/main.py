@@ -1,5 +1,6 @@
 import sys
 from os import getcwd
+from os.path import join
 from prometheus_client import start_http_server
 from local_raw_data_storage import LocalRawDataStorage
 from s3_raw_data_storage import S3RawDataStorage
@@ -7,6 +8,12 @@ from aws_postgres_data_storage import AWSPostgresRDSDataStorage
 from amazon_book_attribute_scraper import AmazonBookAttributeScraper
 from amazon_automated_book_review_scraper import AmazonAutomatedBookReviewScraper
 from amazon_automated_book_scraper import AmazonAutomatedBookScraper
+from page_cache import PageCache
+from snapshot_archive import SnapshotArchive
+from page_fetcher import HTTPPageFetcher
+from scrape_journal import ScrapeJournal
+from listing_frontier import ListingFrontier
+from tracing import BookProfiler, Tracer
 
 url = "https://www.amazon.com/s?i=stripbooks&rh=n%3A25&fs=true&qid=1645782603&ref=sr_pg_1"
 # specify a list of banned title pharses that are likely to be of
@@ -18,10 +25,19 @@ banned_titles = [
     "Users's Manual",
 ]
 # object that scrapes attributes of single book
-abas = AmazonBookAttributeScraper(banned_titles=banned_titles)
+# book pages are fetched over plain HTTP, the browser is only used for
+# pages that can not be scraped without it. Pages loaded in the browser are
+# scraped from a snapshot of their source. The pages are cached on disk, so
+# a restart does not load them again.
+page_cache = PageCache(join(getcwd(), 'page_cache'))
+# the scraped book and review pages are archived for replay.py
+archive = SnapshotArchive(join(getcwd(), 'snapshot_archive'))
+abas = AmazonBookAttributeScraper(
+    banned_titles=banned_titles, page_fetcher=HTTPPageFetcher(),
+    snapshot=True, page_cache=page_cache, archive=archive)
 
 # object that scrapes reviews of a single book
-aabrs = AmazonAutomatedBookReviewScraper()
+aabrs = AmazonAutomatedBookReviewScraper(archive=archive)
 
 # choose and initialize raw storage object: local or S3 bucket
 # raw_storage = LocalRawDataStorage(path=getcwd())
@@ -39,10 +55,24 @@ rds_param = {'DATABASE_TYPE': 'postgresql',
 rds_storage = AWSPostgresRDSDataStorage(rds_param)
 # rds_storage = None
 
+# journal of the scraping progress, a restart continues where it stopped
+journal = ScrapeJournal(join(getcwd(), 'scrape_journal.db'))
+# the listing pages seen within a day are not walked again
+frontier = ListingFrontier(join(getcwd(), 'listing_frontier.db'))
+
+# a span per book and its stages (chrome://tracing), to find slow books
+tracer = Tracer(join(getcwd(), 'scrape_trace.json'), trace_format='chrome')
+# profiling of the first books is optional
+# profiler = BookProfiler(join(getcwd(), 'scrape_books.prof'), num_books=20)
+profiler = None
+
 # start the prometheus metric exporter
 # arg: port number
 start_http_server(9200)
 
+# number of books scraped in parallel, each with its own browser
+num_workers = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+
 # initialize the scraper object
 aabs = AmazonAutomatedBookScraper(
     url=url,
@@ -52,10 +82,24 @@ aabs = AmazonAutomatedBookScraper(
     rds_data_storage=rds_storage,
     browser='chrome',
     mode='headless',
-    export_metric=True)
+    export_metric=True,
+    num_workers=num_workers,
+    journal=journal,
+    frontier=frontier,
+    tracer=tracer,
+    profiler=profiler)
 
     
 # run the scraper
 num_books = int(sys.argv[1])
 num_reviews = int(sys.argv[2])
-aabs.scrape_books(num_books=num_books, num_reviews=num_reviews)
+try:
+    aabs.scrape_books(num_books=num_books, num_reviews=num_reviews)
+finally:
+    # save anything the storages still have pending
+    raw_storage.close()
+    if rds_storage:
+        rds_storage.close()
+    journal.close()
+    frontier.close()
+    tracer.close()
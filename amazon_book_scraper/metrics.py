@@ -0,0 +1,169 @@
+"""Provides the Prometheus metrics of the scraping pipeline stages. The
+metrics are no-op until enable_metrics() is called (e.g. by the scraper with
+export_metric=True), so the stages can always record them.
+
+Usage:
+    with get_metrics().s3_put_seconds.labels(object='review').time():
+        ...
+    get_metrics().books_skipped.inc()
+"""
+from contextlib import nullcontext
+import weakref
+from prometheus_client import REGISTRY, CollectorRegistry
+from prometheus_client import Counter, Gauge, Histogram
+from urllib3.exceptions import MaxRetryError, TimeoutError
+
+# latency buckets in seconds, from an in-process extractor to a slow page load
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+                   5.0, 10.0, 30.0, 60.0)
+
+# name -> (type, description, label names)
+METRICS = {
+    'books_to_scrape': (
+        Gauge, 'The number of books to scrape in the current session.', ()),
+    'page_load_seconds': (
+        Histogram, 'Time to load a page in the webdriver or over HTTP.',
+        ('page_type', 'source')),
+    'dom_wait_seconds': (
+        Histogram, 'Time waited for a page to be ready after a navigation.',
+        ('navigation',)),
+    'extractor_seconds': (
+        Histogram, 'Time to extract a book attribute from a page.',
+        ('attribute',)),
+    'review_page_seconds': (
+        Histogram, 'Time to scrape a review page and go to the next one.', ()),
+    's3_put_seconds': (
+        Histogram, 'Time to upload an object to S3.', ('object',)),
+    'rds_write_seconds': (
+        Histogram, 'Time to write a batch of rows to RDS.', ()),
+    'image_download_seconds': (
+        Histogram, 'Time to download a cover image.', ()),
+    'books_skipped': (
+        Counter, 'Books skipped because their attributes could not be '
+        'scraped.', ()),
+    'books_banned': (
+        Counter, 'Books dropped because of a banned phrase in the title.', ()),
+    'books_invalid': (
+        Counter, 'Books dropped because of a missing or invalid attribute.',
+        ('reason',)),
+    'page_cache_hits': (
+        Counter, 'Pages taken from the page cache.', ('page_type',)),
+    'page_cache_misses': (
+        Counter, 'Pages not in the page cache or expired.', ('page_type',)),
+    'page_cache_evictions': (
+        Counter, 'Pages removed from the full page cache.', ()),
+    'retries': (
+        Counter, 'Retried requests.', ('stage',)),
+    'timeouts': (
+        Counter, 'Requests and waits that timed out.', ('stage',)),
+}
+
+
+class PipelineMetrics:
+    """The Prometheus metrics of the pipeline stages. Each metric of
+    METRICS is an attribute."""
+    def __init__(self, registry: CollectorRegistry = REGISTRY) -> None:
+        """
+        Args:
+            registry (CollectorRegistry, optional): registry the metrics are
+            exported from
+        """
+        for name, (metric_type, description, labels) in METRICS.items():
+            kwargs = {}
+            if metric_type is Histogram:
+                kwargs['buckets'] = LATENCY_BUCKETS
+            setattr(self, name, metric_type(
+                name, description, labels, registry=registry, **kwargs))
+
+
+class _NoOpMetric:
+    """Accepts the calls of a Prometheus metric and records nothing"""
+    def labels(self, *args, **kwargs):
+        return self
+
+    def observe(self, amount):
+        pass
+
+    def inc(self, amount=1):
+        pass
+
+    def dec(self, amount=1):
+        pass
+
+    def set(self, value):
+        pass
+
+    def time(self):
+        return nullcontext()
+
+
+class NoOpMetrics(PipelineMetrics):
+    """The metrics when exporting them is disabled"""
+    def __init__(self) -> None:
+        for name in METRICS:
+            setattr(self, name, _NoOpMetric())
+
+
+# the metrics of the application
+_metrics = NoOpMetrics()
+# registry -> its metrics. A metric can be registered only once, so the
+# metrics are reused when they are enabled again.
+_registry_metrics = weakref.WeakKeyDictionary()
+
+
+def get_metrics() -> PipelineMetrics:
+    """Gets the metrics of the application (no-op unless enabled)"""
+    return _metrics
+
+
+def enable_metrics(registry: CollectorRegistry = None) -> PipelineMetrics:
+    """Enables the metrics. They are created once per registry, later
+    calls return the enabled metrics.
+
+    Args:
+        registry (CollectorRegistry, optional): registry the metrics are
+        exported from. Defaults to the global Prometheus registry.
+
+    Returns:
+        PipelineMetrics: the enabled metrics
+    """
+    global _metrics
+    if isinstance(_metrics, NoOpMetrics):
+        if registry is None:
+            registry = REGISTRY
+        if registry not in _registry_metrics:
+            _registry_metrics[registry] = PipelineMetrics(registry)
+        _metrics = _registry_metrics[registry]
+    return _metrics
+
+
+def disable_metrics() -> None:
+    """Disables the metrics. They stay registered and are reused when
+    enabled again."""
+    global _metrics
+    _metrics = NoOpMetrics()
+
+
+def count_http_retries(stage: str, response) -> None:
+    """Counts the retries urllib3 made for a response
+
+    Args:
+        stage (str): the pipeline stage of the request
+        response (urllib3.HTTPResponse): the response
+    """
+    if response.retries is not None and response.retries.history:
+        _metrics.retries.labels(stage=stage).inc(
+            len(response.retries.history))
+
+
+def count_http_timeout(stage: str, error: Exception) -> None:
+    """Counts the failed urllib3 request if it timed out
+
+    Args:
+        stage (str): the pipeline stage of the request
+        error (Exception): the error of the request
+    """
+    if isinstance(error, MaxRetryError):
+        error = error.reason
+    if isinstance(error, TimeoutError):
+        _metrics.timeouts.labels(stage=stage).inc()
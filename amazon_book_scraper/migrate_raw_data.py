@@ -0,0 +1,53 @@
+"""Migrates a raw data tree to the hash-sharded layout (or to another shard
+depth). Stop the scrapers saving to the tree before running it.
+
+Usage:
+    python migrate_raw_data.py local <path> --shard-depth 2
+    python migrate_raw_data.py s3 <bucket> [--path <path>] --shard-depth 2
+"""
+import argparse
+from local_raw_data_storage import LocalRawDataStorage
+from s3_raw_data_storage import S3RawDataStorage
+
+
+def migrate(args) -> int:
+    """Moves the books of the storage given by the arguments to the
+    configured layout
+
+    Args:
+        args (argparse.Namespace): the parsed command line arguments
+
+    Returns:
+        int: number of moved books
+    """
+    if args.storage == 'local':
+        storage = LocalRawDataStorage(
+            path=args.location, shard_depth=args.shard_depth)
+    else:
+        storage = S3RawDataStorage(
+            path=args.path, bucket=args.location,
+            shard_depth=args.shard_depth)
+    try:
+        return storage.migrate_layout()
+    finally:
+        storage.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Moves the saved books to the hash-sharded layout')
+    parser.add_argument('storage', choices=['local', 's3'])
+    parser.add_argument(
+        'location', help='local path of the raw_data folder or S3 bucket')
+    parser.add_argument(
+        '--path', default=None, help='path of the raw_data folder in the bucket')
+    parser.add_argument(
+        '--shard-depth', type=int, default=2,
+        help='number of shard levels (0 is the flat layout)')
+    args = parser.parse_args(argv)
+    num_moved = migrate(args)
+    print(f'Moved {num_moved} books')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+"""Provides an on-disk cache of web pages, so a page loaded in an earlier
+(e.g. crashed) run is not fetched again.
+"""
+from collections import OrderedDict
+import gzip
+import hashlib
+import os
+import threading
+import time
+from os.path import join
+from typing import Iterator, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from metrics import get_metrics
+
+# default time (seconds) a cached page is used per page type. Only the book
+# pages are cached: the review pages of a book are replaced in place under
+# the same url and the listing pages are recorded by the listing frontier.
+PAGE_TTLS = {
+    'book_page': 7 * 24 * 60 * 60,
+}
+# default max size of the cache (bytes)
+CACHE_SIZE = 1024 * 1024 * 1024
+# tracking url parameters that do not change the page
+IGNORED_PARAMS = {'ref', 'ref_', 'qid', 'sr', 'crid', 'sprefix', 'keywords',
+                  'pd_rd_r', 'pd_rd_w', 'pd_rd_wg', 'pf_rd_r', 'pf_rd_p'}
+
+
+def normalize_url(url: str) -> str:
+    """Normalizes a url so that the urls of the same page are equal: the
+    tracking parameters (and Amazon's '/ref=...' path suffix), a trailing
+    slash and the fragment are dropped and the parameters are sorted.
+
+    Args:
+        url (str): page url
+
+    Returns:
+        str: the normalized url
+    """
+    parts = urlsplit(url)
+    path = parts.path.split('/ref=')[0].rstrip('/') or '/'
+    query = sorted((key, value) for key, value in parse_qsl(parts.query)
+                   if key not in IGNORED_PARAMS)
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path,
+                       urlencode(query), ''))
+
+
+class PageCache:
+    """Cache of gzipped pages on disk, keyed by the sha256 of the normalized
+    url. A page is used until the ttl of its page type expires. When the
+    cache grows over max_size the least recently used pages are removed.
+    The cache can be shared between threads.
+    """
+    def __init__(
+            self, path: str, max_size: int = CACHE_SIZE,
+            ttls: dict = None) -> None:
+        """
+        Args:
+            path (str): path to the cache folder
+            max_size (int, optional): max size of the cache in bytes
+            ttls (dict, optional): time in seconds a page is used per page
+            type (see PAGE_TTLS)
+        """
+        os.makedirs(path, exist_ok=True)
+        self._path = path
+        self._max_size = max_size
+        self._ttls = dict(PAGE_TTLS if ttls is None else ttls)
+        self._lock = threading.Lock()
+        # key -> file size, in least recently used order
+        self._entries = OrderedDict()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._load_entries()
+
+    def get(self, url: str, page_type: str = 'book_page') -> Optional[str]:
+        """Gets a cached page
+
+        Args:
+            url (str): page url
+            page_type (str, optional): page type that selects the ttl
+
+        Returns:
+            Optional[str]: the page html or None if it is not cached or
+            expired
+        """
+        key = self._get_key(url)
+        file_path = self._get_file_path(key)
+        ttl = self._ttls.get(page_type, 0)
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                get_metrics().page_cache_misses.labels(
+                    page_type=page_type).inc()
+                return None
+            try:
+                is_expired = os.path.getmtime(file_path) < time.time() - ttl
+            except OSError:
+                is_expired = True
+            if is_expired:
+                self.misses += 1
+                get_metrics().page_cache_misses.labels(
+                    page_type=page_type).inc()
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            get_metrics().page_cache_hits.labels(page_type=page_type).inc()
+        try:
+            _, page_source = self.read_page(file_path)
+        except (OSError, EOFError, ValueError):
+            print(f'Could not read the cached page of {url}')
+            return None
+        return page_source
+
+    def put(self, url: str, page_source: str) -> None:
+        """Caches a page
+
+        Args:
+            url (str): page url
+            page_source (str): the page html
+        """
+        key = self._get_key(url)
+        file_path = self._get_file_path(key)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        body = gzip.compress(f'{url}\n{page_source}'.encode('utf-8'))
+        # write and rename, so a reader never sees a partial file
+        temp_path = f'{file_path}.{threading.get_ident()}.tmp'
+        with open(temp_path, mode='wb') as f:
+            f.write(body)
+        os.replace(temp_path, file_path)
+        with self._lock:
+            self._size += len(body) - self._entries.pop(key, 0)
+            self._entries[key] = len(body)
+            self._evict()
+
+    def iter_pages(self) -> Iterator[tuple[str, str]]:
+        """Iterates over all the cached pages regardless of their ttl
+
+        Yields:
+            tuple[str, str]: the url and the html of a page
+        """
+        with self._lock:
+            keys = list(self._entries)
+        for key in keys:
+            try:
+                yield self.read_page(self._get_file_path(key))
+            except (OSError, EOFError, ValueError):
+                # evicted in the meantime
+                continue
+
+    def get_page_files(self) -> list[str]:
+        """Gets the paths of all the cached page files, e.g. to read them in
+        other processes with read_page"""
+        with self._lock:
+            return [self._get_file_path(key) for key in self._entries]
+
+    def stats(self) -> dict:
+        """Gets the number of hits, misses and evictions, the number of
+        cached pages and their size in bytes"""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions,
+                    'pages': len(self._entries), 'size': self._size}
+
+    def _evict(self):
+        while self._size > self._max_size and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._size -= size
+            self.evictions += 1
+            get_metrics().page_cache_evictions.inc()
+            try:
+                os.remove(self._get_file_path(key))
+            except OSError:
+                pass
+
+    def _load_entries(self):
+        """Finds the cached pages, the oldest written is used least
+        recently"""
+        entries = []
+        for dir_path, _, files in os.walk(self._path):
+            for file in files:
+                file_path = join(dir_path, file)
+                if file.endswith('.tmp'):
+                    os.remove(file_path)
+                    continue
+                stat = os.stat(file_path)
+                entries.append((stat.st_mtime, file[:-len('.html.gz')],
+                                stat.st_size))
+        for _, key, size in sorted(entries):
+            self._entries[key] = size
+            self._size += size
+
+    def _get_file_path(self, key):
+        return join(self._path, key[:2], f'{key}.html.gz')
+
+    @staticmethod
+    def _get_key(url):
+        return hashlib.sha256(normalize_url(url).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def read_page(file_path: str) -> tuple[str, str]:
+        """Reads a cached page file
+
+        Args:
+            file_path (str): path to the page file (see get_page_files)
+
+        Returns:
+            tuple[str, str]: the url and the html of the page
+        """
+        with open(file_path, mode='rb') as f:
+            content = gzip.decompress(f.read()).decode('utf-8')
+        url, page_source = content.split('\n', 1)
+        return url, page_source
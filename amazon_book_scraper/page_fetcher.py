@@ -0,0 +1,75 @@
+"""Provides classes for fetching web pages without a browser."""
+from abc import ABC, abstractmethod
+from typing import Optional
+import urllib3
+from html_document import HTMLDocument
+from metrics import count_http_retries, count_http_timeout
+from utils import TIME_OUT
+
+# browser-like request headers. Sites often block the default user agent
+# of HTTP libraries.
+DEFAULT_HEADERS = {
+    'User-Agent': ('Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 '
+                   '(KHTML, like Gecko) Chrome/98.0.4758.102 Safari/537.36'),
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.9',
+}
+
+
+class PageFetcher(ABC):
+    """The abstract class for fetching a page as a static HTML document.
+    Scrapers fall back to the webdriver for the pages that can not be
+    fetched.
+    """
+    @abstractmethod
+    def fetch(self, url: str) -> Optional[HTMLDocument]:
+        pass
+
+
+class HTTPPageFetcher(PageFetcher):
+    """Fetches pages with a plain HTTP client. The connections are pooled and
+    kept alive across requests, which is much cheaper than loading the page in
+    a browser. The fetcher can be shared between threads.
+    """
+    def __init__(
+            self, pool_size: int = 10, headers: dict = None,
+            time_out: float = TIME_OUT, retries: int = 2) -> None:
+        """
+        Args:
+            pool_size (int, optional): number of connections kept per host
+            headers (dict, optional): request headers
+            time_out (float, optional): request time out in seconds
+            retries (int, optional): number of retries on connection errors
+            and server errors
+        """
+        self._headers = dict(DEFAULT_HEADERS if headers is None else headers)
+        self._http = urllib3.PoolManager(
+            maxsize=pool_size,
+            block=False,
+            timeout=urllib3.Timeout(total=time_out),
+            retries=urllib3.Retry(
+                total=retries, backoff_factor=0.5,
+                status_forcelist=[500, 502, 503, 504]))
+
+    def fetch(self, url: str) -> Optional[HTMLDocument]:
+        """Fetches the page at the given url
+
+        Args:
+            url (str): page url
+
+        Returns:
+            Optional[HTMLDocument]: the parsed page or None if the page could
+            not be fetched
+        """
+        try:
+            response = self._http.request('GET', url, headers=self._headers)
+        except Exception as e:
+            print(f'Could not fetch {url}: {e}')
+            count_http_timeout('page_fetch', e)
+            return None
+        count_http_retries('page_fetch', response)
+        if response.status != 200:
+            print(f'Could not fetch {url}: HTTP {response.status}')
+            return None
+        page_source = response.data.decode('utf-8', errors='replace')
+        return HTMLDocument(page_source, url=response.geturl() or url)
@@ -0,0 +1,89 @@
+"""Provides waits for a page to become ready after a navigation. They wait
+on concrete DOM conditions instead of sleeping for a fixed time, and record
+how long each type of navigation actually waited.
+"""
+import threading
+import time
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+from metrics import get_metrics
+from utils import TIME_OUT
+
+# how often the conditions are checked (seconds)
+POLL_FREQUENCY = 0.1
+
+
+class NavigationWaitTimes:
+    """Thread safe record of the page wait times per navigation type
+    (e.g. 'book_page', 'next_review_page')"""
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._wait_times = {}
+
+    def record(self, navigation: str, seconds: float) -> None:
+        with self._lock:
+            count, total, maximum = self._wait_times.get(navigation, (0, 0, 0))
+            self._wait_times[navigation] = (
+                count + 1, total + seconds, max(maximum, seconds))
+
+    def summary(self) -> dict:
+        """Returns the count, total, mean and max wait time (seconds) of
+        each navigation type"""
+        with self._lock:
+            return {navigation: {'count': count,
+                                 'total': total,
+                                 'mean': total / count,
+                                 'max': maximum}
+                    for navigation, (count, total, maximum)
+                    in self._wait_times.items()}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._wait_times = {}
+
+
+# the wait times of all the navigations of the application
+navigation_wait_times = NavigationWaitTimes()
+
+
+def wait_for_page_ready(
+        driver, navigation: str, stale_element=None, condition=None,
+        time_out: float = TIME_OUT) -> float:
+    """Waits until the page is ready after a navigation: the given element of
+    the previous page is detached (the page or a part of it was replaced),
+    the document is loaded and the optional condition is met. A static page
+    is always ready.
+
+    Args:
+        driver (webdriver): webdriver
+        navigation (str): navigation type the wait time is recorded for
+        stale_element (WebElement, optional): element of the previous page
+        that is replaced by the navigation
+        condition (callable, optional): additional expected condition
+        time_out (float, optional): maximum wait time in seconds
+
+    Returns:
+        float: the wait time in seconds
+    """
+    start = time.perf_counter()
+    if not getattr(driver, 'is_static', False):
+        wait = WebDriverWait(driver, time_out, poll_frequency=POLL_FREQUENCY)
+        try:
+            if stale_element is not None:
+                wait.until(EC.staleness_of(stale_element))
+            wait.until(_document_is_loaded)
+            if condition is not None:
+                wait.until(condition)
+        except TimeoutException:
+            print(f'Timed out waiting for the {navigation} to be ready')
+            get_metrics().timeouts.labels(stage='dom_wait').inc()
+    wait_time = time.perf_counter() - start
+    navigation_wait_times.record(navigation, wait_time)
+    get_metrics().dom_wait_seconds.labels(navigation=navigation).observe(
+        wait_time)
+    return wait_time
+
+
+def _document_is_loaded(driver) -> bool:
+    return driver.execute_script('return document.readyState') == 'complete'
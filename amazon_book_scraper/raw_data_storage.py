@@ -1,5 +1,6 @@
 """Provides the abstract class for raw data storage"""
 from abc import ABC, abstractmethod
+from typing import Callable
 from entities import Book
 
 class RawDataStorage(ABC):
@@ -9,7 +10,10 @@ class RawDataStorage(ABC):
         pass
     
     @abstractmethod
-    def save_book_image(self, url: str, isbn: str):
+    def save_book_image(self, url: str, isbn: str,
+                        on_saved: Callable[[], None] = None):
+        """Saves the image of a book, possibly in the background. on_saved
+        is called once the image is saved."""
         pass
 
     @abstractmethod
@@ -23,3 +27,17 @@ class RawDataStorage(ABC):
     @abstractmethod
     def get_saved_review_users(self, isbn: str):
         pass
+
+    @abstractmethod
+    def get_saved_books(self):
+        """Gets the isbn, book url and review users of each saved book, e.g.
+        to seed a scrape journal"""
+        pass
+
+    def flush(self):
+        """Waits until all the pending writes are saved"""
+        pass
+
+    def close(self):
+        """Saves all the pending writes and releases the resources"""
+        self.flush()
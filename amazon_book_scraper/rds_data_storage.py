@@ -22,3 +22,17 @@ class RDSDataStorage(ABC):
     @abstractmethod
     def get_saved_review_users(self, isbn: str):
         pass
+
+    @abstractmethod
+    def get_saved_books(self):
+        """Gets the isbn, book url and review users of each saved book, e.g.
+        to seed a scrape journal"""
+        pass
+
+    def flush(self):
+        """Waits until all the pending writes are saved"""
+        pass
+
+    def close(self):
+        """Saves all the pending writes and releases the resources"""
+        self.flush()
@@ -0,0 +1,210 @@
+"""Replays the extraction of book attributes and reviews over the pages
+archived in a snapshot archive, e.g. to backfill a new field after the
+scrapers changed. The pages are parsed in a pool of processes and the books
+are saved through the normal storages.
+
+Usage:
+    python replay.py <archive_path> local <path> [--processes N]
+    python replay.py <archive_path> s3 <bucket> [--processes N]
+    python replay.py <archive_path> rds --rds-url postgresql+psycopg2://...
+"""
+import argparse
+import multiprocessing
+from typing import Optional
+from aws_postgres_data_storage import AWSPostgresRDSDataStorage
+from entities import Book
+from amazon_book_attribute_scraper import AmazonBookAttributeScraper
+from amazon_automated_book_review_scraper import AmazonAutomatedBookReviewScraper
+from book_attribute_scraper import BookAttributeScraper
+from book_review_scraper import AutomatedBookReviewScraper
+from html_document import HTMLDocument
+from local_raw_data_storage import LocalRawDataStorage
+from page_cache import normalize_url
+from raw_data_storage import RawDataStorage
+from rds_data_storage import RDSDataStorage
+from s3_raw_data_storage import S3RawDataStorage
+from snapshot_archive import SnapshotArchive
+
+# number of pages sent to a worker process at once
+CHUNK_SIZE = 32
+
+# the scrapers of a worker process
+_attribute_scraper = None
+_review_scraper = None
+
+
+def replay_snapshots(
+        archive: SnapshotArchive,
+        attribute_scraper: BookAttributeScraper,
+        raw_data_storage: Optional[RawDataStorage],
+        review_scraper: AutomatedBookReviewScraper = None,
+        rds_data_storage: RDSDataStorage = None,
+        num_processes: int = None,
+        overwrite_attributes: bool = False) -> int:
+    """Extracts the books from the archived book pages and their reviews
+    from the archived review pages, and saves them. Reviews of users that
+    are already saved are skipped.
+
+    The pages are saved as the workers extract them, in any order: a book
+    with the reviews of its pages extracted so far, and the reviews of a
+    page extracted after its book page on their own. Only the reviews of
+    the pages whose book page is not extracted yet are kept in memory.
+
+    Args:
+        archive (SnapshotArchive): the archived pages
+        attribute_scraper (BookAttributeScraper): extracts the attributes.
+        It is sent to the worker processes, so it should not have a page
+        fetcher, a page cache or an archive.
+        raw_data_storage (Optional[RawDataStorage]): object for saving raw
+        data, None to save only in RDS
+        review_scraper (AutomatedBookReviewScraper, optional): extracts the
+        reviews. Without it only the attributes are replayed.
+        rds_data_storage (RDSDataStorage, optional): RDS interface object
+        num_processes (int, optional): number of worker processes. Defaults
+        to the number of cores.
+        overwrite_attributes (bool, optional): save the attributes of the
+        books that are already saved again (where the storage supports it)
+
+    Returns:
+        int: number of saved books
+    """
+    storages = [storage for storage in (raw_data_storage, rds_data_storage)
+                if storage]
+    # the isbns whose attributes are not saved again, per storage
+    saved_isbns = {storage: set() if overwrite_attributes
+                   else set(storage.get_saved_book_isbns())
+                   for storage in storages}
+    # product key -> BookAttribute of the extracted book pages
+    book_attributes = {}
+    # product key -> {user: Review} of the review pages whose book page is
+    # not extracted yet
+    pending_reviews = {}
+    num_books = 0
+    with multiprocessing.Pool(
+            num_processes, initializer=_init_worker,
+            initargs=(attribute_scraper, review_scraper)) as pool:
+        results = pool.imap_unordered(
+            _extract_page, archive.get_page_files(), chunksize=CHUNK_SIZE)
+        for result in results:
+            if result is None:
+                continue
+            page_type, key, content = result
+            if page_type == 'book_page':
+                if key is not None:
+                    book_attributes[key] = content
+                reviews = pending_reviews.pop(key, {})
+                _save_book(storages, saved_isbns, content, reviews.values())
+                num_books += 1
+            elif key in book_attributes:
+                _save_book(storages, saved_isbns, book_attributes[key],
+                           content)
+            else:
+                reviews = pending_reviews.setdefault(key, {})
+                for review in content:
+                    reviews.setdefault(review.user, review)
+    for storage in storages:
+        storage.flush()
+    return num_books
+
+
+def _save_book(storages, saved_isbns, attributes, reviews):
+    """Saves the book with the reviews of the users not saved yet. Its
+    attributes are saved only once."""
+    isbn = attributes.isbn
+    reviews = {review.user: review for review in reviews}
+    for review in reviews.values():
+        review.isbn = isbn
+    for storage in storages:
+        saved_users = set(storage.get_saved_review_users(isbn))
+        book = Book(attributes=attributes,
+                    reviews=[review for user, review in reviews.items()
+                             if user not in saved_users])
+        storage.save_book(book, saved_isbns[storage])
+        saved_isbns[storage].add(isbn)
+
+
+def _init_worker(attribute_scraper, review_scraper):
+    global _attribute_scraper, _review_scraper
+    _attribute_scraper = attribute_scraper
+    _review_scraper = review_scraper
+
+
+def _extract_page(file_path: str) -> Optional[tuple]:
+    """Extracts the attributes of a book page or the reviews of a review
+    page. The pages of a book are joined by their product key."""
+    try:
+        url, page_source = SnapshotArchive.read_page(file_path)
+    except (OSError, EOFError, ValueError):
+        return None
+    document = HTMLDocument(page_source, url=url)
+    identity = _attribute_scraper._identify_page(document)
+    if identity is not None:
+        attributes = _attribute_scraper._scrape_book_attributes(
+            url, document, identity)
+        if attributes is None:
+            return None
+        key = None
+        if _review_scraper:
+            review_page_url = _review_scraper._get_first_review_page_url(url)
+            if review_page_url:
+                key = _get_product_key(review_page_url)
+        return 'book_page', key, attributes
+    if _review_scraper:
+        try:
+            reviews = _review_scraper.scrape_reviews_from_curr_page(
+                None, driver=document)
+        except Exception:
+            return None
+        return 'review_page', _get_product_key(url), reviews
+    return None
+
+
+def _get_product_key(review_page_url: str) -> str:
+    """The last path segment of a review page url (e.g. the asin of
+    .../product-reviews/<asin>?pageNumber=2)"""
+    path = normalize_url(review_page_url).split('?')[0]
+    return path.rstrip('/').split('/')[-1]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Extracts the books from the archived pages again')
+    parser.add_argument('archive', help='path of the snapshot archive folder')
+    parser.add_argument('storage', choices=['local', 's3', 'rds'])
+    parser.add_argument(
+        'location', nargs='?',
+        help='local path of the raw_data folder or S3 bucket')
+    parser.add_argument(
+        '--rds-url', default=None,
+        help='database URL of the RDS storage, e.g. a local Postgres. With '
+        'local or s3 the books are saved in both.')
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--overwrite-attributes', action='store_true')
+    args = parser.parse_args(argv)
+    if args.storage == 'rds' and not args.rds_url:
+        parser.error('the rds storage requires --rds-url')
+    if args.storage != 'rds' and not args.location:
+        parser.error(f'the {args.storage} storage requires a location')
+    storage = None
+    if args.storage == 'local':
+        storage = LocalRawDataStorage(path=args.location)
+    elif args.storage == 's3':
+        storage = S3RawDataStorage(path=None, bucket=args.location)
+    rds_storage = None
+    if args.rds_url:
+        rds_storage = AWSPostgresRDSDataStorage({'URL': args.rds_url})
+    try:
+        num_books = replay_snapshots(
+            SnapshotArchive(args.archive), AmazonBookAttributeScraper(),
+            storage, review_scraper=AmazonAutomatedBookReviewScraper(),
+            rds_data_storage=rds_storage, num_processes=args.processes,
+            overwrite_attributes=args.overwrite_attributes)
+    finally:
+        for opened_storage in (storage, rds_storage):
+            if opened_storage:
+                opened_storage.close()
+    print(f'Replayed {num_books} books')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,48 +1,150 @@
 """Provides the implementation of the cloud raw data storage class"""
-from os.path import join
+import os
+from os.path import expanduser, join
+from concurrent.futures import ThreadPoolExecutor, wait
 from dataclasses import asdict
-from os import getcwd
+import gzip
+import hashlib
 import json
-import urllib.request
+import threading
+from typing import Callable, Optional
 import boto3
+from botocore.config import Config
 from entities import Book, BookAttribute, Review
+from image_downloader import ImageDownloader
+from metrics import get_metrics
 from raw_data_storage import RawDataStorage
-from utils import create_dir_if_not_exists
+from utils import get_shard_dirs
+
+# default local folder of the storage state (the image validators)
+CACHE_DIR = join(os.environ.get('XDG_CACHE_HOME', expanduser('~/.cache')),
+                 'amazon_book_scraper')
 
 
 class S3RawDataStorage(RawDataStorage):
     """This class provides methods for storing and retrieving scraped book
     data on a ASW S3 bucket in the clouyd. The object can be passed into the 
-    main scraper object"""
+    main scraper object.
+
+    A manifest object next to the 'raw_data' folder maps each saved isbn to
+    its book url and review users. It is kept up to date by save_book and
+    answers the resume queries with a single download.
+
+    The objects are uploaded concurrently in the background. flush() waits
+    for all the pending uploads and close() must be called when done.
+
+    With shard_depth > 0 the book objects are put under hash-sharded
+    prefixes (raw_data/ab/cd/<isbn>/), which spreads the request rate over
+    the S3 partitions. The manifest keeps the prefix of each book, so books
+    saved in the flat layout stay there until migrate_layout() moves them.
 
-    def __init__(self, path: str, bucket: str) -> None:
+    The cover images are downloaded in the background by an image
+    downloader and uploaded from its threads. Each image is stored once
+    under its content hash (raw_data_images/<sha256>.jpg), since many
+    editions share a cover; the upload is skipped when the hash is already
+    stored. The book keeps a reference to it (image.json).
+    """
+
+    def __init__(
+            self, path: str, bucket: str, num_upload_workers: int = 16,
+            max_attempts: int = 5, shard_depth: int = 0,
+            image_downloader: ImageDownloader = None,
+            validators_path: str = None, cache_dir: str = None) -> None:
         """
         Args:
             path (str): path to where the 'raw_data' folder containing all
             the scraped datashould be stored.
             bucket (str): ASW S3 bucket name
+            num_upload_workers (int, optional): number of concurrent uploads
+            max_attempts (int, optional): max attempts of each request.
+            Failed requests are retried with jittered exponential backoff.
+            shard_depth (int, optional): number of shard prefix levels.
+            0 is the flat layout (raw_data/<isbn>/).
+            image_downloader (ImageDownloader, optional): downloads the
+            images. By default one is created that keeps the image
+            validators in the validators_path file.
+            validators_path (str, optional): path to the database file of
+            the image validators, so a re-run only downloads the images
+            that changed. Defaults to <bucket>_raw_data_images.db in
+            cache_dir.
+            cache_dir (str, optional): local folder of the storage state.
+            Defaults to CACHE_DIR.
         """
-        self._s3_client = boto3.client('s3')
+        # one pooled connection per upload worker and a few for the
+        # foreground requests
+        config = Config(
+            max_pool_connections=num_upload_workers + 4,
+            retries={'max_attempts': max_attempts, 'mode': 'standard'})
+        self._s3_client = boto3.client('s3', config=config)
         self._s3_root_folder = join(path, 'raw_data') if path else 'raw_data'
         self._s3_bucket = bucket
+        self._shard_depth = shard_depth
         self._s3_resource = boto3.resource('s3')
-        # temp folder for file buffer
-        temp_path = join(getcwd(), 'temp')
-        create_dir_if_not_exists(temp_path)
+        # guards the manifest and the pending uploads
+        self._lock = threading.Lock()
+        self._manifest_key = f'{self._s3_root_folder}_manifest.json.gz'
+        # isbn -> {'book_url': str, 'users': list[str], 'prefix': str,
+        # 'image': str}. Entries without a prefix are in the flat layout.
+        # The image is the content hash, or True for an image saved under
+        # the book prefix (<isbn>.jpg).
+        self._manifest = self._load_manifest()
+        self._manifest_changed = False
+        self._images_folder = f'{self._s3_root_folder}_images'
+        self._image_hashes = {entry['image'] for entry in self._manifest.values()
+                              if isinstance(entry.get('image'), str)}
+        self._pending_uploads = set()
+        self._upload_executor = ThreadPoolExecutor(
+            max_workers=num_upload_workers)
+        # the manifest is written by a single thread, so the latest version
+        # is always written last
+        self._manifest_executor = ThreadPoolExecutor(max_workers=1)
+        self._manifest_upload = None
+        if image_downloader is None:
+            if validators_path is None:
+                cache_dir = cache_dir or CACHE_DIR
+                os.makedirs(cache_dir, exist_ok=True)
+                validators_path = join(
+                    cache_dir, f'{bucket}_raw_data_images.db')
+            image_downloader = ImageDownloader(
+                validators_path=validators_path)
+        self._image_downloader = image_downloader
 
     def save_book(self, book: Book, saved_isbns: str) -> None:
-        """Saves a book object in an S3 bucket
+        """Saves a book object in an S3 bucket. The objects are uploaded in
+        the background and added to the manifest once they are saved.
 
         Args:
             book (Book): the book object to be saved
             saved_isbns (str): list if isbns for which the
             attributes are already saved. Only reviews are new.
         """
-        book_path = join(self._s3_root_folder, book.attributes.isbn)
+        book_path = self._get_book_prefix(book.attributes.isbn)
         reviews_path = join(book_path, 'reviews')
         if book.attributes.isbn not in saved_isbns:
             self._save_book_attributes(book.attributes, book_path)
         self._save_reviews(book.reviews, reviews_path)
+        self._save_manifest_if_changed()
+
+    def flush(self) -> None:
+        """Waits until all the pending uploads are done and saves the
+        manifest"""
+        self._image_downloader.flush()
+        while True:
+            with self._lock:
+                pending_uploads = list(self._pending_uploads)
+            if not pending_uploads:
+                break
+            wait(pending_uploads)
+        if self._manifest_upload:
+            self._manifest_upload.result()
+        self._save_manifest()
+
+    def close(self) -> None:
+        """Saves everything pending and stops the upload workers"""
+        self.flush()
+        self._image_downloader.close()
+        self._upload_executor.shutdown()
+        self._manifest_executor.shutdown()
 
     def get_saved_book_urls(self, num_reviews: int) -> list[str]:
         """Get all the saved book urls. It does not return books with
@@ -54,19 +156,15 @@ class S3RawDataStorage(RawDataStorage):
         Returns:
             list[str]: list of saved book urls
         """
-        saved_urls = []
-        isbns = self._get_all_isbns()
-        for isbn in isbns:
-            count = self._get_review_count(isbn)
-            if count >= num_reviews:
-                url = self._get_book_url(isbn)
-                saved_urls.append(url)
-
-        return saved_urls
+        with self._lock:
+            return [entry['book_url'] for entry in self._manifest.values()
+                    if entry['book_url'] and len(entry['users']) >= num_reviews]
 
     def get_saved_book_isbns(self):
         """Gets all the saved book isbn numbers"""
-        return self._get_all_isbns()
+        with self._lock:
+            return [isbn for isbn, entry in self._manifest.items()
+                    if entry['book_url']]
 
     def get_saved_review_users(self, isbn: str) -> list[str]:
         """Get all the user names of the saved reviews of a particular book.
@@ -77,41 +175,77 @@ class S3RawDataStorage(RawDataStorage):
         Returns:
             list[str]: list of user names of reviews
         """
-        saved_users = []
-        review_path = join(self._s3_root_folder, isbn, 'reviews')
-        all_files = self._get_all_file_keys()
-        for file_key in all_files:
-            # if it is a review
-            if review_path in file_key:
-                user_json = file_key.split('/')[-1]
-                user = user_json.split('json')[0][:-1]
-                saved_users.append(user)
-        return saved_users
-
-    def save_book_image(self, url: str, isbn: str) -> None:
+        with self._lock:
+            if isbn not in self._manifest:
+                return []
+            return list(self._manifest[isbn]['users'])
+
+    def get_saved_books(self) -> list[tuple[str, str, list[str]]]:
+        """Gets the isbn, book url and review users of each saved book"""
+        with self._lock:
+            return [(isbn, entry['book_url'], list(entry['users']))
+                    for isbn, entry in self._manifest.items()
+                    if entry['book_url']]
+
+    def save_book_image(self, url: str, isbn: str,
+                        on_saved: Callable[[], None] = None) -> None:
         """Saves an image from the given url to the specified book
-        location
+        location. The image is downloaded and uploaded in the background;
+        a saved image is only downloaded again if it has changed, and only
+        uploaded if no book has the same image yet.
 
         Args:
             url (str): image url
             isbn (str): the book isbn
+            on_saved (Callable[[], None], optional): called in the download
+            thread once the image is uploaded
         """
-        # retirieve the image file to a temporary local location
-        temp_path = join(getcwd(), 'temp')
-        try:
-            temp_image_path = join(temp_path, 'tmp.jpg')
-            urllib.request.urlretrieve(url, filename=temp_image_path)
-        except:
-            print(f"Could retrieve coverpage image for {isbn}")
+        reference_key = join(self._get_book_prefix(isbn), 'image.json')
 
-        # upload the image file to cloud (S3)
-        file_key = join(self._s3_root_folder, isbn, f"{isbn}.jpg")
-        try:
-            self._s3_client.upload_file(
-                temp_image_path, self._s3_bucket, file_key)
-        except:
-            print(
-                f"Could not save the image for {isbn} in S3")
+        def upload(image):
+            image_hash = hashlib.sha256(image).hexdigest()
+            with self._lock:
+                is_stored = image_hash in self._image_hashes
+                is_referenced = \
+                    self._manifest.get(isbn, {}).get('image') == image_hash
+            if is_referenced:
+                return
+            if not is_stored:
+                self._put_object(
+                    'image', self._get_image_key(image_hash), image)
+            self._put_object(
+                'image_reference', reference_key,
+                json.dumps({'hash': image_hash, 'url': url}))
+            with self._lock:
+                self._image_hashes.add(image_hash)
+                entry = self._manifest.setdefault(
+                    isbn, {'book_url': None, 'users': [],
+                           'prefix': self._get_sharded_prefix(isbn)})
+                entry['image'] = image_hash
+                self._manifest_changed = True
+
+        with self._lock:
+            is_saved = bool(self._manifest.get(isbn, {}).get('image'))
+        self._image_downloader.submit(
+            url, upload, revalidate=is_saved, on_saved=on_saved)
+
+    def get_image_key(self, isbn: str) -> Optional[str]:
+        """Gets the key of the saved image of a book
+
+        Args:
+            isbn (str): the book isbn
+
+        Returns:
+            Optional[str]: the image key or None if it has no saved image
+        """
+        with self._lock:
+            entry = self._manifest.get(isbn)
+            if entry is None or not entry.get('image'):
+                return None
+            if entry['image'] is True:
+                # saved before the images were deduplicated
+                return join(self._get_entry_prefix(isbn, entry), f'{isbn}.jpg')
+            return self._get_image_key(entry['image'])
 
     def _save_reviews(self, reviews, path):
         # get all reviews by their users name
@@ -119,15 +253,12 @@ class S3RawDataStorage(RawDataStorage):
             if not isinstance(review, Review):
                 raise TypeError('Invalid type for review')
             # save the review as a json file
-            try:
-                file_key = f"{path}/{review.user}.json"
-                review_dict = asdict(review)
-                self._s3_client.put_object(Bucket=self._s3_bucket,
-                                        Body=json.dumps(review_dict),
-                                        Key=file_key)
-            except:
-                print(
-                    f"Could not save review for {review.user} in S3")
+            file_key = f"{path}/{review.user}.json"
+            review_dict = asdict(review)
+            self._submit_upload(
+                file_key, json.dumps(review_dict), review.isbn,
+                user=review.user,
+                error=f"Could not save review for {review.user} in S3")
 
     def _save_book_attributes(self, book_attributes, path):
         if not isinstance(book_attributes, BookAttribute):
@@ -136,41 +267,211 @@ class S3RawDataStorage(RawDataStorage):
         # save the book record as a json object in S3
         file_key = join(path, 'data.json')
         attr_dict = asdict(book_attributes)
+        self._submit_upload(
+            file_key, json.dumps(attr_dict), book_attributes.isbn,
+            book_url=book_attributes.book_url,
+            error=f"Could not save the record for {book_attributes.title} in S3")
+
+    def _submit_upload(
+            self, file_key, body, isbn, book_url=None, user=None, error=''):
+        """Uploads the object in the background. Once it is saved, the
+        book url or the review user is added to the manifest."""
+        def upload():
+            try:
+                self._put_object(
+                    'review' if user else 'attributes', file_key, body)
+            except:
+                print(error)
+                return
+            with self._lock:
+                entry = self._manifest.setdefault(
+                    isbn, {'book_url': None, 'users': [],
+                           'prefix': self._get_sharded_prefix(isbn)})
+                if book_url:
+                    entry['book_url'] = book_url
+                if user and user not in entry['users']:
+                    entry['users'].append(user)
+                self._manifest_changed = True
+
+        self._submit(upload)
+
+    def migrate_layout(self) -> int:
+        """Moves the books that are not under their prefix in the configured
+        layout (e.g. flat books after shard_depth was set). The objects of a
+        book are copied, the manifest is pointed to the new prefix and then
+        the old objects are deleted. The old objects are kept when the
+        manifest could not be saved.
+
+        It must not run while a scraper is saving to the bucket: both
+        rewrite the whole manifest, so one would drop the changes of the
+        other.
+
+        Returns:
+            int: number of moved books
+        """
+        self.flush()
+        with self._lock:
+            prefixes = {isbn: self._get_entry_prefix(isbn, entry)
+                        for isbn, entry in self._manifest.items()}
+        num_moved = 0
+        bucket = self._s3_resource.Bucket(self._s3_bucket)
+        for isbn, prefix in prefixes.items():
+            new_prefix = self._get_sharded_prefix(isbn)
+            if prefix == new_prefix:
+                continue
+            try:
+                old_keys = [obj.key for obj in
+                            bucket.objects.filter(Prefix=prefix + '/')]
+                for key in old_keys:
+                    self._s3_client.copy_object(
+                        Bucket=self._s3_bucket,
+                        CopySource={'Bucket': self._s3_bucket, 'Key': key},
+                        Key=new_prefix + key[len(prefix):])
+            except:
+                print(f'Could not move the objects of {isbn}')
+                continue
+            with self._lock:
+                self._manifest[isbn]['prefix'] = new_prefix
+                self._manifest_changed = True
+            num_moved += 1
+            if not self._save_manifest():
+                # the saved manifest still points to the old objects
+                continue
+            for key in old_keys:
+                try:
+                    self._s3_client.delete_object(
+                        Bucket=self._s3_bucket, Key=key)
+                except Exception as e:
+                    print(f'Could not delete the old object {key}: {e}')
+        return num_moved
+
+    def _get_image_key(self, image_hash):
+        return f'{self._images_folder}/{image_hash}.jpg'
+
+    def _get_sharded_prefix(self, isbn):
+        shard_dirs = get_shard_dirs(isbn, self._shard_depth)
+        return join(self._s3_root_folder, *shard_dirs, isbn)
+
+    def _get_entry_prefix(self, isbn, entry):
+        return entry.get('prefix') or join(self._s3_root_folder, isbn)
+
+    def _get_book_prefix(self, isbn):
+        """Gets the key prefix of the book objects. A saved book keeps its
+        prefix until it is migrated."""
+        with self._lock:
+            entry = self._manifest.get(isbn)
+            if entry is not None:
+                return self._get_entry_prefix(isbn, entry)
+        return self._get_sharded_prefix(isbn)
+
+    def _put_object(self, object_type, file_key, body):
+        """Uploads an object and records the time and the retries"""
+        metrics = get_metrics()
+        with metrics.s3_put_seconds.labels(object=object_type).time():
+            response = self._s3_client.put_object(
+                Bucket=self._s3_bucket, Body=body, Key=file_key)
+        retries = response.get('ResponseMetadata', {}).get('RetryAttempts', 0)
+        if retries:
+            metrics.retries.labels(stage='s3_put').inc(retries)
+
+    def _submit(self, upload):
+        """Runs the upload in the background and keeps track of it until it
+        is done"""
+        future = self._upload_executor.submit(upload)
+        with self._lock:
+            self._pending_uploads.add(future)
+        future.add_done_callback(self._upload_done)
+
+    def _upload_done(self, future):
+        with self._lock:
+            self._pending_uploads.discard(future)
+
+    def _load_manifest(self) -> dict:
+        """Downloads the manifest. If there is none yet, it is built from the
+        saved objects once."""
+        try:
+            response = self._s3_client.get_object(
+                Bucket=self._s3_bucket, Key=self._manifest_key)
+        except self._s3_client.exceptions.NoSuchKey:
+            manifest = self._build_manifest()
+            self._manifest = manifest
+            self._save_manifest()
+            return manifest
+        return json.loads(gzip.decompress(response['Body'].read()))
+
+    def _save_manifest_if_changed(self) -> None:
+        """Saves the manifest in the background, unless a save is already
+        waiting to run"""
+        with self._lock:
+            if not self._manifest_changed:
+                return
+            if self._manifest_upload and not self._manifest_upload.running() \
+                    and not self._manifest_upload.done():
+                return
+            self._manifest_upload = self._manifest_executor.submit(
+                self._save_manifest)
+
+    def _save_manifest(self) -> bool:
+        """Saves the manifest and returns whether it was saved"""
+        with self._lock:
+            body = json.dumps(self._manifest)
+            self._manifest_changed = False
+        body = gzip.compress(body.encode('utf-8'))
         try:
-            self._s3_client.put_object(Bucket=self._s3_bucket,
-                                       Body=json.dumps(attr_dict),
-                                       Key=file_key)
+            self._put_object('manifest', self._manifest_key, body)
         except:
-            print(
-                f"Could not save the record for {book_attributes.title} in S3")
+            print("Could not save the manifest in S3")
+            with self._lock:
+                self._manifest_changed = True
+            return False
+        return True
 
+    def _build_manifest(self) -> dict:
+        """Builds the manifest by listing the saved objects"""
+        manifest = {}
+        for file_key in self._get_all_file_keys():
+            # <prefix>/data.json or <prefix>/reviews/<user>.json, where the
+            # prefix is <root>/[<shards>/]<isbn>
+            parts = file_key.split('/')
+            if parts[-1] == 'data.json':
+                prefix = '/'.join(parts[:-1])
+                entry = manifest.setdefault(
+                    parts[-2], {'book_url': None, 'users': []})
+                entry['prefix'] = prefix
+                entry['book_url'] = self._get_book_url(prefix)
+            elif len(parts) > 3 and parts[-2] == 'reviews' and \
+                    parts[-1].endswith('.json'):
+                entry = manifest.setdefault(
+                    parts[-3], {'book_url': None, 'users': []})
+                entry['prefix'] = '/'.join(parts[:-2])
+                entry['users'].append(parts[-1][:-len('.json')])
+            elif parts[-1] == 'image.json':
+                entry = manifest.setdefault(
+                    parts[-2], {'book_url': None, 'users': []})
+                entry['prefix'] = '/'.join(parts[:-1])
+                entry['image'] = self._get_image_hash(file_key)
+            elif parts[-1] == f'{parts[-2]}.jpg':
+                entry = manifest.setdefault(
+                    parts[-2], {'book_url': None, 'users': []})
+                entry['prefix'] = '/'.join(parts[:-1])
+                entry.setdefault('image', True)
+        return manifest
 
     def _get_all_file_keys(self):
         bucket = self._s3_resource.Bucket(self._s3_bucket)
-        return [obj.key for obj in bucket.objects.all()]
-
-    def _get_all_isbns(self):
-        all_files = self._get_all_file_keys()
-        return list(set([(key).split('/')[1] for key in all_files]))
-
-    def _get_review_count(self, isbn):
-        all_files = self._get_all_file_keys()
-        isbn_review = join(self._s3_root_folder, isbn, 'reviews')
-        count = 0
-        for file_key in all_files:
-            if isbn_review in file_key:
-                count += 1
-        return count
-
-    def _get_book_url(self, isbn):
-        # download the data.json file from S3
-        data_key = join(self._s3_root_folder, isbn, 'data.json')
-        temp_path = join(getcwd(), 'temp', 'data.json')
-        self._s3_client.download_file(
-            self._s3_bucket, data_key, temp_path)
-
-        # read the file
-        with open(temp_path, mode='r') as f:
-            attribute_dict = json.load(f)
+        prefix = self._s3_root_folder + '/'
+        return [obj.key for obj in bucket.objects.filter(Prefix=prefix)]
+
+    def _get_book_url(self, prefix):
+        # read the data.json file from S3 in memory
+        data_key = join(prefix, 'data.json')
+        response = self._s3_client.get_object(
+            Bucket=self._s3_bucket, Key=data_key)
+        attribute_dict = json.loads(response['Body'].read())
 
         return attribute_dict['book_url']
+
+    def _get_image_hash(self, reference_key):
+        response = self._s3_client.get_object(
+            Bucket=self._s3_bucket, Key=reference_key)
+        return json.loads(response['Body'].read())['hash']
@@ -0,0 +1,277 @@
+"""Provides a journal of the scraping progress per book url. A restarted
+scraper replays it to continue where it stopped, without querying the
+storages for what is already saved.
+"""
+import sqlite3
+import threading
+import time
+from typing import Iterable
+
+# the states of a book url
+DISCOVERED = 0
+# the book page could not be scraped (e.g. banned title)
+SKIPPED = 1
+# the attributes and the reviews are saved (a single storage write)
+REVIEWS_SAVED = 2
+IMAGE_SAVED = 3
+
+# the skip reasons that do not change when the page is loaded again
+PERMANENT_SKIP_REASONS = ('banned', 'not_english')
+# a book skipped for another reason (e.g. a page without the isbn rendered)
+# is tried again on the next runs, up to this many times in total
+MAX_SKIP_ATTEMPTS = 3
+# the condition on a skipped book that is not tried again
+SKIPPED_FOR_GOOD = """coalesce(
+    skips.reason IN ({}) OR skips.attempts >= ?, 0)""".format(
+    ', '.join('?' * len(PERMANENT_SKIP_REASONS)))
+SKIPPED_FOR_GOOD_PARAMS = (*PERMANENT_SKIP_REASONS, MAX_SKIP_ATTEMPTS)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS books (
+    url TEXT NOT NULL UNIQUE,
+    isbn TEXT,
+    state INTEGER NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_books_isbn ON books (isbn);
+CREATE TABLE IF NOT EXISTS reviews (
+    isbn TEXT NOT NULL,
+    user TEXT NOT NULL,
+    PRIMARY KEY (isbn, user)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS images (
+    url TEXT PRIMARY KEY,
+    image_url TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS skips (
+    url TEXT PRIMARY KEY,
+    reason TEXT,
+    attempts INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS checkpoint (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    time REAL NOT NULL
+);
+"""
+
+
+class ScrapeJournal:
+    """SQLite (WAL) journal of the state of each book url: discovered on a
+    listing page, skipped, reviews saved or image saved, and of the saved
+    review users and the image url of each book. Every update is a single
+    transaction, so the journal survives the scraper being killed at any
+    point.
+
+    The storages may save in the background, so the entries written after
+    the last checkpoint (the last time the storages were flushed) are only
+    trusted once they are confirmed against the storage.
+    """
+    def __init__(self, path: str) -> None:
+        """
+        Args:
+            path (str): path to the journal database file
+        """
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.executescript(SCHEMA)
+
+    def is_empty(self) -> bool:
+        """Has the journal never been used"""
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT time FROM checkpoint').fetchone()
+        return row is None
+
+    def seed(self, books: Iterable[tuple[str, str, list[str]]]) -> None:
+        """Records the books saved before the journal was used
+
+        Args:
+            books (Iterable[tuple[str, str, list[str]]]): the isbn, book url
+            and review users of each saved book
+        """
+        now = time.time()
+        with self._lock:
+            self._connection.execute('BEGIN')
+            for isbn, book_url, users in books:
+                self._connection.execute(
+                    'INSERT OR IGNORE INTO books (url, isbn, state, updated) '
+                    'VALUES (?, ?, ?, ?)', (book_url, isbn, REVIEWS_SAVED, now))
+                self._connection.executemany(
+                    'INSERT OR IGNORE INTO reviews (isbn, user) VALUES (?, ?)',
+                    [(isbn, user) for user in users])
+            self._set_checkpoint(now)
+            self._connection.execute('COMMIT')
+
+    def add_discovered(self, urls: list[str]) -> None:
+        """Records the book urls found on a listing page"""
+        now = time.time()
+        with self._lock:
+            self._connection.executemany(
+                'INSERT OR IGNORE INTO books (url, state, updated) '
+                'VALUES (?, ?, ?)', [(url, DISCOVERED, now) for url in urls])
+
+    def book_skipped(self, url: str, reason: str = None) -> None:
+        """Records that the book page could not be scraped
+
+        Args:
+            url (str): the book url
+            reason (str, optional): why the book was skipped (see
+            BookAttributeScraper.skip_reason)
+        """
+        with self._lock:
+            self._connection.execute('BEGIN')
+            self._upsert(url, None, SKIPPED)
+            self._connection.execute(
+                'INSERT INTO skips (url, reason, attempts) VALUES (?, ?, 1) '
+                'ON CONFLICT (url) DO UPDATE SET '
+                'reason = excluded.reason, attempts = attempts + 1',
+                (url, reason))
+            self._connection.execute('COMMIT')
+
+    def book_saved(self, url: str, isbn: str, users: list[str],
+                   image_url: str = None) -> None:
+        """Records that the book and the reviews of the given users are
+        saved, and the url of the image that is still to be saved
+        """
+        with self._lock:
+            self._connection.execute('BEGIN')
+            self._upsert(url, isbn, REVIEWS_SAVED)
+            self._connection.executemany(
+                'INSERT OR IGNORE INTO reviews (isbn, user) VALUES (?, ?)',
+                [(isbn, user) for user in users])
+            if image_url:
+                self._connection.execute(
+                    'INSERT OR REPLACE INTO images (url, image_url) '
+                    'VALUES (?, ?)', (url, image_url))
+            self._connection.execute('COMMIT')
+
+    def image_saved(self, url: str, isbn: str) -> None:
+        self._set_state(url, isbn, IMAGE_SAVED)
+
+    def get_pending_urls(self) -> list[str]:
+        """Gets the discovered urls that are not scraped yet and the skipped
+        ones that are tried again, in the order they were discovered"""
+        query = f"""
+            SELECT books.url FROM books
+            LEFT JOIN skips ON books.url = skips.url
+            WHERE books.state = ? OR
+                (books.state = ? AND NOT {SKIPPED_FOR_GOOD})
+            ORDER BY books.rowid"""
+        with self._lock:
+            rows = self._connection.execute(
+                query, (DISCOVERED, SKIPPED, *SKIPPED_FOR_GOOD_PARAMS)
+            ).fetchall()
+        return [url for url, in rows]
+
+    def get_skipped_urls(self) -> list[str]:
+        """Gets the urls of the books that are not to be scraped again: the
+        ones skipped for a permanent reason or MAX_SKIP_ATTEMPTS times"""
+        query = f"""
+            SELECT books.url FROM books
+            LEFT JOIN skips ON books.url = skips.url
+            WHERE books.state = ? AND {SKIPPED_FOR_GOOD}"""
+        with self._lock:
+            rows = self._connection.execute(
+                query, (SKIPPED, *SKIPPED_FOR_GOOD_PARAMS)).fetchall()
+        return [url for url, in rows]
+
+    def get_books_without_image(self) -> list[tuple[str, str, str]]:
+        """Gets the url, isbn and image url of the saved books whose image
+        was not saved (e.g. the download was pending when the scraper
+        stopped)"""
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT books.url, books.isbn, images.image_url FROM books '
+                'JOIN images ON books.url = images.url WHERE books.state = ?',
+                (REVIEWS_SAVED,)).fetchall()
+        return [(url, isbn, image_url) for url, isbn, image_url in rows]
+
+    def get_saved_book_urls(self, num_reviews: int) -> list[str]:
+        """Gets the urls of the saved books with at least num_reviews
+        reviews"""
+        query = """
+            SELECT books.url FROM books
+            LEFT JOIN reviews ON books.isbn = reviews.isbn
+            WHERE books.state >= ?
+            GROUP BY books.url HAVING count(reviews.user) >= ?"""
+        with self._lock:
+            rows = self._connection.execute(
+                query, (REVIEWS_SAVED, num_reviews)).fetchall()
+        return [url for url, in rows]
+
+    def get_saved_book_isbns(self) -> list[str]:
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT DISTINCT isbn FROM books WHERE state >= ?',
+                (REVIEWS_SAVED,)).fetchall()
+        return [isbn for isbn, in rows]
+
+    def get_saved_review_users(self, isbn: str) -> list[str]:
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT user FROM reviews WHERE isbn = ?', (isbn,)).fetchall()
+        return [user for user, in rows]
+
+    def get_unconfirmed_books(self) -> list[tuple[str, str]]:
+        """Gets the url and isbn of the books saved after the last
+        checkpoint"""
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT url, isbn FROM books WHERE state >= ? AND updated > '
+                '(SELECT coalesce(max(time), 0) FROM checkpoint)',
+                (REVIEWS_SAVED,)).fetchall()
+        return [(url, isbn) for url, isbn in rows]
+
+    def confirm_book(self, url: str, isbn: str, users: list[str]) -> None:
+        """Replaces the journal entry of an unconfirmed book with what the
+        storage has. The book is scraped again if it is not in the storage.
+
+        Args:
+            url (str): the book url
+            isbn (str): the book isbn
+            users (list[str]): the review users saved in the storage or
+            None if the book is not saved
+        """
+        with self._lock:
+            self._connection.execute('BEGIN')
+            self._connection.execute(
+                'DELETE FROM reviews WHERE isbn = ?', (isbn,))
+            if users is None:
+                self._connection.execute(
+                    'UPDATE books SET state = ? WHERE url = ?',
+                    (DISCOVERED, url))
+            else:
+                self._connection.executemany(
+                    'INSERT OR IGNORE INTO reviews (isbn, user) VALUES (?, ?)',
+                    [(isbn, user) for user in users])
+            self._connection.execute('COMMIT')
+
+    def checkpoint(self) -> None:
+        """Marks all the entries as confirmed. Call it after the storages are
+        flushed."""
+        with self._lock:
+            self._set_checkpoint(time.time())
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def _set_state(self, url, isbn, state):
+        with self._lock:
+            self._upsert(url, isbn, state)
+
+    def _upsert(self, url, isbn, state):
+        self._connection.execute(
+            'INSERT INTO books (url, isbn, state, updated) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT (url) DO UPDATE SET '
+            'isbn = coalesce(excluded.isbn, isbn), '
+            'state = excluded.state, updated = excluded.updated',
+            (url, isbn, state, time.time()))
+
+    def _set_checkpoint(self, now):
+        self._connection.execute(
+            'INSERT OR REPLACE INTO checkpoint (id, time) VALUES (0, ?)',
+            (now,))
@@ -0,0 +1,311 @@
+"""Provides an append-only log of records stored in rotating segment files,
+with an offset index that is sorted on disk and read through a memory map. It
+replaces millions of tiny files with a few large ones that are read through
+memory maps.
+"""
+import hashlib
+import heapq
+import mmap
+import os
+import struct
+import threading
+from os.path import join
+from typing import Iterator, Optional
+
+# record header in a segment: the payload length
+RECORD_HEADER = struct.Struct('<I')
+# index entry: key hash, segment number, payload offset and payload length
+INDEX_ENTRY = struct.Struct('<16sIQI')
+# the index entries in the order they were written
+INDEX_FILE = 'index.bin'
+# the index entries sorted by key hash, one per key
+SORTED_INDEX_FILE = 'index.sorted'
+# sorted index header: the number of INDEX_FILE entries merged into it
+SORTED_INDEX_HEADER = struct.Struct('<Q')
+# default max size of a segment file (bytes)
+SEGMENT_SIZE = 64 * 1024 * 1024
+# the current segment file is extended (and remapped) by this many bytes
+SEGMENT_GROWTH = 1024 * 1024
+# min number of recent index entries held in RAM before they are merged into
+# the sorted index
+MERGE_SIZE = 65536
+
+
+class SegmentLog:
+    """Append-only log of records keyed by (isbn, user). The records are
+    appended to the current segment file, which is rotated when it reaches
+    segment_size. Each record gets a 32 byte entry in the index file.
+
+    The index entries are merged into a sorted index file, which is read
+    through a memory map and probed with a binary search, so a record is
+    found with about log2(n) reads of the map and read from the memory map
+    of its segment. Only the entries written since the last merge are held
+    in RAM; they are merged when they reach MERGE_SIZE or a sixteenth of the
+    sorted index (so a key is rewritten a bounded number of times), and when
+    the log is closed. The log can be shared between threads.
+
+    The current segment file is extended in steps of SEGMENT_GROWTH, so its
+    memory map is only replaced when the records outgrow it, and it is cut
+    to its records when it is rotated or closed.
+
+    A record is indexed only after it is written, so a crash leaves at most
+    an unindexed tail, which is truncated when the log is opened again.
+    """
+    def __init__(self, path: str, segment_size: int = SEGMENT_SIZE) -> None:
+        """
+        Args:
+            path (str): path to the folder of the segment and index files
+            segment_size (int, optional): max size of a segment file in bytes
+        """
+        os.makedirs(path, exist_ok=True)
+        self._path = path
+        self._segment_size = segment_size
+        self._lock = threading.Lock()
+        # key hash -> (segment, offset, length) of the entries not merged
+        self._recent = {}
+        # segment -> mmap
+        self._maps = {}
+        self._load_index()
+        self._index_file = open(join(path, INDEX_FILE), mode='ab')
+        self._open_segment(self._segment, self._segment_end)
+
+    def __len__(self) -> int:
+        return self._num_keys
+
+    def __contains__(self, key: tuple[str, str]) -> bool:
+        with self._lock:
+            return self._find(self._hash(*key)) is not None
+
+    def append(self, isbn: str, user: str, payload: bytes) -> None:
+        """Appends a record. A record with the same key replaces the
+        previous one in the index.
+
+        Args:
+            isbn (str): the book isbn
+            user (str): the review user name
+            payload (bytes): record content
+        """
+        with self._lock:
+            size = RECORD_HEADER.size + len(payload)
+            if 0 < self._segment_end and \
+                    self._segment_end + size > self._segment_size:
+                self._close_segment()
+                self._open_segment(self._segment + 1, 0)
+            if self._segment_end + size > self._segment_capacity:
+                self._extend_segment(self._segment_end + size)
+            offset = self._segment_end + RECORD_HEADER.size
+            self._segment_file.write(RECORD_HEADER.pack(len(payload)))
+            self._segment_file.write(payload)
+            self._segment_file.flush()
+            self._segment_end += size
+            key_hash = self._hash(isbn, user)
+            self._index_file.write(INDEX_ENTRY.pack(
+                key_hash, self._segment, offset, len(payload)))
+            self._index_file.flush()
+            self._num_entries += 1
+            if self._find(key_hash) is None:
+                self._num_keys += 1
+            self._recent[key_hash] = (self._segment, offset, len(payload))
+            if len(self._recent) >= max(MERGE_SIZE, self._num_sorted // 16):
+                self._merge()
+
+    def get(self, isbn: str, user: str) -> Optional[memoryview]:
+        """Gets a record without copying it
+
+        Args:
+            isbn (str): the book isbn
+            user (str): the review user name
+
+        Returns:
+            Optional[memoryview]: the record content or None if not found.
+            It is valid until the log is closed.
+        """
+        with self._lock:
+            location = self._find(self._hash(isbn, user))
+            if location is None:
+                return None
+            segment, offset, length = location
+            segment_map = self._get_map(segment, offset + length)
+        return memoryview(segment_map)[offset:offset + length]
+
+    def scan(self) -> Iterator[memoryview]:
+        """Iterates over the records in the order they were written,
+        without copying them. Records replaced by a later one with the same
+        key are skipped.
+
+        Yields:
+            memoryview: record content. It is valid until the log is closed.
+        """
+        with self._lock:
+            num_entries = self._num_entries
+        if num_entries == 0:
+            return
+        # the index file lists the records in the order they were written
+        with open(join(self._path, INDEX_FILE), mode='rb') as f:
+            index_map = mmap.mmap(f.fileno(), num_entries * INDEX_ENTRY.size,
+                                  access=mmap.ACCESS_READ)
+        try:
+            for entry in range(num_entries):
+                key_hash, segment, offset, length = INDEX_ENTRY.unpack_from(
+                    index_map, entry * INDEX_ENTRY.size)
+                with self._lock:
+                    # only the latest record of a key is in the index
+                    if self._find(key_hash) != (segment, offset, length):
+                        continue
+                    view = memoryview(self._get_map(segment, offset + length))
+                yield view[offset:offset + length]
+        finally:
+            index_map.close()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._recent:
+                self._merge()
+            self._close_segment()
+            self._index_file.close()
+            if self._sorted_map is not None:
+                self._sorted_map.close()
+                self._sorted_map = None
+            for segment_map in self._maps.values():
+                try:
+                    segment_map.close()
+                except BufferError:
+                    # a record view is still in use; closed on collection
+                    pass
+            self._maps = {}
+
+    def _load_index(self):
+        index_path = join(self._path, INDEX_FILE)
+        self._num_entries = 0
+        self._segment = 1
+        self._segment_end = 0
+        self._load_sorted_index()
+        if not os.path.isfile(index_path):
+            return
+        size = os.path.getsize(index_path)
+        # drop a partly written entry
+        size -= size % INDEX_ENTRY.size
+        with open(index_path, mode='r+b') as f:
+            f.truncate(size)
+            self._num_entries = size // INDEX_ENTRY.size
+            if self._num_entries < self._num_merged:
+                # the sorted index is ahead of the index file, rebuild it
+                self._sorted_map.close()
+                self._sorted_map = None
+                self._num_sorted = self._num_merged = self._num_keys = 0
+            # only the entries written since the last merge are read
+            f.seek(self._num_merged * INDEX_ENTRY.size)
+            for key_hash, segment, offset, length in \
+                    INDEX_ENTRY.iter_unpack(f.read()):
+                if key_hash not in self._recent and \
+                        self._find_sorted(key_hash) is None:
+                    self._num_keys += 1
+                self._recent[key_hash] = (segment, offset, length)
+            if self._num_entries:
+                # the records are appended in order, so the last entry ends
+                # the indexed records of the current segment
+                f.seek(size - INDEX_ENTRY.size)
+                _, self._segment, offset, length = INDEX_ENTRY.unpack(
+                    f.read(INDEX_ENTRY.size))
+                self._segment_end = offset + length
+
+    def _load_sorted_index(self):
+        sorted_path = join(self._path, SORTED_INDEX_FILE)
+        self._sorted_map = None
+        self._num_sorted = self._num_merged = self._num_keys = 0
+        if not os.path.isfile(sorted_path) or \
+                os.path.getsize(sorted_path) <= SORTED_INDEX_HEADER.size:
+            return
+        with open(sorted_path, mode='rb') as f:
+            self._sorted_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._num_merged, = SORTED_INDEX_HEADER.unpack_from(self._sorted_map)
+        self._num_sorted = self._num_keys = (
+            len(self._sorted_map) - SORTED_INDEX_HEADER.size) \
+            // INDEX_ENTRY.size
+
+    def _find(self, key_hash):
+        location = self._recent.get(key_hash)
+        if location is None:
+            location = self._find_sorted(key_hash)
+        return location
+
+    def _find_sorted(self, key_hash):
+        # binary search of the sorted index
+        low, high = 0, self._num_sorted
+        while low < high:
+            middle = (low + high) // 2
+            position = SORTED_INDEX_HEADER.size + middle * INDEX_ENTRY.size
+            entry_hash = self._sorted_map[position:position + len(key_hash)]
+            if entry_hash < key_hash:
+                low = middle + 1
+            elif entry_hash > key_hash:
+                high = middle
+            else:
+                _, segment, offset, length = INDEX_ENTRY.unpack_from(
+                    self._sorted_map, position)
+                return segment, offset, length
+        return None
+
+    def _iter_sorted(self):
+        for entry in range(self._num_sorted):
+            entry = INDEX_ENTRY.unpack_from(
+                self._sorted_map,
+                SORTED_INDEX_HEADER.size + entry * INDEX_ENTRY.size)
+            # the recent entries replace the merged ones
+            if entry[0] not in self._recent:
+                yield entry
+
+    def _merge(self):
+        sorted_path = join(self._path, SORTED_INDEX_FILE)
+        recent = sorted((key_hash, *location)
+                        for key_hash, location in self._recent.items())
+        # write and rename, so a crash leaves the previous sorted index
+        temp_path = f'{sorted_path}.tmp'
+        with open(temp_path, mode='wb') as f:
+            f.write(SORTED_INDEX_HEADER.pack(self._num_entries))
+            for entry in heapq.merge(self._iter_sorted(), recent):
+                f.write(INDEX_ENTRY.pack(*entry))
+        os.replace(temp_path, sorted_path)
+        if self._sorted_map is not None:
+            self._sorted_map.close()
+        self._recent = {}
+        self._load_sorted_index()
+
+    def _open_segment(self, segment, end):
+        path = self._segment_path(segment)
+        if not os.path.isfile(path):
+            open(path, mode='wb').close()
+        self._segment_file = open(path, mode='r+b')
+        # drop an unindexed tail (or unused space) left by a crash
+        self._segment_file.truncate(end)
+        self._segment_file.seek(end)
+        self._segment = segment
+        self._segment_end = end
+        self._segment_capacity = end
+
+    def _extend_segment(self, end):
+        capacity = min(self._segment_capacity + SEGMENT_GROWTH,
+                       self._segment_size)
+        self._segment_capacity = max(capacity, end)
+        self._segment_file.truncate(self._segment_capacity)
+
+    def _close_segment(self):
+        # drop the unused space, the maps only read the records
+        self._segment_file.truncate(self._segment_end)
+        self._segment_file.close()
+
+    def _get_map(self, segment, end):
+        segment_map = self._maps.get(segment)
+        if segment_map is None or len(segment_map) < end:
+            # the current segment has been extended since it was mapped
+            with open(self._segment_path(segment), mode='rb') as f:
+                segment_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[segment] = segment_map
+        return segment_map
+
+    def _segment_path(self, segment):
+        return join(self._path, f'segment-{segment:06d}.log')
+
+    @staticmethod
+    def _hash(isbn, user):
+        return hashlib.md5(f'{isbn}\x00{user}'.encode('utf-8')).digest()
@@ -0,0 +1,70 @@
+"""Provides an on-disk archive of the scraped pages, so the extraction can be
+replayed later (see replay.py).
+"""
+import gzip
+import hashlib
+import os
+import threading
+from os.path import join
+from page_cache import PageCache, normalize_url
+
+
+class SnapshotArchive:
+    """Archive of gzipped pages on disk, keyed by the sha256 of the
+    normalized url and the review page number. Unlike the page cache it is
+    never evicted, and the review pages of a book, which are replaced in
+    place and so share the url the browser shows, are kept apart by their
+    page number. The archive can be shared between threads.
+    """
+    def __init__(self, path: str) -> None:
+        """
+        Args:
+            path (str): path to the archive folder
+        """
+        os.makedirs(path, exist_ok=True)
+        self._path = path
+
+    def put(self, url: str, page_source: str, page_number: int = None) -> None:
+        """Archives a page. A page with the same url and page number
+        replaces the archived one.
+
+        Args:
+            url (str): page url
+            page_source (str): the page html
+            page_number (int, optional): the review page number
+        """
+        key = self._get_key(url, page_number)
+        file_path = join(self._path, key[:2], f'{key}.html.gz')
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        body = gzip.compress(f'{url}\n{page_source}'.encode('utf-8'))
+        # write and rename, so a reader never sees a partial file
+        temp_path = f'{file_path}.{threading.get_ident()}.tmp'
+        with open(temp_path, mode='wb') as f:
+            f.write(body)
+        os.replace(temp_path, file_path)
+
+    def get_page_files(self) -> list[str]:
+        """Gets the paths of all the archived page files, e.g. to read them
+        in other processes with read_page"""
+        return [join(dir_path, file)
+                for dir_path, _, files in os.walk(self._path)
+                for file in files if file.endswith('.html.gz')]
+
+    @staticmethod
+    def read_page(file_path: str) -> tuple[str, str]:
+        """Reads an archived page file
+
+        Args:
+            file_path (str): path to the page file (see get_page_files)
+
+        Returns:
+            tuple[str, str]: the url and the html of the page
+        """
+        return PageCache.read_page(file_path)
+
+    @staticmethod
+    def _get_key(url, page_number):
+        key = normalize_url(url)
+        if page_number is not None:
+            key = f'{key}#{page_number}'
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
@@ -0,0 +1,158 @@
+"""Provides per-book tracing spans and profiling of the scraping stages, to
+find which stage and which book slowed a run down.
+
+The spans are written as they finish, as JSON lines or in the Chrome
+trace-event format (open it in chrome://tracing or Perfetto).
+"""
+import cProfile
+from contextlib import contextmanager
+import itertools
+import json
+import os
+import pstats
+import threading
+import time
+from typing import Callable, Iterator
+
+
+class Tracer:
+    """Records nested spans. Each thread has its own stack of open spans, so
+    the spans of parallel workers are nested correctly. The tracer can be
+    shared between threads.
+    """
+    def __init__(self, path: str, trace_format: str = 'jsonl') -> None:
+        """
+        Args:
+            path (str): path to the trace file
+            trace_format (str, optional): 'jsonl' (a span per line) or
+            'chrome' (trace-event format)
+        """
+        if trace_format not in ('jsonl', 'chrome'):
+            raise ValueError(f'Unknown trace format: {trace_format}')
+        self._format = trace_format
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._span_ids = itertools.count(1)
+        self._file = open(path, mode='w')
+        if self._format == 'chrome':
+            # the closing bracket is optional, so the trace of a killed run
+            # can still be opened
+            self._file.write('[\n')
+
+    @contextmanager
+    def span(self, name: str, **args) -> Iterator[dict]:
+        """Records the time of the block as a span, a child of the span open
+        in the thread
+
+        Args:
+            name (str): span name (e.g. the stage)
+            args: attributes of the span (e.g. the book url). More can be
+            added to the yielded dict in the block.
+
+        Yields:
+            dict: the attributes of the span
+        """
+        stack = self._get_stack()
+        span_id = next(self._span_ids)
+        parent_id = stack[-1] if stack else None
+        stack.append(span_id)
+        start = time.time()
+        start_counter = time.perf_counter()
+        error = None
+        try:
+            yield args
+        except BaseException as e:
+            error = repr(e)
+            raise
+        finally:
+            duration = time.perf_counter() - start_counter
+            stack.pop()
+            if error:
+                args['error'] = error
+            self._write(name, span_id, parent_id, start, duration, args)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file.closed:
+                return
+            if self._format == 'chrome':
+                self._file.write('{}]\n')
+            self._file.close()
+
+    def _get_stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def _write(self, name, span_id, parent_id, start, duration, args):
+        if self._format == 'jsonl':
+            record = {'name': name, 'span_id': span_id,
+                      'parent_id': parent_id, 'start': start,
+                      'duration': duration,
+                      'thread': threading.current_thread().name,
+                      'args': args}
+            line = json.dumps(record, default=str) + '\n'
+        else:
+            event = {'name': name, 'ph': 'X', 'ts': int(start * 1e6),
+                     'dur': int(duration * 1e6), 'pid': os.getpid(),
+                     'tid': threading.get_ident(), 'args': args}
+            line = json.dumps(event, default=str) + ',\n'
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(line)
+                self._file.flush()
+
+
+class BookProfiler:
+    """Runs the first num_books books under cProfile and dumps the combined
+    stats, e.g. to inspect with pstats or snakeviz. The books of parallel
+    workers are profiled in their own threads.
+    """
+    def __init__(self, path: str, num_books: int = 10) -> None:
+        """
+        Args:
+            path (str): path to the stats file
+            num_books (int, optional): number of books to profile
+        """
+        self._path = path
+        self._num_books = num_books
+        self._lock = threading.Lock()
+        self._num_started = 0
+        self._num_done = 0
+        self._stats = None
+
+    def run(self, function: Callable, *args, **kwargs):
+        """Runs the function, under the profiler for the first books. The
+        stats are dumped when all of them are done.
+
+        Returns:
+            the result of the function
+        """
+        with self._lock:
+            is_profiled = self._num_started < self._num_books
+            if is_profiled:
+                self._num_started += 1
+        if not is_profiled:
+            return function(*args, **kwargs)
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(function, *args, **kwargs)
+        finally:
+            with self._lock:
+                if self._stats is None:
+                    self._stats = pstats.Stats(profile)
+                else:
+                    self._stats.add(profile)
+                self._num_done += 1
+                if self._num_done == self._num_books:
+                    self._dump()
+
+    def close(self) -> None:
+        """Dumps the stats of the profiled books if not all of them ran"""
+        with self._lock:
+            if self._stats is not None and self._num_done < self._num_books:
+                self._dump()
+
+    def _dump(self):
+        self._stats.dump_stats(self._path)
+        print(f'Saved the profile of {self._num_done} books to {self._path}')
@@ -1,11 +1,15 @@
 """This module implements some useful util functions and classes
 """
+import hashlib
 import os
 from os import listdir, walk
 from os.path import isfile, join
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.support.ui import WebDriverWait
 # some constants
-PAGE_SLEEP_TIME = 0.5
 TIME_OUT = 30
+# max number of book urls waiting to be scraped
+URL_QUEUE_SIZE = 20
 
 # some functions
 def create_dir_if_not_exists(dir: str) -> bool:
@@ -37,6 +41,21 @@ def get_list_of_dirs(dir: str) -> list[str]:
     """Get a list of dirs in the given dir"""
     return next(walk(dir))[1]
 
+def get_shard_dirs(name: str, shard_depth: int) -> list[str]:
+    """Gets the shard directories of a name in a hash-sharded layout, e.g.
+    ['ab', 'cd'] for depth 2 (raw_data/ab/cd/<isbn>). The md5 hash spreads
+    the names evenly over 256 directories per level.
+
+    Args:
+        name (str): the name to be sharded (e.g. isbn)
+        shard_depth (int): number of shard levels. 0 is the flat layout.
+
+    Returns:
+        list[str]: the shard directory names
+    """
+    digest = hashlib.md5(name.encode('utf-8')).hexdigest()
+    return [digest[2 * level:2 * level + 2] for level in range(shard_depth)]
+
 def is_dir_present(dir, path):
     """Does the given dir exis in the given path(dir)"""
     return dir in get_list_of_dirs(path)
@@ -44,3 +63,23 @@ def is_dir_present(dir, path):
 def is_file_present(file, path):
     """Does the given file exis in the given path(dir)"""
     return file in get_list_of_files(path)
+
+def wait_until(driver, condition, time_out: float = TIME_OUT):
+    """Waits until the condition (e.g. an expected_condition) is met by the
+    driver. A static page (html_document.HTMLDocument) never changes, so the
+    condition is checked only once.
+
+    Args:
+        driver (webdriver): webdriver or a static page
+        condition (callable): the condition to wait for
+        time_out (float, optional): maximum wait time in seconds
+
+    Returns:
+        the value returned by the condition
+    """
+    if getattr(driver, 'is_static', False):
+        value = condition(driver)
+        if not value:
+            raise TimeoutException('Condition not met on a static page')
+        return value
+    return WebDriverWait(driver, time_out).until(condition)
@@ -9,5 +9,6 @@ setup(
     author='Shahbaz Khader',
     license='MIT',
     packages=find_packages(),
-    install_requires=['boto3', 'pandas', 'selenium', 'SQLAlchemy'],
+    install_requires=['boto3', 'lxml', 'pandas', 'selenium', 'SQLAlchemy',
+                      'urllib3'],
 )
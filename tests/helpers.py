@@ -0,0 +1,183 @@
+"""Test helpers shared by the storage and scraper tests"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import hashlib
+import threading
+from automated_book_scraper import AutomatedBookScraper
+from book_attribute_scraper import BookAttributeScraper
+from book_review_scraper import AutomatedBookReviewScraper
+from raw_data_storage import RawDataStorage
+from entities import Book, BookAttribute, Review
+
+
+def make_book(isbn, users):
+    book_attr = BookAttribute(
+        title="Title", isbn=isbn, uuid='uuid', book_url=f'book_url_{isbn}',
+        author='author', description='des', date='date', pages=100,
+        price=5.0, best_seller_rank=1, review_rating=2.5, review_count=400,
+        image_url='image_url')
+    reviews = [Review(isbn=isbn, text=f'text {user}', user=user, rating=3)
+               for user in users]
+    return Book(attributes=book_attr, reviews=reviews)
+
+
+class FakeDriver:
+    def get(self, url):
+        pass
+
+    def quit(self):
+        pass
+
+    def execute_script(self, script):
+        return 'complete'
+
+
+class FakeAttributeScraper(BookAttributeScraper):
+    """Scrapes a book per url and fails after max_books books"""
+    def __init__(self, max_books=None) -> None:
+        super().__init__()
+        self.max_books = max_books
+        self.urls = []
+
+    def scrape_book_attributes_from_page(self, url, driver=None):
+        if self.max_books is not None and len(self.urls) >= self.max_books:
+            raise RuntimeError('preempted')
+        self.urls.append(url)
+        self.page_loaded_in_driver = True
+        isbn = url.split('/')[-1]
+        return BookAttribute(
+            title='Title', isbn=isbn, uuid='uuid', author=None,
+            description=None, date=None, pages=None, price=None,
+            best_seller_rank=None, review_rating=None, review_count=None,
+            image_url='image_url', book_url=url)
+
+    _initialize = _extract_isbn_attribute = _extract_title_attribute = \
+        _extract_language_attribute = _extract_author_attribute = \
+        _extract_description_attribute = _extract_date_attribute = \
+        _extract_pages_attribute = _extract_price_attribute = \
+        _extract_best_seller_rank_attribute = \
+        _extract_review_rating_attribute = _extract_review_count_attribute = \
+        _extract_image_url_attribute = lambda *args: None
+
+
+class FakeReviewScraper(AutomatedBookReviewScraper):
+    def scrape_book_reviews(self, isbn, num=10, driver=None, url=None,
+                            skip_users=None):
+        return [Review(isbn=isbn, text='text', rating=5, user=f'user-{i}')
+                for i in range(num)]
+
+    def scrape_reviews_from_curr_page(self, *args, **kwargs):
+        pass
+
+    _get_to_first_review_page = staticmethod(lambda driver: None)
+    _go_to_next_review_page_if_available = staticmethod(lambda driver: None)
+
+
+class FakeStorage(RawDataStorage):
+    """Keeps the books in memory. The images are saved on flush, as if
+    they were downloaded in the background."""
+    def __init__(self) -> None:
+        self.books = {}
+        self.images = {}
+        self.pending_images = []
+
+    def save_book(self, book, saved_isbns):
+        self.books[book.attributes.isbn] = book
+
+    def save_book_image(self, url, isbn, on_saved=None):
+        self.pending_images.append((url, isbn, on_saved))
+
+    def flush(self):
+        pending_images, self.pending_images = self.pending_images, []
+        for url, isbn, on_saved in pending_images:
+            self.images[isbn] = url
+            if on_saved:
+                on_saved()
+
+    def get_saved_book_urls(self, num_reviews):
+        return [book.attributes.book_url for book in self.books.values()
+                if len(book.reviews) >= num_reviews]
+
+    def get_saved_book_isbns(self):
+        return list(self.books)
+
+    def get_saved_review_users(self, isbn):
+        if isbn not in self.books:
+            return []
+        return [review.user for review in self.books[isbn].reviews]
+
+    def get_saved_books(self):
+        return []
+
+
+class FakeBookScraper(AutomatedBookScraper):
+    """Lists 3 pages of 5 books"""
+    def __init__(self, *args, **kwargs) -> None:
+        self.page = 1
+        self.visited_pages = []
+        super().__init__(*args, **kwargs)
+
+    def _create_driver(self):
+        return FakeDriver()
+
+    def _get_book_urls_from_page(self):
+        self.visited_pages.append(self.page)
+        return [f'http://books/{self.page}-{i}' for i in range(5)]
+
+    def _go_to_next_page_if_exists(self):
+        if self.page >= 3:
+            return False
+        self.page += 1
+        return True
+
+
+def make_scraper(attribute_scraper=None, storage=None,
+                 cls=FakeBookScraper, **kwargs):
+    """Creates a scraper of the fake listing. The other arguments are passed
+    to the scraper (e.g. journal, num_workers)."""
+    return cls(
+        'http://books', attribute_scraper or FakeAttributeScraper(),
+        FakeReviewScraper(), FakeStorage() if storage is None else storage,
+        **kwargs)
+
+
+class ImageServer:
+    """Serves images over HTTP with an ETag on a local port"""
+    def __init__(self) -> None:
+        self.images = {}
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests.append((self.path, dict(self.headers)))
+                image = server.images.get(self.path)
+                if image is None:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                etag = f'"{hashlib.md5(image).hexdigest()}"'
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'image/jpeg')
+                self.send_header('Content-Length', str(len(image)))
+                self.send_header('ETag', etag)
+                self.end_headers()
+                self.wfile.write(image)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def url(self, path):
+        return f'http://127.0.0.1:{self._server.server_port}{path}'
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
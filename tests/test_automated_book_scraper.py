@@ -0,0 +1,93 @@
+import unittest
+import collections
+import threading
+import time
+from unittest import mock
+from prometheus_client import CollectorRegistry
+from metrics import disable_metrics, enable_metrics
+from helpers import FakeAttributeScraper, FakeStorage, make_scraper
+
+
+class CountingStorage(FakeStorage):
+    """Counts the saves of each book and how many run at the same time"""
+    def __init__(self) -> None:
+        super().__init__()
+        self.saves = collections.Counter()
+        self.num_active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def save_book(self, book, saved_isbns):
+        with self._lock:
+            self.num_active += 1
+            self.max_active = max(self.max_active, self.num_active)
+        # a slow write, e.g. over the network
+        time.sleep(0.02)
+        with self._lock:
+            self.num_active -= 1
+            self.saves[book.attributes.isbn] += 1
+        super().save_book(book, saved_isbns)
+
+
+class ListingAttributeScraper(FakeAttributeScraper):
+    """Records the listing pages visited when each book is scraped"""
+    def __init__(self) -> None:
+        super().__init__()
+        self.visited_pages = {}
+        self.scraper = None
+
+    def scrape_book_attributes_from_page(self, url, driver=None):
+        self.visited_pages[url] = list(self.scraper.visited_pages)
+        time.sleep(0.01)
+        return super().scrape_book_attributes_from_page(url, driver)
+
+
+class TestAutomatedBookScraper(unittest.TestCase):
+    def tearDown(self) -> None:
+        disable_metrics()
+
+    def test_workers_save_each_book_once(self):
+        storage = CountingStorage()
+        scraper = make_scraper(storage=storage, num_workers=4)
+        books = scraper.scrape_books(num_books=12, num_reviews=2)
+        self.assertEqual(len(books), 12)
+        self.assertEqual(len(storage.saves), 12)
+        self.assertEqual(set(storage.saves.values()), {1})
+        # the workers are not serialized on the storage writes
+        self.assertGreater(storage.max_active, 1)
+
+    def test_short_listing(self):
+        registry = CollectorRegistry()
+        enable_metrics(registry)
+        # the listing has 15 books
+        scraper = make_scraper(num_workers=2)
+        books = scraper.scrape_books(num_books=30, num_reviews=2)
+        self.assertEqual(len(books), 15)
+        self.assertEqual(scraper._num_remaining, 0)
+        self.assertEqual(registry.get_sample_value('books_to_scrape'), 0)
+
+    def test_listing_stays_ahead_by_the_queue_size(self):
+        attribute_scraper = ListingAttributeScraper()
+        scraper = make_scraper(attribute_scraper, num_workers=1,
+                               pipelined=True)
+        attribute_scraper.scraper = scraper
+        with mock.patch('automated_book_scraper.URL_QUEUE_SIZE', 2):
+            books = scraper.scrape_books(num_books=15, num_reviews=2)
+        self.assertEqual(len(books), 15)
+        # while the second book is scraped, two urls are queued and the
+        # listing waits to put the fifth
+        self.assertEqual(
+            attribute_scraper.visited_pages['http://books/1-1'], [1])
+        self.assertEqual(
+            attribute_scraper.visited_pages['http://books/3-4'], [1, 2, 3])
+
+    def test_worker_failure_stops_the_listing(self):
+        storage = FakeStorage()
+        scraper = make_scraper(
+            FakeAttributeScraper(max_books=3), storage, num_workers=2)
+        with mock.patch('automated_book_scraper.URL_QUEUE_SIZE', 2), \
+                self.assertRaises(RuntimeError):
+            scraper.scrape_books(num_books=15, num_reviews=2)
+        self.assertEqual(len(storage.books), 3)
+        # the listing stopped once the workers failed
+        self.assertNotIn(3, scraper.visited_pages)
@@ -0,0 +1,61 @@
+import unittest
+import os
+import tempfile
+from benchmark_extractors import ATTRIBUTES, CallCounter, REVIEW_FIELDS
+from benchmark_extractors import build_corpus, load_corpus, run_benchmark
+from page_cache import PageCache
+from test_html_document import BOOK_PAGE, BOOK_URL
+from test_replay import REVIEW_PAGE_URL, make_review_page
+
+
+class FakeDriver:
+    def __init__(self) -> None:
+        self.commands = []
+
+    def execute(self, command, params=None):
+        self.commands.append(command)
+
+
+class TestBenchmarkExtractors(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'corpus')
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def test_static_path(self):
+        self.assertEqual(build_corpus(self.path, num_books=2), 4)
+        corpus = load_corpus(self.path)
+        self.assertEqual([len(files) for files in corpus.values()], [2, 2])
+        results = run_benchmark(corpus, paths=['static'], repeat=1)
+        fields = [result['field'] for result in results]
+        self.assertEqual(
+            fields,
+            ['initialize', *ATTRIBUTES, 'review_elements', *REVIEW_FIELDS])
+        calls = {result['field']: result['calls'] for result in results}
+        # the detail extractors only read what initialize looked up
+        self.assertEqual(calls['isbn'], 0)
+        self.assertEqual(calls['title'], 1)
+
+    def test_corpus_from_page_cache(self):
+        page_cache = PageCache(os.path.join(self.temp_dir.name, 'cache'))
+        page_cache.put(BOOK_URL, BOOK_PAGE)
+        page_cache.put(REVIEW_PAGE_URL.format(page=1),
+                       make_review_page(['a', 'b']))
+        page_cache.put('https://www.amazon.com/s?k=books',
+                       '<html><body></body></html>')
+        self.assertEqual(build_corpus(self.path, page_cache), 2)
+        corpus = load_corpus(self.path)
+        with open(corpus['book_pages'][0]) as f:
+            self.assertEqual(f.read(), BOOK_PAGE)
+
+    def test_count_driver_commands(self):
+        driver = FakeDriver()
+        counter = CallCounter()
+        with counter.count_driver(driver):
+            driver.execute('findElement')
+            driver.execute('getElementText')
+        driver.execute('get')
+        self.assertEqual(counter.count, 2)
+        self.assertEqual(len(driver.commands), 3)
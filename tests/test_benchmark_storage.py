@@ -0,0 +1,74 @@
+import unittest
+import io
+import os
+import tempfile
+from contextlib import redirect_stdout
+from benchmark_storage import (find_regressions, generate_books, load_results,
+                               main, open_storage, run_benchmarks,
+                               save_results)
+
+
+class TestBenchmarkStorage(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.results_path = os.path.join(self.temp_dir.name, 'results.jsonl')
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def test_catalog_is_reproducible(self):
+        books = list(generate_books(10, num_reviews=4))
+        self.assertEqual(len({book.attributes.isbn for book in books}), 10)
+        self.assertTrue(all(2 <= len(book.reviews) <= 4 for book in books))
+        self.assertEqual(books, list(generate_books(10, num_reviews=4)))
+
+    def test_regressions(self):
+        with redirect_stdout(io.StringIO()):
+            results = run_benchmarks(['local', 's3', 'rds'], [20],
+                                     num_reviews=4)
+        operations = {(result['backend'], result['operation'])
+                      for result in results}
+        self.assertEqual(len(results), 6 + 6 + 5)
+        self.assertIn(('s3', 'rebuild_catalog'), operations)
+        self.assertIn(('local', 'rebuild_catalog'), operations)
+        self.assertIn(('rds', 'open_storage'), operations)
+        self.assertEqual(find_regressions(results, results), [])
+        faster_results = [dict(result, seconds=result['seconds'] / 2)
+                          for result in results]
+        self.assertEqual(len(find_regressions(results, faster_results)),
+                         len(results))
+
+    def test_results_are_appended(self):
+        self.assertEqual(load_results(self.results_path), [])
+        results = [{'backend': 'local', 'size': 10, 'operation': 'save_book',
+                    'seconds': 0.1, 'commit': 'abc', 'time': 0}]
+        save_results(results, self.results_path)
+        save_results(results, self.results_path)
+        self.assertEqual(load_results(self.results_path), results * 2)
+
+    def test_compare_exit_code(self):
+        argv = ['rds', '--sizes', '10', '--reviews', '2',
+                '--results', self.results_path, '--compare']
+        with redirect_stdout(io.StringIO()):
+            # nothing to compare with yet
+            main(argv)
+        results = load_results(self.results_path)
+        self.assertEqual(len(results), 5)
+        # the previous run was much faster
+        save_results([dict(result, seconds=result['seconds'] / 1000)
+                      for result in results], self.results_path)
+        with redirect_stdout(io.StringIO()) as output, \
+                self.assertRaises(SystemExit) as context:
+            main(argv)
+        self.assertEqual(context.exception.code, 1)
+        self.assertIn('Regression: save_book of rds at 10 books',
+                      output.getvalue())
+
+    def test_rds_url_is_emptied_per_size(self):
+        rds_url = f"sqlite:///{os.path.join(self.temp_dir.name, 'rds.db')}"
+        with redirect_stdout(io.StringIO()):
+            run_benchmarks(['rds'], [30, 10], num_reviews=4, rds_url=rds_url)
+        storage = open_storage('rds', self.temp_dir.name, rds_url)
+        # only the books of the last size are in the database
+        self.assertEqual(len(storage.get_saved_book_isbns()), 10)
+        storage.close()
@@ -0,0 +1,67 @@
+import unittest
+from amazon_automated_book_review_scraper import AmazonAutomatedBookReviewScraper
+from amazon_automated_book_scraper import AmazonAutomatedBookScraper
+from amazon_book_attribute_scraper import AmazonBookAttributeScraper
+from fake_bookstore import FakeBookstore
+from page_fetcher import HTTPPageFetcher
+
+
+def make_scraper(document):
+    # the listing methods only need the driver, so no browser is started
+    scraper = AmazonAutomatedBookScraper.__new__(AmazonAutomatedBookScraper)
+    scraper._driver = document
+    return scraper
+
+
+class TestFakeBookstore(unittest.TestCase):
+    def setUp(self) -> None:
+        self.bookstore = FakeBookstore(
+            num_books=20, books_per_page=8, reviews_per_book=12,
+            reviews_per_page=5).start()
+        self.page_fetcher = HTTPPageFetcher(retries=0)
+
+    def tearDown(self) -> None:
+        self.bookstore.close()
+
+    def test_listing_pages(self):
+        document = self.page_fetcher.fetch(self.bookstore.listing_url)
+        scraper = make_scraper(document)
+        book_urls = scraper._get_book_urls_from_page()
+        self.assertEqual(len(book_urls), 8)
+        self.assertTrue(book_urls[0].startswith(
+            f'{self.bookstore.url}/Fake-Book-0/dp/1000000000'))
+        last_page = self.page_fetcher.fetch(
+            f'{self.bookstore.listing_url}&page=3')
+        scraper = make_scraper(last_page)
+        self.assertEqual(len(scraper._get_book_urls_from_page()), 4)
+        self.assertFalse(scraper._go_to_next_page_if_exists())
+
+    def test_book_page(self):
+        abas = AmazonBookAttributeScraper(page_fetcher=self.page_fetcher)
+        book = self.bookstore.get_book(3)
+        book_attributes = abas.scrape_book_attributes_from_page(
+            f'{self.bookstore.url}/Fake-Book-3/dp/1000000003')
+        self.assertFalse(abas.page_loaded_in_driver)
+        self.assertEqual(book_attributes.isbn, 'ISBN-13-978-1000000003')
+        self.assertEqual(book_attributes.title, book['title'])
+        self.assertEqual(book_attributes.price, float(book['price']))
+        self.assertEqual(book_attributes.review_count, 12)
+        self.assertEqual(book_attributes.image_url,
+                         f'{self.bookstore.url}/images/1000000003.jpg')
+
+    def test_review_pages(self):
+        aabrs = AmazonAutomatedBookReviewScraper()
+        review_url = aabrs._get_first_review_page_url(
+            f'{self.bookstore.url}/Fake-Book-3/dp/1000000003')
+        users = []
+        for page in (1, 2, 3):
+            document = self.page_fetcher.fetch(f'{review_url}?pageNumber={page}')
+            reviews = aabrs.scrape_reviews_from_curr_page(
+                'isbn', driver=document)
+            users += [review.user for review in reviews]
+        self.assertEqual(users, [f'reader-3-{i}' for i in range(12)])
+
+    def test_errors(self):
+        self.bookstore.error_rate = 1.0
+        self.assertIsNone(self.page_fetcher.fetch(self.bookstore.listing_url))
+        self.assertEqual(self.bookstore.num_errors, 1)
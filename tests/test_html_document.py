@@ -0,0 +1,112 @@
+import unittest
+from unittest import mock
+from html_document import HTMLDocument
+from amazon_book_attribute_scraper import AmazonBookAttributeScraper
+from entities import BookAttribute
+
+BOOK_PAGE = """
+<html><head><title>The Midnight Library</title></head><body>
+<span id="productTitle">The Midnight Library: A Novel</span>
+<div id="authorFollow_feature_div">
+  <div class="a-row a-spacing-top-small">
+    <div class="a-column a-span4 authorNameColumn"><a href="/Matt-Haig/e/1">Matt Haig</a></div>
+  </div>
+</div>
+<div data-a-expander-name="book_description_expander"><div><span>Between life and death there is a library.</span></div></div>
+<div id="tmmSwatches"><ul>
+  <li><span>Kindle</span><br><span>$9.99</span></li>
+  <li><span>Hardcover</span><br><span>$15.30</span></li>
+</ul></div>
+<div id="main-image-container"><img id="imgBlkFront" src="/images/I/81J6APjwxlL.jpg"></div>
+<div id="detailBullets_feature_div"><ul>
+  <li><span><span>Publisher :</span><span>Viking (September 29, 2020)</span></span></li>
+  <li><span><span>Language :</span><span>English</span></span></li>
+  <li><span><span>Hardcover :</span><span>304 pages</span></span></li>
+  <li><span><span>ISBN-13 :</span><span>978-0525559474</span></span></li>
+</ul></div>
+<div id="detailBulletsWrapper_feature_div"><ul>
+  <li><span>Best Sellers Rank: #1,234 in Books (See Top 100 in Books)</span></li>
+</ul><ul>
+  <li><span><span class="reviewCountTextLinkedHistogram noUnderline" title="4.3 out of 5 stars">4.3</span>
+  <span id="acrCustomerReviewText">147,031 ratings</span></span></li>
+</ul></div>
+<script>document.write('not rendered')</script>
+</body></html>
+"""
+BOOK_URL = 'https://www.amazon.com/Midnight-Library-Novel-Matt-Haig/dp/0525559477/'
+
+
+class SnapshotDriver:
+    """Counts the webdriver calls made while scraping a snapshot"""
+    def __init__(self, page_source) -> None:
+        self._page_source = page_source
+        self.calls = 0
+
+    def get(self, url):
+        self.calls += 1
+
+    def execute_script(self, script):
+        self.calls += 1
+        return 'complete'
+
+    @property
+    def page_source(self):
+        self.calls += 1
+        return self._page_source
+
+
+class TestHTMLDocument(unittest.TestCase):
+    def setUp(self) -> None:
+        self.document = HTMLDocument(BOOK_PAGE, url=BOOK_URL)
+
+    def test_text_is_rendered(self):
+        element = self.document.find_element_by_xpath('//div[@id="tmmSwatches"]')
+        self.assertEqual(element.text, 'Kindle\n$9.99\nHardcover\n$15.30')
+        self.assertNotIn('not rendered', self.document.text)
+
+    def test_urls_are_absolute(self):
+        element = self.document.find_element('id', 'imgBlkFront')
+        self.assertEqual(element.get_attribute('src'),
+                         'https://www.amazon.com/images/I/81J6APjwxlL.jpg')
+
+    def test_scrape_book_attributes(self):
+        abas = AmazonBookAttributeScraper()
+        self.assertTrue(abas._is_complete_page(self.document))
+        book_attributes = abas._scrape_book_attributes(BOOK_URL, self.document)
+        self.assertIsInstance(book_attributes, BookAttribute)
+        self.assertEqual(book_attributes.title, 'The Midnight Library: A Novel')
+        self.assertEqual(book_attributes.author, 'Matt Haig')
+        self.assertEqual(book_attributes.date, 'September 29 2020')
+        self.assertEqual(book_attributes.pages, 304)
+        self.assertEqual(book_attributes.price, 15.30)
+        self.assertEqual(book_attributes.best_seller_rank, 1234)
+        self.assertEqual(book_attributes.review_rating, 4.3)
+        self.assertEqual(book_attributes.review_count, 147031)
+        self.assertEqual(book_attributes.book_url, BOOK_URL)
+
+    def test_incomplete_page(self):
+        abas = AmazonBookAttributeScraper()
+        document = HTMLDocument('<html><body>Robot check</body></html>')
+        self.assertFalse(abas._is_complete_page(document))
+
+    def test_scrape_book_attributes_from_snapshot(self):
+        abas = AmazonBookAttributeScraper(snapshot=True)
+        driver = SnapshotDriver(BOOK_PAGE)
+        book_attributes = abas.scrape_book_attributes_from_page(
+            BOOK_URL, driver=driver)
+        self.assertIsInstance(book_attributes, BookAttribute)
+        self.assertTrue(abas.page_loaded_in_driver)
+        # load, readiness check and the snapshot
+        self.assertEqual(driver.calls, 3)
+
+    def test_page_is_identified_once(self):
+        abas = AmazonBookAttributeScraper(snapshot=True)
+        with mock.patch.object(abas, '_initialize',
+                               wraps=abas._initialize) as initialize, \
+                mock.patch.object(abas, '_extract_isbn_attribute',
+                                  wraps=abas._extract_isbn_attribute) as isbn:
+            book_attributes = abas.scrape_book_attributes_from_page(
+                BOOK_URL, driver=SnapshotDriver(BOOK_PAGE))
+        self.assertEqual(book_attributes.isbn, 'ISBN-13-978-0525559474')
+        self.assertEqual(initialize.call_count, 1)
+        self.assertEqual(isbn.call_count, 1)
@@ -0,0 +1,71 @@
+import unittest
+import os
+import tempfile
+from image_downloader import ImageDownloader
+from helpers import ImageServer
+
+
+class TestImageDownloader(unittest.TestCase):
+    def setUp(self) -> None:
+        self.server = ImageServer()
+        self.server.images['/cover.jpg'] = b'image data'
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.validators_path = os.path.join(self.temp_dir.name, 'images.db')
+
+    def tearDown(self) -> None:
+        self.server.close()
+        self.temp_dir.cleanup()
+
+    def test_unchanged_image_is_not_downloaded_again(self):
+        saved = []
+        downloader = ImageDownloader(validators_path=self.validators_path)
+        downloader.submit(self.server.url('/cover.jpg'), saved.append)
+        downloader.close()
+        self.assertEqual(saved, [b'image data'])
+        # a re-run revalidates the saved image
+        downloader = ImageDownloader(validators_path=self.validators_path)
+        downloader.submit(self.server.url('/cover.jpg'), saved.append)
+        downloader.flush()
+        self.assertEqual(saved, [b'image data'])
+        self.assertEqual(downloader.stats()['not_modified'], 1)
+        self.assertIn('If-None-Match', self.server.requests[-1][1])
+        # a changed image is downloaded
+        self.server.images['/cover.jpg'] = b'new image data'
+        downloader.submit(self.server.url('/cover.jpg'), saved.append)
+        downloader.close()
+        self.assertEqual(saved, [b'image data', b'new image data'])
+
+    def test_failed_save_is_downloaded_again(self):
+        def fail(image):
+            raise OSError('disk full')
+
+        saved = []
+        downloader = ImageDownloader(validators_path=self.validators_path)
+        downloader.submit(self.server.url('/cover.jpg'), fail)
+        downloader.flush()
+        downloader.submit(self.server.url('/cover.jpg'), saved.append)
+        downloader.close()
+        self.assertEqual(saved, [b'image data'])
+
+    def test_missing_image(self):
+        saved = []
+        downloader = ImageDownloader(retries=0)
+        downloader.submit(self.server.url('/missing.jpg'), saved.append)
+        downloader.close()
+        self.assertEqual(saved, [])
+        self.assertEqual(downloader.stats()['failures'], 1)
+
+    def test_on_saved(self):
+        done = []
+        downloader = ImageDownloader(
+            retries=0, validators_path=self.validators_path)
+        for path in ('/cover.jpg', '/missing.jpg'):
+            downloader.submit(self.server.url(path), lambda image: None,
+                              on_saved=lambda path=path: done.append(path))
+        downloader.flush()
+        # an unchanged image is saved already
+        downloader.submit(self.server.url('/cover.jpg'), lambda image: None,
+                          on_saved=lambda: done.append('not modified'))
+        downloader.close()
+        self.assertEqual(done, ['/cover.jpg', 'not modified'])
+        self.assertEqual(downloader.stats()['not_modified'], 1)
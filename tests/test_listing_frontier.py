@@ -0,0 +1,66 @@
+import unittest
+import os
+import tempfile
+from listing_frontier import ListingFrontier
+from helpers import FakeBookScraper, FakeStorage, make_scraper
+
+
+class JumpingBookScraper(FakeBookScraper):
+    def _go_to_page(self, page):
+        self.page = page
+        return True
+
+
+class TestListingFrontier(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'frontier.db')
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def test_pages(self):
+        frontier = ListingFrontier(self.path, ttl=60)
+        frontier.record_page('listing', 1, ['a', 'b'], is_last=False)
+        self.assertEqual(frontier.get_page('listing', 1), (['a', 'b'], False))
+        frontier.mark_last_page('listing', 1)
+        self.assertEqual(frontier.get_page('listing', 1), (['a', 'b'], True))
+        self.assertIsNone(frontier.get_page('listing', 2))
+        self.assertIsNone(frontier.get_page('other', 1))
+        frontier = ListingFrontier(self.path, ttl=0)
+        self.assertIsNone(frontier.get_page('listing', 1))
+
+    def test_restart_jumps_to_new_page(self):
+        storage = FakeStorage()
+        frontier = ListingFrontier(self.path)
+        scraper = make_scraper(
+            storage=storage, cls=JumpingBookScraper, frontier=frontier)
+        scraper.scrape_books(num_books=7, num_reviews=2)
+        self.assertEqual(scraper.visited_pages, [1, 2])
+        scraper = make_scraper(
+            storage=storage, cls=JumpingBookScraper, frontier=frontier)
+        scraper.scrape_books(num_books=12, num_reviews=2)
+        # pages 1 and 2 are taken from the frontier
+        self.assertEqual(scraper.visited_pages, [3])
+        self.assertEqual(len(storage.books), 12)
+        scraper = make_scraper(
+            storage=storage, cls=JumpingBookScraper, frontier=frontier)
+        self.assertEqual(scraper._get_urls_to_scrape(15, []),
+                         [f'http://books/{page}-{i}'
+                          for page in range(1, 4) for i in range(5)])
+        self.assertEqual(scraper.visited_pages, [])
+
+    def test_walks_from_first_page_without_jump(self):
+        storage = FakeStorage()
+        frontier = ListingFrontier(self.path)
+        frontier.record_page('http://books', 1, ['http://books/1-0'], False)
+        scraper = make_scraper(storage=storage, frontier=frontier)
+        urls = scraper._get_urls_to_scrape(3, [])
+        self.assertEqual(scraper.visited_pages, [1])
+        self.assertEqual(urls, ['http://books/1-0', 'http://books/1-1',
+                                'http://books/1-2'])
+        # the whole listing is walked and the last page is recorded
+        urls = scraper._get_urls_to_scrape(20, [])
+        scraper = make_scraper(storage=storage, frontier=frontier)
+        self.assertEqual(scraper._get_urls_to_scrape(20, []), urls)
+        self.assertEqual(scraper.visited_pages, [])
@@ -0,0 +1,90 @@
+import unittest
+import os
+import tempfile
+from local_raw_data_storage import LocalRawDataStorage
+from helpers import ImageServer, make_book
+
+
+class TestLocalCatalog(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = self.temp_dir.name
+        self.storage = LocalRawDataStorage(path=self.path)
+
+    def tearDown(self) -> None:
+        self.storage.close()
+        self.temp_dir.cleanup()
+
+    def save_books(self):
+        self.storage.save_book(make_book('isbn-1', ['a', 'b']), [])
+        self.storage.save_book(make_book('isbn-2', ['c']), [])
+        self.storage.save_book(make_book('isbn-2', ['c', 'd']), ['isbn-2'])
+        self.storage.save_book(make_book('isbn-3', ['e']), [])
+
+    def test_resume_queries(self):
+        self.save_books()
+        self.assertEqual(sorted(self.storage.get_saved_book_urls(2)),
+                         ['book_url_isbn-1', 'book_url_isbn-2'])
+        self.assertEqual(sorted(self.storage.get_saved_book_isbns()),
+                         ['isbn-1', 'isbn-2', 'isbn-3'])
+        self.assertEqual(sorted(self.storage.get_saved_review_users('isbn-2')),
+                         ['c', 'd'])
+        self.assertEqual(self.storage.get_saved_review_users('isbn-4'), [])
+
+    def test_files_are_written(self):
+        self.save_books()
+        review_path = os.path.join(
+            self.path, 'raw_data', 'isbn-2', 'reviews')
+        self.assertEqual(sorted(os.listdir(review_path)),
+                         ['c.json', 'd.json'])
+
+    def test_catalog_is_rebuilt_from_files(self):
+        self.save_books()
+        self.storage.close()
+        os.remove(os.path.join(self.path, 'raw_data_catalog.db'))
+        self.storage = LocalRawDataStorage(path=self.path)
+        self.assertEqual(sorted(self.storage.get_saved_book_urls(2)),
+                         ['book_url_isbn-1', 'book_url_isbn-2'])
+        self.assertEqual(sorted(self.storage.get_saved_review_users('isbn-1')),
+                         ['a', 'b'])
+
+    def test_save_book_image(self):
+        self.save_books()
+        server = ImageServer()
+        server.images['/cover.jpg'] = b'image data'
+        server.images['/edition.jpg'] = b'image data'
+        try:
+            self.storage.save_book_image(server.url('/cover.jpg'), 'isbn-1')
+            self.storage.save_book_image(server.url('/edition.jpg'), 'isbn-2')
+            self.storage.flush()
+            with self.assertRaises(Exception):
+                self.storage.save_book_image(
+                    server.url('/cover.jpg'), 'isbn-4')
+        finally:
+            server.close()
+        # the same image is stored once
+        image_path = self.storage.get_image_path('isbn-1')
+        self.assertEqual(self.storage.get_image_path('isbn-2'), image_path)
+        self.assertEqual(len(os.listdir(os.path.dirname(image_path))), 1)
+        with open(image_path, 'rb') as f:
+            self.assertEqual(f.read(), b'image data')
+        self.assertIsNone(self.storage.get_image_path('isbn-3'))
+        # the references are kept in the book folders
+        self.storage.rebuild_catalog()
+        self.assertEqual(self.storage.get_image_path('isbn-2'), image_path)
+
+    def test_sharded_layout(self):
+        self.save_books()
+        self.storage.close()
+        self.storage = LocalRawDataStorage(path=self.path, shard_depth=2)
+        # the flat books are still found
+        self.storage.save_book(make_book('isbn-1', ['f']), ['isbn-1'])
+        self.storage.save_book(make_book('isbn-5', ['g']), [])
+        self.assertEqual(self.storage.get_review('isbn-1', 'f').user, 'f')
+        self.assertEqual(self.storage.migrate_layout(), 3)
+        raw_data = os.path.join(self.path, 'raw_data')
+        self.assertTrue(all(len(name) == 2 for name in os.listdir(raw_data)))
+        self.assertEqual(len(list(self.storage.iter_reviews())), 7)
+        self.storage.rebuild_catalog()
+        self.assertEqual(sorted(self.storage.get_saved_book_isbns()),
+                         ['isbn-1', 'isbn-2', 'isbn-3', 'isbn-5'])
@@ -0,0 +1,63 @@
+import unittest
+from prometheus_client import REGISTRY, CollectorRegistry
+from html_document import HTMLDocument
+from amazon_book_attribute_scraper import AmazonBookAttributeScraper
+from metrics import NoOpMetrics, disable_metrics, enable_metrics, get_metrics
+from test_html_document import BOOK_PAGE, BOOK_URL
+from helpers import make_scraper
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self) -> None:
+        self.registry = CollectorRegistry()
+
+    def tearDown(self) -> None:
+        disable_metrics()
+
+    def test_scraping_without_metrics(self):
+        # metrics enabled before are not recorded once disabled
+        enable_metrics(self.registry)
+        disable_metrics()
+        scraper = make_scraper(export_metric=False)
+        books = scraper.scrape_books(num_books=4, num_reviews=2)
+        self.assertEqual(len(books), 4)
+        get_metrics().extractor_seconds.labels(attribute='title').observe(1)
+        self.assertIsInstance(get_metrics(), NoOpMetrics)
+        self.assertIsNone(REGISTRY.get_sample_value('books_to_scrape'))
+        self.assertIsNone(self.registry.get_sample_value(
+            'dom_wait_seconds_count', {'navigation': 'start_page'}))
+        self.assertIsNone(self.registry.get_sample_value(
+            'extractor_seconds_count', {'attribute': 'title'}))
+
+    def test_metrics_are_enabled_again(self):
+        metrics = enable_metrics(self.registry)
+        disable_metrics()
+        self.assertIs(enable_metrics(self.registry), metrics)
+        get_metrics().books_skipped.inc()
+        self.assertEqual(
+            self.registry.get_sample_value('books_skipped_total'), 1)
+        # another registry gets its own metrics
+        disable_metrics()
+        self.assertIsNot(enable_metrics(CollectorRegistry()), metrics)
+
+    def test_books_to_scrape(self):
+        enable_metrics(self.registry)
+        scraper = make_scraper(export_metric=True)
+        scraper.scrape_books(num_books=4, num_reviews=2)
+        self.assertEqual(self.registry.get_sample_value('books_to_scrape'), 0)
+        self.assertIs(enable_metrics(), get_metrics())
+
+    def test_stages_are_recorded(self):
+        enable_metrics(self.registry)
+        scraper = AmazonBookAttributeScraper(banned_titles=['Library'])
+        scraper._scrape_book_attributes(
+            BOOK_URL, HTMLDocument(BOOK_PAGE, url=BOOK_URL))
+        self.assertEqual(self.registry.get_sample_value(
+            'extractor_seconds_count', {'attribute': 'title'}), 1)
+        self.assertEqual(
+            self.registry.get_sample_value('books_banned_total'), 1)
+        scraper = AmazonBookAttributeScraper()
+        scraper._scrape_book_attributes(
+            BOOK_URL, HTMLDocument(BOOK_PAGE, url=BOOK_URL))
+        self.assertEqual(self.registry.get_sample_value(
+            'extractor_seconds_count', {'attribute': 'image_url'}), 1)
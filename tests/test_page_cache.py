@@ -0,0 +1,81 @@
+import unittest
+import os
+import tempfile
+from prometheus_client import CollectorRegistry
+from metrics import disable_metrics, enable_metrics
+from page_cache import PageCache, normalize_url
+from amazon_book_attribute_scraper import AmazonBookAttributeScraper
+from test_html_document import BOOK_PAGE, BOOK_URL, SnapshotDriver
+
+
+class TestPageCache(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'page_cache')
+
+    def tearDown(self) -> None:
+        disable_metrics()
+        self.temp_dir.cleanup()
+
+    def test_normalize_url(self):
+        self.assertEqual(
+            normalize_url('https://WWW.amazon.com/Book/dp/0525559477/'
+                          'ref=sr_1_1?keywords=x&qid=1&b=2&a=1#reviews'),
+            'https://www.amazon.com/Book/dp/0525559477?a=1&b=2')
+
+    def test_get_and_put(self):
+        cache = PageCache(self.path)
+        self.assertIsNone(cache.get(BOOK_URL))
+        cache.put(BOOK_URL + 'ref=sr_1_1', BOOK_PAGE)
+        self.assertEqual(cache.get(BOOK_URL), BOOK_PAGE)
+        # the page is expired for a page type with a shorter ttl
+        cache = PageCache(self.path, ttls={'book_page': 60, 'listing_page': 0})
+        self.assertIsNone(cache.get(BOOK_URL, 'listing_page'))
+        self.assertEqual(cache.get(BOOK_URL, 'book_page'), BOOK_PAGE)
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+        self.assertEqual([url for url, _ in cache.iter_pages()],
+                         [BOOK_URL + 'ref=sr_1_1'])
+
+    def test_least_recently_used_are_evicted(self):
+        page = os.urandom(1000).hex()
+        cache = PageCache(self.path)
+        cache.put('http://books/1', page)
+        max_size = cache.stats()['size'] * 2
+        cache = PageCache(self.path, max_size=max_size)
+        cache.put('http://books/2', page)
+        cache.get('http://books/1')
+        cache.put('http://books/3', page)
+        self.assertIsNone(cache.get('http://books/2'))
+        self.assertEqual(cache.get('http://books/1'), page)
+        self.assertEqual(cache.stats()['evictions'], 1)
+        self.assertLessEqual(cache.stats()['size'], max_size)
+
+    def test_metrics(self):
+        registry = CollectorRegistry()
+        enable_metrics(registry)
+        page = os.urandom(1000).hex()
+        cache = PageCache(self.path)
+        cache.put('http://books/1', page)
+        cache = PageCache(self.path, max_size=cache.stats()['size'])
+        cache.get('http://books/1')
+        cache.put('http://books/2', page)
+        cache.get('http://books/1')
+        self.assertEqual(registry.get_sample_value(
+            'page_cache_hits_total', {'page_type': 'book_page'}), 1)
+        self.assertEqual(registry.get_sample_value(
+            'page_cache_misses_total', {'page_type': 'book_page'}), 1)
+        self.assertEqual(
+            registry.get_sample_value('page_cache_evictions_total'), 1)
+
+    def test_scraper_uses_cached_page(self):
+        abas = AmazonBookAttributeScraper(
+            snapshot=True, page_cache=PageCache(self.path))
+        abas.scrape_book_attributes_from_page(
+            BOOK_URL, driver=SnapshotDriver(BOOK_PAGE))
+        driver = SnapshotDriver(BOOK_PAGE)
+        book_attributes = abas.scrape_book_attributes_from_page(
+            BOOK_URL, driver=driver)
+        self.assertEqual(book_attributes.pages, 304)
+        self.assertFalse(abas.page_loaded_in_driver)
+        self.assertEqual(driver.calls, 0)
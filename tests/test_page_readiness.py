@@ -0,0 +1,72 @@
+import unittest
+import io
+from contextlib import redirect_stdout
+from selenium.common.exceptions import StaleElementReferenceException
+from html_document import HTMLDocument
+from page_readiness import navigation_wait_times, wait_for_page_ready
+from helpers import make_scraper
+
+
+class LoadingDriver:
+    """Reports the document as loading for the first few checks"""
+    def __init__(self, num_loading) -> None:
+        self.num_loading = num_loading
+        self.num_checks = 0
+
+    def execute_script(self, script):
+        self.num_checks += 1
+        return 'loading' if self.num_checks <= self.num_loading else 'complete'
+
+
+class ReplacedElement:
+    """An element of the previous page that is detached after a few checks"""
+    def __init__(self, num_attached) -> None:
+        self.num_attached = num_attached
+
+    def is_enabled(self):
+        if self.num_attached == 0:
+            raise StaleElementReferenceException()
+        self.num_attached -= 1
+        return True
+
+
+class TestPageReadiness(unittest.TestCase):
+    def setUp(self) -> None:
+        navigation_wait_times.reset()
+
+    def tearDown(self) -> None:
+        navigation_wait_times.reset()
+
+    def test_waits_for_the_page(self):
+        driver = LoadingDriver(num_loading=2)
+        wait_for_page_ready(driver, 'book_page',
+                            stale_element=ReplacedElement(num_attached=1))
+        self.assertEqual(driver.num_checks, 3)
+        wait_for_page_ready(HTMLDocument('<html></html>'), 'book_page')
+        summary = navigation_wait_times.summary()
+        self.assertEqual(summary['book_page']['count'], 2)
+        self.assertGreater(summary['book_page']['max'], 0.1)
+
+    def test_time_out(self):
+        driver = LoadingDriver(num_loading=1000)
+        with redirect_stdout(io.StringIO()) as output:
+            wait_time = wait_for_page_ready(
+                driver, 'review_page', time_out=0.3)
+        self.assertGreaterEqual(wait_time, 0.3)
+        self.assertIn('Timed out waiting for the review_page',
+                      output.getvalue())
+        self.assertEqual(
+            navigation_wait_times.summary()['review_page']['count'], 1)
+
+    def test_wait_times_are_reported(self):
+        scraper = make_scraper()
+        with redirect_stdout(io.StringIO()) as output:
+            scraper.scrape_books(num_books=2, num_reviews=2)
+        # the start page of the scraper
+        self.assertIn('start_page: 1 waits', output.getvalue())
+        # a rerun reports only its own waits
+        navigation_wait_times.record('book_page', 1.0)
+        with redirect_stdout(io.StringIO()) as output:
+            scraper.scrape_books(num_books=4, num_reviews=2)
+        self.assertNotIn('start_page', output.getvalue())
+        self.assertIn('book_page: 1 waits', output.getvalue())
@@ -0,0 +1,152 @@
+import unittest
+from unittest import mock
+import csv
+import dataclasses
+import io
+import os
+import tempfile
+import threading
+from aws_postgres_data_storage import AWSPostgresRDSDataStorage
+from helpers import make_book
+
+
+class TestAWSPostgresRDSDataStorage(unittest.TestCase):
+    """Runs against an SQLite stand-in of the RDS"""
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        path = os.path.join(self.temp_dir.name, 'rds.db')
+        self.rds_config = {'URL': f'sqlite:///{path}'}
+        self.storage = AWSPostgresRDSDataStorage(self.rds_config)
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def test_empty_tables(self):
+        self.assertEqual(self.storage.get_saved_book_urls(0), [])
+        self.assertEqual(self.storage.get_saved_book_isbns(), [])
+        self.assertEqual(self.storage.get_saved_review_users('isbn-1'), [])
+
+    def test_resume_queries(self):
+        self.storage.save_book(make_book('isbn-1', ['a', 'b']), [])
+        self.storage.save_book(make_book('isbn-2', ['c']), [])
+        self.storage.save_book(make_book('isbn-2', ['d']), ['isbn-2'])
+        self.storage.save_book(make_book('isbn-3', ['e']), [])
+        self.assertEqual(sorted(self.storage.get_saved_book_urls(2)),
+                         ['book_url_isbn-1', 'book_url_isbn-2'])
+        self.assertEqual(sorted(self.storage.get_saved_book_isbns()),
+                         ['isbn-1', 'isbn-2', 'isbn-3'])
+        self.assertEqual(sorted(self.storage.get_saved_review_users('isbn-2')),
+                         ['c', 'd'])
+
+    def test_review_users_query_is_parameterized(self):
+        self.storage.save_book(make_book('isbn-1', ['a']), [])
+        users = self.storage.get_saved_review_users("x' OR '1'='1")
+        self.assertEqual(users, [])
+
+    def test_tables_are_reused(self):
+        self.storage.save_book(make_book('isbn-1', ['a']), [])
+        self.storage.close()
+        storage = AWSPostgresRDSDataStorage(self.rds_config)
+        self.assertEqual(storage.get_saved_book_urls(1), ['book_url_isbn-1'])
+
+    def test_rows_are_buffered(self):
+        storage = AWSPostgresRDSDataStorage(self.rds_config, buffer_size=4)
+        other = AWSPostgresRDSDataStorage(self.rds_config)
+        storage.save_book(make_book('isbn-1', ['a']), [])
+        # buffered rows are visible to the storage but not yet written
+        self.assertEqual(storage.get_saved_review_users('isbn-1'), ['a'])
+        self.assertEqual(other.get_saved_book_isbns(), [])
+        # the buffer is written once it is full
+        storage.save_book(make_book('isbn-2', ['b', 'c']), [])
+        self.assertEqual(sorted(other.get_saved_book_isbns()),
+                         ['isbn-1', 'isbn-2'])
+        self.assertEqual(sorted(other.get_saved_review_users('isbn-2')),
+                         ['b', 'c'])
+
+    def test_failed_write_keeps_the_rows(self):
+        storage = AWSPostgresRDSDataStorage(self.rds_config)
+        storage.save_book(make_book('isbn-1', ['a']), [])
+        with mock.patch.object(storage, '_insert_rows',
+                               side_effect=RuntimeError('connection lost')):
+            with self.assertRaises(RuntimeError):
+                storage.flush()
+        self.assertEqual(storage.get_saved_review_users('isbn-1'), ['a'])
+        storage.flush()
+        other = AWSPostgresRDSDataStorage(self.rds_config)
+        self.assertEqual(other.get_saved_review_users('isbn-1'), ['a'])
+        self.assertEqual(other.get_saved_book_isbns(), ['isbn-1'])
+
+    def test_saving_does_not_wait_for_a_write(self):
+        storage = AWSPostgresRDSDataStorage(self.rds_config)
+        storage.save_book(make_book('isbn-1', ['a']), [])
+        insert_rows = storage._insert_rows
+        saved = []
+
+        def slow_insert_rows(connection, table, rows):
+            if saved:
+                insert_rows(connection, table, rows)
+                return
+            # another worker saves a book while the rows are written
+            thread = threading.Thread(target=lambda: saved.append(
+                storage.save_book(make_book('isbn-2', ['b']), [])))
+            thread.start()
+            thread.join(timeout=5)
+            saved.append(thread.is_alive())
+            # the rows being written are still visible
+            saved.append(storage.get_saved_review_users('isbn-1'))
+            insert_rows(connection, table, rows)
+
+        with mock.patch.object(storage, '_insert_rows', slow_insert_rows):
+            storage.flush()
+        self.assertEqual(saved, [None, False, ['a']])
+        storage.flush()
+        self.assertEqual(sorted(storage.get_saved_book_isbns()),
+                         ['isbn-1', 'isbn-2'])
+
+    def test_postgres_copy(self):
+        cursor = mock.MagicMock()
+        connection = mock.MagicMock()
+        connection.dialect.name = 'postgresql'
+        connection.dialect.identifier_preparer.quote = lambda name: f'"{name}"'
+        connection.connection.cursor.return_value = cursor
+        book = make_book('isbn-1', ['a', 'b'])
+        book.attributes.author = None
+        self.storage._insert_rows(
+            connection, self.storage._attribute_table,
+            [dataclasses.asdict(book.attributes)])
+        self.storage._insert_rows(
+            connection, self.storage._review_table,
+            [dataclasses.asdict(review) for review in book.reviews])
+        (attribute_sql, attribute_csv), (review_sql, review_csv) = [
+            call.args for call in cursor.copy_expert.call_args_list]
+        self.assertEqual(
+            review_sql, 'COPY "book_reviews" ("isbn", "text", "rating", '
+            '"user") FROM STDIN WITH (FORMAT csv, NULL \'\\N\')')
+        self.assertEqual(review_csv.getvalue(),
+                         'isbn-1,text a,3,a\r\nisbn-1,text b,3,b\r\n')
+        self.assertTrue(attribute_sql.startswith(
+            'COPY "book_attributes" ("title", "isbn", "uuid", "author",'))
+        self.assertEqual(list(csv.reader(io.StringIO(
+            attribute_csv.getvalue())))[0][:4],
+            ['Title', 'isbn-1', 'uuid', '\\N'])
+        self.assertEqual(cursor.close.call_count, 2)
+        connection.execute.assert_not_called()
+
+    def test_compiled_queries_are_reused(self):
+        self.storage.save_book(make_book('isbn-1', ['a']), [])
+        self.storage.flush()
+        cache = self.storage._rds_engine._compiled_cache
+        self.assertGreaterEqual(cache.capacity, 500)
+        for i in range(3):
+            self.storage.get_saved_book_urls(i)
+            self.storage.get_saved_book_isbns()
+            self.storage.get_saved_review_users(f'isbn-{i}')
+            if i == 0:
+                num_compiled = len(cache)
+        # other parameters do not compile the queries again
+        self.assertEqual(len(cache), num_compiled)
+        with self.storage._rds_engine.connect() as connection:
+            result = connection.execute(
+                self.storage._review_users_query, {'isbn': 'isbn-9'})
+            self.assertIs(result.context.cache_hit,
+                          connection.dialect.CACHE_HIT)
@@ -0,0 +1,178 @@
+import unittest
+import io
+import os
+import tempfile
+from contextlib import redirect_stdout
+from unittest import mock
+from sqlalchemy import func, select
+from amazon_book_attribute_scraper import AmazonBookAttributeScraper
+from amazon_automated_book_review_scraper import AmazonAutomatedBookReviewScraper
+from aws_postgres_data_storage import AWSPostgresRDSDataStorage
+from html_document import HTMLDocument
+from local_raw_data_storage import LocalRawDataStorage
+from replay import main, replay_snapshots
+from snapshot_archive import SnapshotArchive
+from test_html_document import BOOK_PAGE, BOOK_URL
+
+REVIEW = """
+<div data-hook="review"><div><div>
+  <div><a class="a-link-normal" title="{rating}.0 out of 5 stars">stars</a></div>
+  <div class="a-profile-content"><span class="a-profile-name">{user}</span></div>
+  <span data-hook="review-body"><span>{text}</span></span>
+</div></div></div>
+"""
+REVIEW_PAGE_URL = ('https://www.amazon.com/Midnight-Library-Novel-Matt-Haig/'
+                   'product-reviews/0525559477/ref=cm_cr_arp_d_paging_btm_next'
+                   '_{page}?ie=UTF8&pageNumber={page}')
+
+
+def make_review_page(users):
+    reviews = ''.join(REVIEW.format(rating=4, user=user, text=f'text {user}')
+                      for user in users)
+    return (f'<html><body><div id="cm_cr-review_list">{reviews}</div>'
+            '</body></html>')
+
+
+class ReviewPagesDriver:
+    """Replaces the reviews in place, the url stays the one of the first
+    review page"""
+    def __init__(self, pages) -> None:
+        self.pages = pages
+        self.page = 0
+        self.current_url = REVIEW_PAGE_URL.format(page=1)
+
+    @property
+    def page_source(self):
+        return self.pages[self.page]
+
+    def find_elements(self, by, value):
+        return HTMLDocument(self.page_source).find_elements(by, value)
+
+
+class InPlaceReviewScraper(AmazonAutomatedBookReviewScraper):
+    @staticmethod
+    def _get_to_first_review_page(driver):
+        pass
+
+    @staticmethod
+    def _go_to_next_review_page_if_available(driver):
+        if driver.page + 1 >= len(driver.pages):
+            return False
+        driver.page += 1
+        return True
+
+
+class TestReplay(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = self.temp_dir.name
+        self.archive = SnapshotArchive(os.path.join(self.path, 'archive'))
+        self.archive.put(BOOK_URL, BOOK_PAGE)
+        self.archive.put(REVIEW_PAGE_URL.format(page=1),
+                         make_review_page(['a', 'b']), page_number=1)
+        self.archive.put(REVIEW_PAGE_URL.format(page=2),
+                         make_review_page(['b', 'c']), page_number=2)
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def test_replay(self):
+        storage = LocalRawDataStorage(path=self.path)
+        num_books = replay_snapshots(
+            self.archive, AmazonBookAttributeScraper(), storage,
+            review_scraper=AmazonAutomatedBookReviewScraper(),
+            num_processes=2)
+        self.assertEqual(num_books, 1)
+        isbn = 'ISBN-13-978-0525559474'
+        self.assertEqual(storage.get_saved_book_urls(3), [BOOK_URL])
+        self.assertEqual(sorted(storage.get_saved_review_users(isbn)),
+                         ['a', 'b', 'c'])
+        review = storage.get_review(isbn, 'c')
+        self.assertEqual((review.text, review.rating), ('text c', 4))
+        # replaying again saves nothing new
+        replay_snapshots(
+            self.archive, AmazonBookAttributeScraper(), storage,
+            review_scraper=AmazonAutomatedBookReviewScraper(),
+            num_processes=2)
+        self.assertEqual(len(list(storage.iter_reviews())), 3)
+        storage.close()
+
+    def test_review_pages_replaced_in_place(self):
+        archive = SnapshotArchive(os.path.join(self.path, 'in_place'))
+        archive.put(BOOK_URL, BOOK_PAGE)
+        driver = ReviewPagesDriver([make_review_page(['a', 'b']),
+                                    make_review_page(['c', 'd']),
+                                    make_review_page(['e'])])
+        reviews = InPlaceReviewScraper(archive=archive).scrape_book_reviews(
+            'isbn', num=5, driver=driver, skip_users=[])
+        self.assertEqual(len(reviews), 5)
+        # each page is archived although the url did not change
+        self.assertEqual(len(archive.get_page_files()), 4)
+        storage = LocalRawDataStorage(path=self.path)
+        replay_snapshots(
+            archive, AmazonBookAttributeScraper(), storage,
+            review_scraper=AmazonAutomatedBookReviewScraper(),
+            num_processes=1)
+        self.assertEqual(
+            sorted(storage.get_saved_review_users('ISBN-13-978-0525559474')),
+            ['a', 'b', 'c', 'd', 'e'])
+        storage.close()
+
+    def test_overwrite_attributes_in_rds(self):
+        storage = LocalRawDataStorage(path=self.path)
+        rds_storage = AWSPostgresRDSDataStorage(
+            {'URL': f"sqlite:///{os.path.join(self.path, 'rds.db')}"})
+        for _ in range(2):
+            replay_snapshots(
+                self.archive, AmazonBookAttributeScraper(), storage,
+                review_scraper=AmazonAutomatedBookReviewScraper(),
+                rds_data_storage=rds_storage, num_processes=1,
+                overwrite_attributes=True)
+        # the attributes are replaced, not added again
+        with rds_storage._rds_engine.connect() as connection:
+            num_rows = connection.execute(select(func.count()).select_from(
+                rds_storage._attribute_table)).scalar()
+        self.assertEqual(num_rows, 1)
+        self.assertEqual(rds_storage.get_saved_book_isbns(),
+                         ['ISBN-13-978-0525559474'])
+        self.assertEqual(len(rds_storage.get_saved_review_users(
+            'ISBN-13-978-0525559474')), 3)
+        rds_storage.close()
+        storage.close()
+
+    def test_main_saves_in_rds(self):
+        rds_url = f"sqlite:///{os.path.join(self.path, 'rds.db')}"
+        argv = [os.path.join(self.path, 'archive'), 'rds',
+                '--rds-url', rds_url, '--processes', '2']
+        with redirect_stdout(io.StringIO()) as output:
+            main(argv)
+        self.assertIn('Replayed 1 books', output.getvalue())
+        rds_storage = AWSPostgresRDSDataStorage({'URL': rds_url})
+        self.assertEqual(rds_storage.get_saved_book_isbns(),
+                         ['ISBN-13-978-0525559474'])
+        self.assertEqual(sorted(rds_storage.get_saved_review_users(
+            'ISBN-13-978-0525559474')), ['a', 'b', 'c'])
+        rds_storage.close()
+
+    def test_pages_in_any_order(self):
+        files = self.archive.get_page_files()
+        book_file = next(file for file in files
+                         if SnapshotArchive.read_page(file)[0] == BOOK_URL)
+        review_files = [file for file in files if file != book_file]
+        for i, order in enumerate(
+                ([book_file] + review_files,
+                 review_files[:1] + [book_file] + review_files[1:],
+                 review_files + [book_file])):
+            path = os.path.join(self.path, f'storage-{i}')
+            os.mkdir(path)
+            storage = LocalRawDataStorage(path=path)
+            with mock.patch.object(self.archive, 'get_page_files',
+                                   return_value=order):
+                replay_snapshots(
+                    self.archive, AmazonBookAttributeScraper(), storage,
+                    review_scraper=AmazonAutomatedBookReviewScraper(),
+                    num_processes=1)
+            self.assertEqual(sorted(storage.get_saved_review_users(
+                'ISBN-13-978-0525559474')), ['a', 'b', 'c'])
+            self.assertEqual(len(list(storage.iter_reviews())), 3)
+            storage.close()
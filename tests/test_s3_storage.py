@@ -0,0 +1,175 @@
+import unittest
+from unittest import mock
+import io
+import os
+import tempfile
+from contextlib import redirect_stdout
+import boto3
+from moto import mock_aws
+from s3_raw_data_storage import S3RawDataStorage
+from helpers import ImageServer, make_book
+
+BUCKET = 'test-bucket'
+
+
+class TestS3RawDataStorage(unittest.TestCase):
+    def setUp(self) -> None:
+        # the image validators are kept in the cache folder
+        self.temp_dir = tempfile.TemporaryDirectory()
+        patcher = mock.patch('s3_raw_data_storage.CACHE_DIR',
+                             os.path.join(self.temp_dir.name, 'cache'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mock = mock_aws()
+        self.mock.start()
+        os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+        self.s3 = boto3.client('s3')
+        self.s3.create_bucket(Bucket=BUCKET)
+
+    def tearDown(self) -> None:
+        self.mock.stop()
+        self.temp_dir.cleanup()
+
+    def test_resume_queries(self):
+        storage = S3RawDataStorage(path=None, bucket=BUCKET)
+        storage.save_book(make_book('isbn-1', ['a', 'b']), [])
+        storage.save_book(make_book('isbn-2', ['c']), [])
+        storage.save_book(make_book('isbn-2', ['d']), ['isbn-2'])
+        storage.flush()
+        self.assertEqual(sorted(storage.get_saved_book_urls(2)),
+                         ['book_url_isbn-1', 'book_url_isbn-2'])
+        self.assertEqual(storage.get_saved_book_urls(3), [])
+        self.assertEqual(sorted(storage.get_saved_book_isbns()),
+                         ['isbn-1', 'isbn-2'])
+        self.assertEqual(sorted(storage.get_saved_review_users('isbn-2')),
+                         ['c', 'd'])
+        self.assertEqual(storage.get_saved_review_users('isbn-3'), [])
+
+    def test_manifest_is_persisted(self):
+        storage = S3RawDataStorage(path=None, bucket=BUCKET)
+        storage.save_book(make_book('isbn-1', ['a']), [])
+        storage.close()
+        storage = S3RawDataStorage(path=None, bucket=BUCKET)
+        self.assertEqual(storage.get_saved_book_urls(1), ['book_url_isbn-1'])
+        self.assertEqual(storage.get_saved_review_users('isbn-1'), ['a'])
+
+    def test_manifest_is_built_from_saved_objects(self):
+        storage = S3RawDataStorage(path=None, bucket=BUCKET)
+        storage.save_book(make_book('isbn-1', ['a', 'b', 'the_json_fan']), [])
+        storage.close()
+        # a bucket written before the manifest existed
+        self.s3.delete_object(Bucket=BUCKET, Key=storage._manifest_key)
+        storage = S3RawDataStorage(path=None, bucket=BUCKET)
+        self.assertEqual(storage.get_saved_book_urls(3), ['book_url_isbn-1'])
+        self.assertEqual(sorted(storage.get_saved_review_users('isbn-1')),
+                         ['a', 'b', 'the_json_fan'])
+
+    def test_failed_uploads_are_not_in_manifest(self):
+        storage = S3RawDataStorage(path=None, bucket=BUCKET, max_attempts=1)
+        storage._s3_bucket = 'missing-bucket'
+        storage.save_book(make_book('isbn-1', ['a']), [])
+        storage.flush()
+        self.assertEqual(storage.get_saved_book_isbns(), [])
+        self.assertEqual(storage.get_saved_review_users('isbn-1'), [])
+
+    def test_save_book_image(self):
+        storage = S3RawDataStorage(path=None, bucket=BUCKET)
+        storage.save_book(make_book('isbn-1', ['a']), [])
+        server = ImageServer()
+        server.images['/cover.jpg'] = b'image data'
+        server.images['/edition.jpg'] = b'image data'
+        try:
+            storage.save_book_image(server.url('/cover.jpg'), 'isbn-1')
+            storage.save_book_image(server.url('/edition.jpg'), 'isbn-2')
+            storage.close()
+        finally:
+            server.close()
+        # the same image is stored once
+        image_key = storage.get_image_key('isbn-1')
+        self.assertEqual(storage.get_image_key('isbn-2'), image_key)
+        keys = [obj['Key'] for obj in self.s3.list_objects_v2(
+            Bucket=BUCKET, Prefix='raw_data_images/')['Contents']]
+        self.assertEqual(keys, [image_key])
+        response = self.s3.get_object(Bucket=BUCKET, Key=image_key)
+        self.assertEqual(response['Body'].read(), b'image data')
+        # the references are kept with the books
+        self.s3.delete_object(
+            Bucket=BUCKET, Key='raw_data_manifest.json.gz')
+        storage = S3RawDataStorage(path=None, bucket=BUCKET)
+        self.assertEqual(storage.get_image_key('isbn-1'), image_key)
+        self.assertEqual(storage.get_image_key('isbn-2'), image_key)
+
+    def test_unchanged_image_is_not_downloaded_again(self):
+        server = ImageServer()
+        server.images['/cover.jpg'] = b'image data'
+        try:
+            for _ in range(2):
+                storage = S3RawDataStorage(path=None, bucket=BUCKET)
+                storage.save_book(make_book('isbn-1', ['a']), [])
+                storage.save_book_image(server.url('/cover.jpg'), 'isbn-1')
+                storage.close()
+        finally:
+            server.close()
+        # the re-run revalidated the image with the kept validators
+        self.assertIn('If-None-Match', server.requests[-1][1])
+        self.assertEqual(storage._image_downloader.stats()['not_modified'], 1)
+        self.assertTrue(os.path.isfile(os.path.join(
+            self.temp_dir.name, 'cache', f'{BUCKET}_raw_data_images.db')))
+        self.assertFalse(os.path.exists(f'{BUCKET}_raw_data_images.db'))
+        # an explicit cache folder
+        cache_dir = os.path.join(self.temp_dir.name, 'state')
+        S3RawDataStorage(path=None, bucket=BUCKET, cache_dir=cache_dir).close()
+        self.assertTrue(os.path.isfile(os.path.join(
+            cache_dir, f'{BUCKET}_raw_data_images.db')))
+
+    def test_sharded_layout(self):
+        storage = S3RawDataStorage(path=None, bucket=BUCKET)
+        storage.save_book(make_book('isbn-1', ['a']), [])
+        storage.close()
+        storage = S3RawDataStorage(path=None, bucket=BUCKET, shard_depth=2)
+        storage.save_book(make_book('isbn-2', ['b']), [])
+        self.assertEqual(storage.migrate_layout(), 1)
+        keys = [obj['Key'] for obj in
+                self.s3.list_objects_v2(Bucket=BUCKET)['Contents']]
+        self.assertNotIn('raw_data/isbn-1/data.json', keys)
+        storage.close()
+        # the manifest is rebuilt from the sharded keys
+        self.s3.delete_object(Bucket=BUCKET, Key=storage._manifest_key)
+        storage = S3RawDataStorage(path=None, bucket=BUCKET, shard_depth=2)
+        self.assertEqual(sorted(storage.get_saved_book_urls(1)),
+                         ['book_url_isbn-1', 'book_url_isbn-2'])
+        self.assertEqual(storage.get_saved_review_users('isbn-1'), ['a'])
+        self.assertEqual(storage._get_book_prefix('isbn-1'),
+                         storage._get_sharded_prefix('isbn-1'))
+
+    def test_migration_keeps_the_objects_on_errors(self):
+        storage = S3RawDataStorage(path=None, bucket=BUCKET)
+        storage.save_book(make_book('isbn-1', ['a']), [])
+        storage.save_book(make_book('isbn-2', ['b']), [])
+        storage.close()
+        storage = S3RawDataStorage(path=None, bucket=BUCKET, shard_depth=2)
+        put_object = storage._put_object
+        manifest_puts = []
+
+        def failing_manifest_put(object_type, file_key, body):
+            if object_type == 'manifest':
+                manifest_puts.append(file_key)
+                # the first move is not recorded
+                if len(manifest_puts) == 1:
+                    raise RuntimeError('manifest not saved')
+            put_object(object_type, file_key, body)
+
+        with mock.patch.object(storage, '_put_object', failing_manifest_put), \
+                mock.patch.object(storage._s3_client, 'delete_object',
+                                  side_effect=RuntimeError('denied')), \
+                redirect_stdout(io.StringIO()) as output:
+            self.assertEqual(storage.migrate_layout(), 2)
+        keys = [obj['Key'] for obj in
+                self.s3.list_objects_v2(Bucket=BUCKET)['Contents']]
+        # the manifest saved after the first move still pointed to the old
+        # objects, and the old objects of the second could not be deleted
+        self.assertIn('raw_data/isbn-1/data.json', keys)
+        self.assertIn('raw_data/isbn-2/data.json', keys)
+        self.assertIn('Could not save the manifest in S3', output.getvalue())
+        self.assertIn('Could not delete the old object', output.getvalue())
+        storage.close()
@@ -0,0 +1,157 @@
+import unittest
+from unittest import mock
+import os
+import tempfile
+from scrape_journal import MAX_SKIP_ATTEMPTS, ScrapeJournal
+from helpers import FakeAttributeScraper, FakeStorage, make_scraper
+
+
+class JournalStorage(FakeStorage):
+    """The resume queries are answered by the journal"""
+    def get_saved_book_urls(self, num_reviews):
+        raise AssertionError('answered by the journal')
+
+    def get_saved_review_users(self, isbn):
+        return [review.user for review in self.books[isbn].reviews]
+
+
+class StoppedStorage(JournalStorage):
+    """The scraper is stopped before the images are downloaded"""
+    def flush(self):
+        pass
+
+
+class SkippingAttributeScraper(FakeAttributeScraper):
+    """The second book of the listing can not be scraped"""
+    def __init__(self, skip_reason='banned') -> None:
+        super().__init__()
+        self.reason = skip_reason
+
+    def scrape_book_attributes_from_page(self, url, driver=None):
+        if url == 'http://books/1-1':
+            self.urls.append(url)
+            self.skip_reason = self.reason
+            return None
+        self.skip_reason = None
+        return super().scrape_book_attributes_from_page(url, driver)
+
+
+class TestScrapeJournal(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'journal.db')
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def test_states(self):
+        journal = ScrapeJournal(self.path)
+        self.assertTrue(journal.is_empty())
+        journal.seed([('isbn-0', 'url-0', ['a', 'b'])])
+        journal.add_discovered(['url-0', 'url-1', 'url-2', 'url-3'])
+        journal.book_saved('url-1', 'isbn-1', ['c'], 'image-1')
+        self.assertEqual(journal.get_books_without_image(),
+                         [('url-1', 'isbn-1', 'image-1')])
+        journal.image_saved('url-1', 'isbn-1')
+        self.assertEqual(journal.get_books_without_image(), [])
+        journal.book_skipped('url-2', 'banned')
+        self.assertEqual(journal.get_skipped_urls(), ['url-2'])
+        self.assertEqual(journal.get_pending_urls(), ['url-3'])
+        # a transient skip is tried again until MAX_SKIP_ATTEMPTS
+        for _ in range(MAX_SKIP_ATTEMPTS - 1):
+            journal.book_skipped('url-3', 'no_isbn')
+            self.assertEqual(journal.get_skipped_urls(), ['url-2'])
+        journal.book_skipped('url-3', 'no_isbn')
+        self.assertEqual(sorted(journal.get_skipped_urls()),
+                         ['url-2', 'url-3'])
+        self.assertEqual(journal.get_pending_urls(), [])
+        self.assertEqual(journal.get_saved_book_urls(2), ['url-0'])
+        self.assertEqual(sorted(journal.get_saved_book_isbns()),
+                         ['isbn-0', 'isbn-1'])
+        self.assertEqual(journal.get_unconfirmed_books(), [('url-1', 'isbn-1')])
+        journal.checkpoint()
+        self.assertEqual(journal.get_unconfirmed_books(), [])
+        journal.close()
+
+    def test_restart_continues(self):
+        storage = JournalStorage()
+        scraper = make_scraper(
+            FakeAttributeScraper(max_books=3), storage,
+            journal=ScrapeJournal(self.path))
+        with self.assertRaises(RuntimeError):
+            scraper.scrape_books(num_books=8, num_reviews=2)
+        # the urls discovered before the crash are scraped first
+        attribute_scraper = FakeAttributeScraper()
+        scraper = make_scraper(
+            attribute_scraper, storage, journal=ScrapeJournal(self.path))
+        books = scraper.scrape_books(num_books=8, num_reviews=2)
+        self.assertEqual(attribute_scraper.urls[:2],
+                         ['http://books/1-3', 'http://books/1-4'])
+        self.assertEqual(len(books), 5 + int(5 * 0.05))
+        self.assertEqual(len(storage.books), 8)
+
+    def test_lost_writes_are_scraped_again(self):
+        storage = JournalStorage()
+        journal = ScrapeJournal(self.path)
+        journal.seed([])
+        scraper = make_scraper(
+            FakeAttributeScraper(max_books=3), storage, journal=journal)
+        # killed before the storages were flushed
+        with mock.patch.object(journal, 'checkpoint'), \
+                self.assertRaises(RuntimeError):
+            scraper.scrape_books(num_books=8, num_reviews=2)
+        # the storage lost the last book
+        del storage.books['1-2']
+        attribute_scraper = FakeAttributeScraper()
+        scraper = make_scraper(
+            attribute_scraper, storage, journal=ScrapeJournal(self.path))
+        scraper.scrape_books(num_books=8, num_reviews=2)
+        self.assertEqual(attribute_scraper.urls[0], 'http://books/1-2')
+
+    def test_images_saved_after_a_restart(self):
+        storage = StoppedStorage()
+        journal = ScrapeJournal(self.path)
+        scraper = make_scraper(storage=storage, journal=journal)
+        scraper.scrape_books(num_books=3, num_reviews=2)
+        # the images were still being downloaded
+        self.assertEqual(len(storage.books), 3)
+        self.assertEqual(len(journal.get_books_without_image()), 3)
+        restarted_storage = JournalStorage()
+        restarted_storage.books = storage.books
+        journal = ScrapeJournal(self.path)
+        attribute_scraper = FakeAttributeScraper()
+        scraper = make_scraper(
+            attribute_scraper, restarted_storage, journal=journal)
+        scraper.scrape_books(num_books=3, num_reviews=2)
+        self.assertEqual(attribute_scraper.urls, [])
+        self.assertEqual(sorted(restarted_storage.images),
+                         ['1-0', '1-1', '1-2'])
+        self.assertEqual(journal.get_books_without_image(), [])
+
+    def test_skipped_books_are_not_scraped_again(self):
+        scraper = make_scraper(
+            SkippingAttributeScraper(), JournalStorage(),
+            journal=ScrapeJournal(self.path))
+        books = scraper.scrape_books(num_books=3, num_reviews=2)
+        self.assertEqual(len(books), 2)
+        attribute_scraper = SkippingAttributeScraper()
+        scraper = make_scraper(
+            attribute_scraper, JournalStorage(),
+            journal=ScrapeJournal(self.path))
+        scraper.scrape_books(num_books=4, num_reviews=2)
+        self.assertNotIn('http://books/1-1', attribute_scraper.urls)
+
+    def test_transient_skips_are_scraped_again(self):
+        scraper = make_scraper(
+            SkippingAttributeScraper('no_isbn'), JournalStorage(),
+            journal=ScrapeJournal(self.path))
+        books = scraper.scrape_books(num_books=3, num_reviews=2)
+        self.assertEqual(len(books), 2)
+        # the page is complete on the next run
+        attribute_scraper = FakeAttributeScraper()
+        storage = JournalStorage()
+        scraper = make_scraper(
+            attribute_scraper, storage, journal=ScrapeJournal(self.path))
+        scraper.scrape_books(num_books=4, num_reviews=2)
+        self.assertIn('http://books/1-1', attribute_scraper.urls)
+        self.assertIn('1-1', storage.books)
@@ -0,0 +1,128 @@
+import unittest
+import os
+import tempfile
+from unittest import mock
+from segment_log import INDEX_FILE, SORTED_INDEX_FILE, SegmentLog
+from local_raw_data_storage import LocalRawDataStorage
+from helpers import make_book
+
+
+class TestSegmentLog(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = self.temp_dir.name
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def test_segments_are_rotated(self):
+        log = SegmentLog(self.path, segment_size=64)
+        for i in range(10):
+            log.append('isbn-1', f'user-{i}', f'record {i}'.encode())
+        self.assertGreater(len([file for file in os.listdir(self.path)
+                                if file.startswith('segment-')]), 1)
+        self.assertEqual(bytes(log.get('isbn-1', 'user-7')), b'record 7')
+        self.assertIsNone(log.get('isbn-2', 'user-7'))
+        self.assertEqual([bytes(record) for record in log.scan()],
+                         [f'record {i}'.encode() for i in range(10)])
+        log.close()
+
+    def test_log_is_reopened(self):
+        log = SegmentLog(self.path, segment_size=64)
+        for i in range(5):
+            log.append('isbn-1', f'user-{i}', f'record {i}'.encode())
+        log.close()
+        # a partly written index entry of a crashed write
+        with open(os.path.join(self.path, INDEX_FILE), mode='ab') as f:
+            f.write(b'partial')
+        log = SegmentLog(self.path, segment_size=64)
+        self.assertEqual(len(log), 5)
+        log.append('isbn-1', 'user-5', b'record 5')
+        self.assertEqual(bytes(log.get('isbn-1', 'user-0')), b'record 0')
+        self.assertEqual(len(list(log.scan())), 6)
+        log.close()
+
+    def test_storage_segments_layout(self):
+        storage = LocalRawDataStorage(path=self.path, layout='segments')
+        storage.save_book(make_book('isbn-1', ['a', 'b']), [])
+        storage.save_book(make_book('isbn-1', ['b', 'c']), ['isbn-1'])
+        self.assertFalse(os.path.isdir(
+            os.path.join(self.path, 'raw_data', 'isbn-1', 'reviews')))
+        self.assertEqual(storage.get_review('isbn-1', 'c').text, 'text c')
+        self.assertEqual(len(list(storage.iter_reviews())), 3)
+        storage.close()
+        # the catalog is rebuilt from the attributes and the review log
+        os.remove(os.path.join(self.path, 'raw_data_catalog.db'))
+        storage = LocalRawDataStorage(path=self.path, layout='segments')
+        self.assertEqual(sorted(storage.get_saved_review_users('isbn-1')),
+                         ['a', 'b', 'c'])
+        storage.close()
+
+    def test_scan_skips_replaced_records(self):
+        log = SegmentLog(self.path, segment_size=64)
+        log.append('isbn-1', 'user-1', b'record 1')
+        log.append('isbn-1', 'user-2', b'record 2')
+        log.append('isbn-1', 'user-1', b'record 1 edited')
+        self.assertEqual([bytes(record) for record in log.scan()],
+                         [b'record 2', b'record 1 edited'])
+        log.close()
+
+    def test_segment_is_remapped_when_outgrown(self):
+        log = SegmentLog(self.path)
+        log.append('isbn-1', 'user-0', b'record 0')
+        segment_map = log._get_map(1, 1)
+        for i in range(1, 100):
+            log.append('isbn-1', f'user-{i}', f'record {i}'.encode())
+            self.assertEqual(bytes(log.get('isbn-1', f'user-{i}')),
+                             f'record {i}'.encode())
+        self.assertEqual(len(list(log.scan())), 100)
+        self.assertIs(log._maps[1], segment_map)
+        log.close()
+        # the unused space of the segment is dropped
+        self.assertLess(os.path.getsize(
+            os.path.join(self.path, 'segment-000001.log')), 2000)
+
+    def test_index_is_merged_into_the_sorted_index(self):
+        with mock.patch('segment_log.MERGE_SIZE', 4):
+            log = SegmentLog(self.path, segment_size=64)
+            for i in range(10):
+                log.append('isbn-1', f'user-{i}', f'record {i}'.encode())
+            log.append('isbn-1', 'user-3', b'record 3 edited')
+            # merged twice, the last entries are not merged yet
+            self.assertEqual(len(log._recent), 3)
+            self.assertEqual(len(log), 10)
+            self.assertEqual(bytes(log.get('isbn-1', 'user-3')),
+                             b'record 3 edited')
+            self.assertEqual(bytes(log.get('isbn-1', 'user-0')), b'record 0')
+            self.assertNotIn(('isbn-1', 'user-10'), log)
+            log.close()
+            self.assertEqual(os.path.getsize(
+                os.path.join(self.path, SORTED_INDEX_FILE)), 8 + 10 * 32)
+            log = SegmentLog(self.path, segment_size=64)
+            # the sorted index is mapped, nothing is read into RAM
+            self.assertEqual(log._recent, {})
+            self.assertEqual(len(log), 10)
+            self.assertEqual(
+                [bytes(record) for record in log.scan()],
+                [f'record {i}'.encode() for i in range(10) if i != 3] +
+                [b'record 3 edited'])
+            log.close()
+
+    def test_unmerged_entries_are_read_when_reopened(self):
+        log = SegmentLog(self.path, segment_size=64)
+        log.append('isbn-1', 'user-0', b'record 0')
+        log.close()
+        log = SegmentLog(self.path, segment_size=64)
+        log.append('isbn-1', 'user-1', b'record 1')
+        log.append('isbn-1', 'user-0', b'record 0 edited')
+        # a crash before the entries are merged
+        log._segment_file.close()
+        log._index_file.close()
+        log = SegmentLog(self.path, segment_size=64)
+        self.assertEqual(len(log._recent), 2)
+        self.assertEqual(len(log), 2)
+        self.assertEqual(bytes(log.get('isbn-1', 'user-0')),
+                         b'record 0 edited')
+        self.assertEqual([bytes(record) for record in log.scan()],
+                         [b'record 1', b'record 0 edited'])
+        log.close()
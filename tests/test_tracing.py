@@ -0,0 +1,56 @@
+import unittest
+import json
+import os
+import pstats
+import tempfile
+from tracing import BookProfiler, Tracer
+from helpers import make_scraper
+
+
+class TestTracing(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'trace')
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def test_book_spans(self):
+        tracer = Tracer(self.path)
+        make_scraper(tracer=tracer, num_workers=2).scrape_books(
+            num_books=3, num_reviews=2)
+        tracer.close()
+        with open(self.path) as f:
+            spans = [json.loads(line) for line in f]
+        books = {span['span_id']: span for span in spans
+                 if span['name'] == 'book'}
+        self.assertEqual(len(books), 3)
+        self.assertEqual(sorted(span['args']['isbn'] for span in books.values()),
+                         ['1-0', '1-1', '1-2'])
+        for name in ('scrape_book_attributes_from_page',
+                     'scrape_book_reviews', 'save_book', 'queue_book_image'):
+            children = [span for span in spans if span['name'] == name]
+            self.assertEqual(len(children), 3)
+            self.assertTrue(all(span['parent_id'] in books
+                                for span in children))
+
+    def test_chrome_format(self):
+        tracer = Tracer(self.path, trace_format='chrome')
+        with tracer.span('book', url='url'):
+            with tracer.span('save_book'):
+                pass
+        tracer.close()
+        with open(self.path) as f:
+            events = [event for event in json.load(f) if event]
+        self.assertEqual([event['name'] for event in events],
+                         ['save_book', 'book'])
+        self.assertEqual(events[1]['args'], {'url': 'url'})
+        self.assertEqual(events[1]['ph'], 'X')
+
+    def test_profile_first_books(self):
+        profiler = BookProfiler(self.path, num_books=2)
+        make_scraper(profiler=profiler).scrape_books(
+            num_books=4, num_reviews=2)
+        stats = pstats.Stats(self.path)
+        functions = [function for _, _, function in stats.stats]
+        self.assertIn('_scrape_and_save_book', functions)